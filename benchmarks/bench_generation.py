@@ -0,0 +1,282 @@
+"""
+Offline benchmarks of the generation pipeline on synthetic C-PAC-shaped configs:
+cloning, the `multi_*` helpers against compiled config paths (`gen192.paths`),
+`generate_pipeline_from_combi`, YAML dumping and loading, memoized validation and zipping.
+Reports the best wall time and the peak memory (traced separately) of each stage, and
+writes them as JSON to compare runs.
+
+C-PAC is not needed: validation is timed with C-PAC's check replaced by a no-op,
+so it measures the memoization (hashing) overhead only.
+
+Run with: python benchmarks/bench_generation.py [--size N] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import copy
+import json
+import pathlib as pl
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from gen192 import cli, utils, validation
+from gen192.archive import StreamingZipWriter
+from gen192.overlay import ConfigOverlay
+from gen192.paths import ConfigPath
+from gen192.rules import DEFAULT_RULE_TABLE
+from gen192.serialization import get_serializer
+from gen192.snippets import SnippetIndex
+
+BENCHMARK_RESULTS_VERSION = 1
+"""Version of the results format (results of different versions are not compared)"""
+
+MERGE_PATHS = [merge_path for step in cli.PIPELINE_STEPS for merge_path in step.merge_paths]
+COMPILED_MERGE_PATHS = [ConfigPath(merge_path) for merge_path in MERGE_PATHS]
+
+
+def synthetic_config(name: str, variant: int, size: int) -> dict:
+    """
+    C-PAC-shaped config with all paths touched by generation (differing between variants)
+    and `size` filler sections of about 50 values each (C-PAC configs have about 2000 values)
+    """
+    config: dict = {
+        "pipeline_setup": {"pipeline_name": name, "output_directory": {"path": "/outputs"}},
+        "surface_analysis": {"freesurfer": {"run_reconall": True}},
+        "timeseries_extraction": {"run": False, "connectivity_matrix": {"using": ["Nilearn"]}},
+    }
+    for _, path, _ in cli._GENERATED_PIPELINE_SETTINGS.operations:
+        utils.multi_set(config, index=list(path.keys), value=True)
+    for index, merge_path in enumerate(MERGE_PATHS):
+        utils.multi_set(
+            config,
+            index=merge_path,
+            value={
+                "run": True,
+                "using": [f"tool{(variant + index) % 3}"],
+                "options": {f"option{option}": option * variant for option in range(10)},
+            },
+        )
+    for section in range(size):
+        config[f"section{section}"] = {
+            f"group{group}": {
+                "run": bool(group % 2),
+                "using": [f"method{group}", "other"],
+                "threshold": 0.5 * group,
+                "template": f"/templates/{section}/{group}.nii.gz",
+                "options": {f"option{option}": option for option in range(6)},
+            }
+            for group in range(5)
+        }
+    return config
+
+
+def synthetic_configs(size: int) -> cli.ConfigLookupTable:
+    return {
+        name: cli.PipelineConfig(name=name, file=pl.Path(f"{name}.yml"), config=synthetic_config(name, variant, size))
+        for variant, name in enumerate(cli.PIPELINE_NAMES)
+    }
+
+
+@dataclass
+class BenchmarkResult:
+    """Timing and memory of a benchmark"""
+
+    seconds: float
+    """Best wall time of a run"""
+    calls: int
+    """Calls per run (e.g. one per pipeline)"""
+    peak_memory_bytes: int
+    """Peak memory allocated during a run"""
+
+
+@dataclass
+class Benchmark:
+    """A stage to benchmark: `setup` prepares the inputs of each run, `run` is timed"""
+
+    setup: Callable[[], Any]
+    run: Callable[[Any], object]
+    calls: int
+
+
+def measure(benchmark: Benchmark, repeat: int) -> BenchmarkResult:
+    best = float("inf")
+    for _ in range(repeat):
+        inputs = benchmark.setup()
+        start = time.perf_counter()
+        benchmark.run(inputs)
+        best = min(best, time.perf_counter() - start)
+
+    # Memory is traced in a separate run, tracing slows down the timed runs
+    inputs = benchmark.setup()
+    tracemalloc.start()
+    try:
+        benchmark.run(inputs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return BenchmarkResult(seconds=best, calls=benchmark.calls, peak_memory_bytes=peak)
+
+
+def benchmarks(size: int, directory: pl.Path) -> dict[str, Benchmark]:
+    """The benchmarks on configs of the given size (`directory` is for the written files)"""
+    configs = synthetic_configs(size)
+    combis = list(cli.iter_pipeline_combis_no_duplicates())
+    snippets = SnippetIndex(configs, cli.PIPELINE_STEPS)
+    serializer = get_serializer("yaml")
+    generated = [cli.generate_pipeline_from_combi(num, combi, configs, snippets) for num, combi in enumerate(combis)]
+    rendered = [pipeline.render(serializer) for pipeline in generated]
+    source = next(iter(configs.values()))
+
+    def clone(_: None) -> None:
+        for _combi in combis:
+            source.clone()
+
+    def multi_helpers(config: dict) -> None:
+        for merge_path in MERGE_PATHS:
+            value = utils.multi_get(config, index=merge_path)
+            utils.multi_set(config, index=merge_path + ["copy"], value=value)
+            utils.multi_del(config, index=merge_path + ["copy"])
+
+    def derived_configs() -> list[ConfigOverlay]:
+        return [ConfigOverlay(source.config) for _combi in combis]
+
+    def settings_multi_helpers(configs: list[ConfigOverlay]) -> None:
+        for config in configs:
+            for is_set, path, value in cli._GENERATED_PIPELINE_SETTINGS.operations:
+                if is_set:
+                    utils.multi_set(config, index=list(path.keys), value=value)
+                else:
+                    utils.multi_del(config, index=list(path.keys))
+
+    def settings_patch(configs: list[ConfigOverlay]) -> None:
+        for config in configs:
+            cli._GENERATED_PIPELINE_SETTINGS.apply(config)
+
+    def merge_paths_multi_get(configs: list[ConfigOverlay]) -> None:
+        for config in configs:
+            for merge_path in MERGE_PATHS:
+                utils.multi_get(config, index=merge_path)
+
+    def merge_paths_compiled(configs: list[ConfigOverlay]) -> None:
+        for config in configs:
+            for path in COMPILED_MERGE_PATHS:
+                path.get(config)
+
+    def generate(_: None) -> None:
+        for num, combi in enumerate(combis):
+            pipeline = cli.generate_pipeline_from_combi(num, combi, configs, snippets)
+            DEFAULT_RULE_TABLE.apply(pipeline.config, combi)
+
+    def dump_yaml(_: None) -> None:
+        for pipeline in generated:
+            serializer.dumps(pipeline.config)
+
+    def load_yaml(_: None) -> None:
+        for pipeline in rendered:
+            serializer.loads(pipeline.content)
+
+    def validate(validator: validation.ConfigValidator) -> None:
+        for pipeline in generated:
+            validator.validate(pipeline.config)
+
+    def zip_pipelines(directory: pl.Path) -> None:
+        with StreamingZipWriter(directory / "gen192_nofork.zip", reproducible=True) as archive:
+            for num, (combi, pipeline) in enumerate(zip(combis, rendered)):
+                archive.write(combi.filename(num), pipeline.content)
+
+    return {
+        "clone": Benchmark(lambda: None, clone, len(combis)),
+        "multi_helpers": Benchmark(lambda: copy.deepcopy(source.config), multi_helpers, len(MERGE_PATHS)),
+        "settings_multi_helpers": Benchmark(derived_configs, settings_multi_helpers, len(combis)),
+        "settings_patch": Benchmark(derived_configs, settings_patch, len(combis)),
+        "merge_paths_multi_get": Benchmark(derived_configs, merge_paths_multi_get, len(combis)),
+        "merge_paths_compiled": Benchmark(derived_configs, merge_paths_compiled, len(combis)),
+        "generate_pipeline_from_combi": Benchmark(lambda: None, generate, len(combis)),
+        "yaml_dump": Benchmark(lambda: None, dump_yaml, len(generated)),
+        "yaml_load": Benchmark(lambda: None, load_yaml, len(rendered)),
+        "validation": Benchmark(validation.ConfigValidator, validate, len(generated)),
+        "zip": Benchmark(lambda: directory, zip_pipelines, len(rendered)),
+    }
+
+
+def run_benchmarks(size: int, repeat: int, only: list[str] | None = None) -> dict:
+    """Runs the benchmarks and returns their results (in the JSON results format)"""
+    check_cpac_config = validation.check_cpac_config
+    validation.check_cpac_config = lambda config: (True, None)  # type: ignore[assignment]
+    try:
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for name, benchmark in benchmarks(size, pl.Path(directory)).items():
+                if only and name not in only:
+                    continue
+                results[name] = asdict(measure(benchmark, repeat))
+    finally:
+        validation.check_cpac_config = check_cpac_config  # type: ignore[assignment]
+    return {
+        "version": BENCHMARK_RESULTS_VERSION,
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "repeat": repeat,
+        "settings": {"size": size},
+        "results": results,
+    }
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list[str]:
+    """
+    Prints the results next to a baseline and returns the benchmarks that are slower
+    than the baseline by more than `threshold` (e.g. 1.2 for 20%)
+    """
+    if baseline.get("version") != results["version"] or baseline.get("settings") != results["settings"]:
+        print(f"Baseline has different settings ({baseline.get('settings')}), not comparing")
+        return []
+    regressions = []
+    print(f"{'benchmark':<30}{'baseline':>12}{'current':>12}{'ratio':>8}{'peak memory':>14}")
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        memory_ratio = result["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1)
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{name:<30}{old['seconds']:>11.4f}s{result['seconds']:>11.4f}s{ratio:>8.2f}{memory_ratio:>13.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline on synthetic configs")
+    parser.add_argument("--size", type=int, default=40, help="Filler sections per config (default: 40)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark, the best is kept")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Only run these benchmarks")
+    parser.add_argument("--output", type=pl.Path, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=pl.Path, metavar="BASELINE", help="Compare with a previous results file")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="Slowdown ratio reported as regression (default: 1.2)"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.size, args.repeat, args.only)
+    print(f"{'benchmark':<30}{'total':>12}{'per call':>14}{'peak memory':>14}")
+    for name, result in results["results"].items():
+        per_call = result["seconds"] / result["calls"] * 1e6
+        peak = result["peak_memory_bytes"] / 2**20
+        print(f"{name:<30}{result['seconds']:>11.4f}s{per_call:>12.1f}us{peak:>11.1f}MiB")
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.compare is not None:
+        regressions = compare(json.loads(args.compare.read_text()), results, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Zip archives written while the files in them are generated."""
+
+import os
+import pathlib as pl
+import time
+from types import TracebackType
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import zipfile
+
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+"""Timestamp of all entries of reproducible archives (the earliest date zip supports)"""
+
+
+class StreamingZipWriter:
+    """
+    Writes files into a zip archive as they are produced, instead of zipping a folder
+    after all files were written. The archive is written to a temporary file and only
+    moved into place once it is complete.
+    With `reproducible`, all entries get fixed timestamps and permissions, so the same
+    files written in the same order always result in the same archive bytes.
+    """
+
+    def __init__(self, file: pl.Path, compresslevel: int | None = None, reproducible: bool = False) -> None:
+        self.file = file
+        self.reproducible = reproducible
+        self._partial_file = file.with_name(f".{file.name}.partial")
+        file.parent.mkdir(parents=True, exist_ok=True)
+        import zipfile
+
+        self._zip = zipfile.ZipFile(
+            self._partial_file, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel
+        )
+
+    def _zip_info(self, arcname: str, mtime: float | None = None) -> "zipfile.ZipInfo":
+        import zipfile
+
+        if self.reproducible:
+            date_time = REPRODUCIBLE_DATE_TIME
+        else:
+            date_time = time.localtime(mtime if mtime is not None else time.time())[:6]
+        info = zipfile.ZipInfo(arcname, date_time=date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.create_system = 3  # Unix, so the permissions below apply
+        info.external_attr = 0o644 << 16
+        return info
+
+    def write(self, arcname: str, content: str | bytes) -> None:
+        """Adds a file with the given content to the archive"""
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        self._zip.writestr(self._zip_info(arcname), data, compresslevel=self._zip.compresslevel)
+
+    def write_file(self, path: pl.Path, arcname: str | None = None) -> None:
+        """Adds an existing file to the archive"""
+        info = self._zip_info(arcname or path.name, mtime=path.stat().st_mtime)
+        self._zip.writestr(info, path.read_bytes(), compresslevel=self._zip.compresslevel)
+
+    def close(self) -> None:
+        """Finishes the archive and moves it into place"""
+        self._zip.close()
+        os.replace(self._partial_file, self.file)
+
+    def abort(self) -> None:
+        """Discards the partially written archive"""
+        self._zip.close()
+        self._partial_file.unlink(missing_ok=True)
+
+    def __enter__(self) -> "StreamingZipWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,100 @@
+"""Build manifest recording the inputs each output file was generated from."""
+
+import hashlib
+import json
+import pathlib as pl
+from dataclasses import asdict, dataclass
+
+BUILD_MANIFEST_VERSION = 1
+"""Version of the build manifest format"""
+
+
+def _file_sha256(file: pl.Path) -> str | None:
+    try:
+        return hashlib.sha256(file.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _notes_file(file: pl.Path) -> pl.Path:
+    return file.with_suffix(".notes.txt")
+
+
+@dataclass
+class BuildRecord:
+    """Manifest entry of an output file"""
+
+    input_hash: str
+    """Hash of everything the output was generated from"""
+    sha256: str
+    """Hash of the output file as it was written"""
+    notes_sha256: str | None = None
+    """Hash of the notes file written along with the output (if any)"""
+
+
+class BuildManifest:
+    """
+    Tracks the output files of a build directory and the hash of the inputs they
+    were generated from, so that unchanged outputs can be skipped on the next run.
+    """
+
+    def __init__(self, build_dir: pl.Path, file_name: str = ".gen192_manifest.json") -> None:
+        self.build_dir = build_dir
+        self.file = build_dir / file_name
+        self.records: dict[str, BuildRecord] = self._read()
+
+    def _read(self) -> dict[str, BuildRecord]:
+        try:
+            with open(self.file, "r", encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != BUILD_MANIFEST_VERSION:
+            return {}
+        return {key: BuildRecord(**record) for key, record in manifest["outputs"].items()}
+
+    def save(self) -> None:
+        manifest = {
+            "version": BUILD_MANIFEST_VERSION,
+            "outputs": {key: asdict(record) for key, record in sorted(self.records.items())},
+        }
+        with open(self.file, "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle, indent=2)
+
+    def _key(self, file: pl.Path) -> str:
+        return file.relative_to(self.build_dir).as_posix()
+
+    def is_current(self, file: pl.Path, input_hash: str, content: str | None = None) -> bool:
+        """
+        Whether the file was generated from the same inputs and is unchanged since
+        (and, if given, was written with this content)
+        """
+        record = self.records.get(self._key(file))
+        if record is None or record.input_hash != input_hash:
+            return False
+        if content is not None and hashlib.sha256(content.encode()).hexdigest() != record.sha256:
+            return False
+        return _file_sha256(file) == record.sha256 and _file_sha256(_notes_file(file)) == record.notes_sha256
+
+    def record(self, file: pl.Path, input_hash: str, content: str, notes: str | None = None) -> None:
+        """Records an output file written with the given content and notes"""
+        self.records[self._key(file)] = BuildRecord(
+            input_hash=input_hash,
+            sha256=hashlib.sha256(content.encode()).hexdigest(),
+            notes_sha256=hashlib.sha256(notes.encode()).hexdigest() if notes is not None else None,
+        )
+
+    def prune(self, directory: pl.Path, keep: set[pl.Path]) -> list[pl.Path]:
+        """
+        Deletes outputs recorded in a directory that are not in `keep` (e.g. after the
+        combination grid changed) and returns the deleted files.
+        """
+        removed = []
+        for key in list(self.records):
+            file = self.build_dir / key
+            if file.parent == directory and file not in keep:
+                for path in (file, _notes_file(file)):
+                    path.unlink(missing_ok=True)
+                del self.records[key]
+                removed.append(file)
+        return removed
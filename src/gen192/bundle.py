@@ -0,0 +1,245 @@
+"""Compact single-file bundles of generated pipelines: source configs stored once plus a delta per pipeline."""
+
+import json
+import os
+import pathlib as pl
+import struct
+import zlib
+from collections.abc import Iterator, Mapping
+from dataclasses import asdict, dataclass
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, BinaryIO
+
+from .overlay import ConfigOverlay, materialize
+from .paths import ConfigPatch
+from .structdiff import MISSING, diff
+
+if TYPE_CHECKING:
+    from .cli import PipelineConfig
+
+BUNDLE_MAGIC = b"GEN192B1"
+"""First bytes of a bundle file (the last byte is the format version)"""
+
+BUNDLE_SUFFIX = ".bundle"
+
+_HEADER = struct.Struct("<8sQQ")
+"""Magic, offset and length of the index"""
+
+
+@dataclass
+class BundleEntry:
+    """Index entry of a pipeline in a bundle"""
+
+    pipeline_num: int
+    name: str
+    file_name: str
+    """File name the pipeline is written to when generated as a file"""
+    base: str
+    """Name of the source config the delta applies to"""
+    offset: int
+    length: int
+    """Position of the compressed delta (and notes) in the bundle"""
+    alias_of: int | None = None
+    """Pipeline number of the identical pipeline (apart from its name) whose delta is shared"""
+
+
+def _encode(obj: Any, compresslevel: int) -> bytes:  # noqa: ANN401
+    return zlib.compress(json.dumps(obj, separators=(",", ":")).encode("utf-8"), compresslevel)
+
+
+def _decode(data: bytes) -> Any:  # noqa: ANN401
+    return json.loads(zlib.decompress(data))
+
+
+def _patch(operations: list) -> ConfigPatch:
+    """Patch of the operations of a stored delta (`["set", path, value]` or `["delete", path]`)"""
+    patch = ConfigPatch()
+    for operation in operations:
+        if operation[0] == "set":
+            patch.set(operation[1], operation[2])
+        else:
+            patch.delete(operation[1])
+    return patch
+
+
+class BundleWriter:
+    """
+    Writes pipelines into a bundle: the source configs they are generated from are stored once,
+    each pipeline as the paths it sets or deletes in its source config (`generate_pipeline_from_combi`
+    and the special-case rules), along with its notes. Each part is compressed separately and found
+    through an index at the end of the file, so a pipeline is read without reading the others.
+
+    Configs are stored as JSON (like the json output format), so mapping keys below a changed path
+    are stored as strings. The bundle is written to a temporary file and only moved into place once
+    it is complete.
+    """
+
+    def __init__(
+        self, file: pl.Path, bases: Mapping[str, "PipelineConfig"], compresslevel: int = zlib.Z_DEFAULT_COMPRESSION
+    ) -> None:
+        self.file = file
+        self.compresslevel = compresslevel
+        self._bases = bases
+        self._partial_file = file.with_name(f".{file.name}.partial")
+        file.parent.mkdir(parents=True, exist_ok=True)
+        self._handle: BinaryIO = open(self._partial_file, "wb")
+        self._handle.write(_HEADER.pack(BUNDLE_MAGIC, 0, 0))
+        self._base_blocks = {name: self._write_block(materialize(base.config)) for name, base in bases.items()}
+        self.entries: dict[int, BundleEntry] = {}
+        """Index entries of the pipelines added so far by pipeline number"""
+
+    def _write_block(self, obj: Any) -> tuple[int, int]:  # noqa: ANN401
+        data = _encode(obj, self.compresslevel)
+        offset = self._handle.tell()
+        self._handle.write(data)
+        return offset, len(data)
+
+    def add(self, pipeline_num: int, pipeline: "PipelineConfig", base: str) -> BundleEntry:
+        """Adds a pipeline generated from the source config `base` (by its config name)"""
+        operations = [
+            ["delete", list(change.path)]
+            if change.new is MISSING
+            else ["set", list(change.path), materialize(change.new)]
+            for change in diff(self._bases[base].subtree_hashes(), pipeline.config)
+        ]
+        offset, length = self._write_block({"delta": operations, "notes": pipeline.notes})
+        entry = self.entries[pipeline_num] = BundleEntry(
+            pipeline_num=pipeline_num,
+            name=pipeline.name,
+            file_name=pipeline.file.name,
+            base=base,
+            offset=offset,
+            length=length,
+        )
+        return entry
+
+    def add_alias(self, pipeline_num: int, name: str, file_name: str, alias_of: int) -> BundleEntry:
+        """Adds a pipeline identical to an added pipeline apart from its name (sharing its delta)"""
+        canonical = self.entries[alias_of]
+        entry = self.entries[pipeline_num] = BundleEntry(
+            pipeline_num=pipeline_num,
+            name=name,
+            file_name=file_name,
+            base=canonical.base,
+            offset=canonical.offset,
+            length=canonical.length,
+            alias_of=alias_of,
+        )
+        return entry
+
+    def close(self) -> None:
+        """Writes the index and moves the bundle into place"""
+        index = {
+            "bases": {name: list(block) for name, block in self._base_blocks.items()},
+            "pipelines": [asdict(self.entries[pipeline_num]) for pipeline_num in sorted(self.entries)],
+        }
+        offset, length = self._write_block(index)
+        self._handle.seek(0)
+        self._handle.write(_HEADER.pack(BUNDLE_MAGIC, offset, length))
+        self._handle.close()
+        os.replace(self._partial_file, self.file)
+
+    def abort(self) -> None:
+        """Discards the partially written bundle"""
+        self._handle.close()
+        self._partial_file.unlink(missing_ok=True)
+
+    def __enter__(self) -> "BundleWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class PipelineBundle:
+    """
+    Reads pipelines from a bundle (see `BundleWriter`) by pipeline number:
+
+        with PipelineBundle(pl.Path("dist/gen192_nofork.bundle")) as bundle:
+            pipeline = bundle[42]
+
+    Only the index is read when opening the bundle. A pipeline is materialized from its delta on
+    a copy-on-write view (see `ConfigOverlay`) of its source config, which is read once and then
+    shared by all pipelines generated from it.
+    """
+
+    def __init__(self, file: pl.Path) -> None:
+        self.file = file
+        self._handle: BinaryIO = open(file, "rb")
+        header = self._handle.read(_HEADER.size)
+        if len(header) < _HEADER.size or not header.startswith(BUNDLE_MAGIC):
+            self._handle.close()
+            raise ValueError(f"{file} is not a pipeline bundle")
+        _, offset, length = _HEADER.unpack(header)
+        index = _decode(self._read(offset, length))
+        self._base_blocks: dict[str, tuple[int, int]] = {name: tuple(block) for name, block in index["bases"].items()}
+        self.entries: dict[int, BundleEntry] = {
+            entry["pipeline_num"]: BundleEntry(**entry) for entry in index["pipelines"]
+        }
+        """Index entries of the pipelines by pipeline number"""
+        self._bases: dict[str, dict] = {}
+
+    def _read(self, offset: int, length: int) -> bytes:
+        self._handle.seek(offset)
+        return self._handle.read(length)
+
+    def base(self, name: str) -> dict:
+        """Returns a source config by its config name (read once, must not be modified)"""
+        if name not in self._bases:
+            self._bases[name] = _decode(self._read(*self._base_blocks[name]))
+        return self._bases[name]
+
+    def _block(self, entry: BundleEntry) -> dict:
+        return _decode(self._read(entry.offset, entry.length))
+
+    def delta(self, pipeline_num: int) -> ConfigPatch:
+        """Returns the changes of a pipeline to its source config"""
+        return _patch(self._block(self.entries[pipeline_num])["delta"])
+
+    def notes(self, pipeline_num: int) -> str | None:
+        entry = self.entries[pipeline_num]
+        return self._block(entry)["notes"] if entry.alias_of is None else None
+
+    def __getitem__(self, pipeline_num: int) -> "PipelineConfig":
+        """
+        Materializes a pipeline. Its config shares untouched subtrees with the source config,
+        clone it (`PipelineConfig.clone`) before modifying it.
+        """
+        from .cli import PipelineConfig
+
+        entry = self.entries[pipeline_num]
+        block = self._block(entry)
+        config = ConfigOverlay(self.base(entry.base))
+        _patch(block["delta"]).apply(config)
+        pipeline = PipelineConfig(name=entry.name, file=pl.Path(entry.file_name), config=config)
+        if entry.alias_of is None:
+            pipeline.notes = block["notes"]
+        else:
+            pipeline.set_name(entry.name)
+        return pipeline
+
+    def __contains__(self, pipeline_num: object) -> bool:
+        return pipeline_num in self.entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self) -> "PipelineBundle":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
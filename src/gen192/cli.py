@@ -1,24 +1,44 @@
 import argparse
+import contextlib
 import copy
+import dataclasses
+import io
 import json
+import os
 import pathlib as pl
-import shutil
-from dataclasses import dataclass
-from typing import Any, Dict, Generator, List
-
-import yaml
-
-from .config import CPAC_SHA
-from .cpac_config_extractor import check_cpac_config, fetch_and_expand_cpac_configs
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, Iterable, List, Tuple
+
+from .archive import StreamingZipWriter
+from .build_manifest import BuildManifest
+from .bundle import BUNDLE_SUFFIX, BundleWriter
+from .combinations import Axis, CombinationSpace
+from .config import CPAC_REPO_URL, CPAC_SHA, CPAC_SPARSE_PATHS
+from .cpac_config_extractor import (
+    CpacFetchOptions,
+    ensure_cpac_repo,
+    expand_cpac_configs,
+    read_expanded_cpac_configs,
+)
+from .overlay import ConfigOverlay
+from .paths import ConfigPatch, ConfigPath
+from .plan import GenerationPlan, alias_canonicals, plan_generation
+from .profiling import Profiler, StageStats
+from .rules import DEFAULT_RULE_TABLE, RuleTable, load_rule_table
+from .serialization import SERIALIZERS, Serializer, get_serializer, serializer_for_file
+from .shards import ShardManifest, check_shards_complete, parse_shard, shard_build_dir
+from .snippets import SnippetIndex
+from .structdiff import Change, SubtreeHashes, diff, format_changes
 from .utils import (
     aslist,
     b64_urlsafe_hash,
+    canonical_hash,
+    extend_sys_path,
     filesafe,
-    multi_del,
-    multi_get,
-    multi_set,
     print_warning,
 )
+from .validation import ConfigValidator, ValidationStats
 
 PIPELINE_NAMES = {
     "ABCD": "abcd-options",
@@ -84,17 +104,68 @@ PIPELINE_STEPS: List[PipelineStep] = [
 """Pipeline steps and their paths in the C-PAC config to include in the generation."""
 
 
+@dataclass
+class RenderedPipeline:
+    """Represents a pipeline configuration serialized to text, ready to be written"""
+
+    file: pl.Path
+    content: str
+    notes: str | None = None
+
+    def write(self, exist_ok: bool = False) -> None:
+        if self.file.exists() and not exist_ok:
+            raise FileExistsError(f"File {self.file} already exists")
+        with open(self.file, "w") as handle:
+            handle.write(self.content)
+        notes_file = self.file.with_suffix(".notes.txt")
+        if self.notes is not None:
+            with open(notes_file, "w") as handle:
+                handle.write(self.notes)
+        elif notes_file.exists():
+            # Left over from a previous version of the pipeline
+            notes_file.unlink()
+
+
 @dataclass
 class PipelineConfig:
     """Represents a C-PAC pipeline configuration"""
 
     name: str
     file: pl.Path
-    config: dict
+    config: dict | ConfigOverlay
     notes: str | None = None
+    _subtree_hashes: SubtreeHashes | None = field(default=None, init=False, repr=False, compare=False)
 
     def clone(self) -> "PipelineConfig":
-        return PipelineConfig(name=self.name, file=self.file, config=copy.deepcopy(self.config))
+        config = self.config.to_dict() if isinstance(self.config, ConfigOverlay) else copy.deepcopy(self.config)
+        return PipelineConfig(name=self.name, file=self.file, config=config)
+
+    def derive(self) -> "PipelineConfig":
+        """
+        Returns a copy-on-write copy of the pipeline. Untouched subtrees are shared with
+        this pipeline, which must not be modified while the derived pipeline is in use.
+        """
+        return PipelineConfig(name=self.name, file=self.file, config=ConfigOverlay(self.config))
+
+    def __setattr__(self, name: str, value: Any) -> None:  # noqa: ANN401
+        if name == "config" and self.__dict__.get("_subtree_hashes") is not None:
+            # Hashes of the previous config
+            self._subtree_hashes = None
+        object.__setattr__(self, name, value)
+
+    def subtree_hashes(self) -> SubtreeHashes:
+        """
+        Canonical hashes of the subtrees of the config, cached on first use.
+        Only for configs that are not modified afterwards (like source configs): the cache is
+        reset when `config` is replaced, call `reset_subtree_hashes` after modifying it in place.
+        """
+        if self._subtree_hashes is None:
+            self._subtree_hashes = SubtreeHashes(self.config)
+        return self._subtree_hashes
+
+    def reset_subtree_hashes(self) -> None:
+        """Forgets the cached subtree hashes (e.g. after the config was modified in place)"""
+        self._subtree_hashes = None
 
     def set_name(self, name: str) -> None:
         self.name = name
@@ -103,14 +174,14 @@ class PipelineConfig:
     def _file_exists(self) -> bool:
         return self.file.exists()
 
+    def render(self, serializer: Serializer | None = None) -> RenderedPipeline:
+        serializer = serializer or serializer_for_file(self.file)
+        return RenderedPipeline(file=self.file, content=serializer.dumps(self.config), notes=self.notes)
+
     def dump(self, exist_ok: bool = False) -> None:
         if self._file_exists() and not exist_ok:
             raise FileExistsError(f"File {self.file} already exists")
-        with open(self.file, "w") as handle:
-            yaml.dump(self.config, handle)
-        if self.notes is not None:
-            with open(self.file.with_suffix(".notes.txt"), "w") as handle:
-                handle.write(self.notes)
+        self.render().write(exist_ok=True)
 
 
 @dataclass
@@ -120,52 +191,75 @@ class PipelineCombination:
     pipeline_id: str
     pipeline_perturb_id: str
     step: PipelineStep
-    # connectivity_method: str
-    # use_nuisance_correction: bool
+    connectivity_method: str | None = None
+    """Connectivity method to set (None keeps the one of the base pipeline)"""
+    use_nuisance_correction: bool | None = None
+    """Whether to run nuisance regression (None keeps the setting of the base pipeline)"""
 
     def name(self, pipeline_num: int) -> str:
-        return (
+        name = (
             f"p{pipeline_num:03d}_"
             f"base-{filesafe(self.pipeline_id)}_"
             f"perturb-{filesafe(self.pipeline_perturb_id)}_"
             f"step-{filesafe(self.step.name)}_"
-            # f"conn-{filesafe(self.connectivity_method)}_"
-            # f"nuisance-{filesafe(str(self.use_nuisance_correction))}"
         )
+        if self.connectivity_method is not None:
+            name += f"conn-{filesafe(self.connectivity_method)}_"
+        if self.use_nuisance_correction is not None:
+            name += f"nuisance-{filesafe(str(self.use_nuisance_correction))}"
+        return name
 
-    def filename(self, pipeline_num: int) -> str:
-        return self.name(pipeline_num) + ".yml"
+    def filename(self, pipeline_num: int, suffix: str = ".yml") -> str:
+        return self.name(pipeline_num) + suffix
+
+
+def _is_not_duplicate(combi: PipelineCombination) -> bool:
+    """Whether a combination perturbs a pipeline with another pipeline (rather than with itself)"""
+    return combi.pipeline_id != combi.pipeline_perturb_id
+
+
+def pipeline_combination_space(
+    connectivity: bool = False, nuisance: bool = False, duplicates: bool = False
+) -> CombinationSpace[PipelineCombination]:
+    """
+    Returns the space of pipeline combinations to generate.
+    `connectivity` and `nuisance` add the `CONNECTIVITY_METHODS` and `NUISANCE_METHODS` axes,
+    `duplicates` keeps combinations perturbing a pipeline with itself.
+    """
+    axes = [
+        Axis("pipeline_id", list(PIPELINE_NAMES.keys())),
+        Axis("pipeline_perturb_id", list(PIPELINE_NAMES.keys())),
+        Axis("step", PIPELINE_STEPS),
+    ]
+    if connectivity:
+        axes.append(Axis("connectivity_method", CONNECTIVITY_METHODS))
+    if nuisance:
+        axes.append(Axis("use_nuisance_correction", NUISANCE_METHODS))
+    space = CombinationSpace(axes, PipelineCombination)
+    return space if duplicates else space.where(_is_not_duplicate)
 
 
 def iter_pipeline_combis() -> Generator[PipelineCombination, Any, None]:
     """
     Iterate over all possible parameter combinations.
     """
-    for pipeline_id in PIPELINE_NAMES.keys():
-        for pipeline_perturb_id in PIPELINE_NAMES.keys():
-            for step in PIPELINE_STEPS:
-                # for connectivity_method in CONNECTIVITY_METHODS:
-                # for nuisance_method in NUISANCE_METHODS:
-                yield PipelineCombination(
-                    pipeline_id=pipeline_id,
-                    pipeline_perturb_id=pipeline_perturb_id,
-                    step=step,
-                    # connectivity_method=connectivity_method,
-                    # use_nuisance_correction=nuisance_method,
-                )
+    yield from pipeline_combination_space(duplicates=True)
 
 
 def iter_pipeline_combis_no_duplicates() -> Generator[PipelineCombination, Any, None]:
     """Iterates over all pipeline combinations that are not duplicates"""
-    for combi in iter_pipeline_combis():
-        if combi.pipeline_id != combi.pipeline_perturb_id:
-            yield combi
+    yield from pipeline_combination_space()
 
 
 def load_pipeline_config(pipeline_config_file: pl.Path) -> PipelineConfig:
     """Loads a pipeline config from a file and returns the pipeline name and config"""
     with open(pipeline_config_file, "r") as handle:
-        pipeline_config = yaml.safe_load(handle)
+        return parse_pipeline_config(handle.read(), pipeline_config_file)
+
+
+def parse_pipeline_config(content: str, pipeline_config_file: pl.Path) -> PipelineConfig:
+    """Parses a pipeline config (in the format of its file, which is not read)"""
+    pipeline_config = serializer_for_file(pipeline_config_file).loads(content)
     return PipelineConfig(
         name=pipeline_config["pipeline_setup"]["pipeline_name"],
         file=pipeline_config_file,
@@ -177,56 +271,96 @@ ConfigLookupTable = Dict[str, PipelineConfig]
 """A dictionary of pipeline name to config"""
 
 
+DERIVATIVE_RUN_PATHS: list[MergePath] = [
+    ["amplitude_low_frequency_fluctuation", "run"],
+    ["regional_homogeneity", "run"],
+    ["voxel_mirrored_homotopic_connectivity", "run"],
+    ["network_centrality", "run"],
+    ["longitudinal_template_generation", "run"],
+    ["post_processing", "spatial_smoothing", "run"],
+    ["post_processing", "z-scoring", "run"],
+    ["seed_based_correlation_analysis", "run"],
+    ["PyPEER", "run"],
+]
+"""Switches of all derivatives (except connectomes)"""
+
+_DEACTIVATE_DERIVATIVES = ConfigPatch().set_many(DERIVATIVE_RUN_PATHS, False)
+
+_COREGISTRATION_REFERENCE = ConfigPath(
+    ["registration_workflows", "functional_registration", "coregistration", "reference"]
+)
+
+_CONNECTIVITY_METHOD = ConfigPath(["timeseries_extraction", "connectivity_matrix", "using"])
+# Using regressors for calculations
+_NUISANCE_REGRESSION_RUN = ConfigPath(["nuisance_corrections", "2-nuisance_regression", "run"])
+# Generating regressors (opposed to ingressing them)
+_NUISANCE_CREATE_REGRESSORS = ConfigPath(["nuisance_corrections", "2-nuisance_regression", "create_regressors"])
+
+_GENERATED_PIPELINE_SETTINGS = (
+    ConfigPatch()
+    # Set connectivity method
+    .set(["timeseries_extraction", "run"], True)
+    .set(["timeseries_extraction", "connectivity_matrix", "measure"], aslist("Pearson"))
+    # Deactivate all other derivatives than connectomes
+    .extend(_DEACTIVATE_DERIVATIVES)
+    # Remove coregistration reference
+    # Was told by CPAC member to remove it
+    # This field will be removed from CPAC in the future
+    .delete(_COREGISTRATION_REFERENCE)
+    # Activate Freesurfer ingress
+    .set(["surface_analysis", "freesurfer", "ingress_reconall"], True)
+    # Dont run Freesurfer recon_all
+    .set(["surface_analysis", "freesurfer", "run_reconall"], False)
+    # Dont run any connectivity stuff
+    .delete(["timeseries_extraction", "connectivity_matrix"])
+    # Hardcode freesurfer ingress dir
+    .set(
+        ["pipeline_setup", "freesurfer_dir"],
+        "/ocean/projects/med220004p/trogers1/many_pipelines/freesurfer/outputs/ABCD_all_subjects",
+    )
+)
+"""Settings of all generated pipelines, applied after merging the perturbation step"""
+
+
 def _config_deactivate_derivatives(pipeline: PipelineConfig) -> None:
     """Deactivate all derivatives in a pipeline (except connectomes)"""
-    run_paths: list[MergePath] = [
-        ["amplitude_low_frequency_fluctuation", "run"],
-        ["regional_homogeneity", "run"],
-        ["voxel_mirrored_homotopic_connectivity", "run"],
-        ["network_centrality", "run"],
-        ["longitudinal_template_generation", "run"],
-        ["post_processing", "spatial_smoothing", "run"],
-        ["post_processing", "z-scoring", "run"],
-        ["seed_based_correlation_analysis", "run"],
-        ["PyPEER", "run"],
-    ]
-
-    for run_path in run_paths:
-        multi_set(pipeline.config, index=run_path, value=False)
+    _DEACTIVATE_DERIVATIVES.apply(pipeline.config)
 
 
 def _config_remove_coregistration_reference(pipeline: PipelineConfig) -> None:
     """Remove coregistration reference entry from a pipeline config"""
-    multi_del(
-        pipeline.config, index=["registration_workflows", "functional_registration", "coregistration", "reference"]
-    )
+    _COREGISTRATION_REFERENCE.delete(pipeline.config)
 
 
 def generate_pipeline_from_combi(
-    pipeline_num: int, combi: PipelineCombination, configs: ConfigLookupTable
+    pipeline_num: int, combi: PipelineCombination, configs: ConfigLookupTable, snippets: SnippetIndex | None = None
 ) -> PipelineConfig:
-    # Copy pipeline
-    pipeline = configs[combi.pipeline_id].clone()
-    pipeline_perturb = configs[combi.pipeline_perturb_id].clone()
+    # Copy pipeline (copy-on-write, the perturbation pipeline is only read from)
+    pipeline = configs[combi.pipeline_id].derive()
+    pipeline_perturb = configs[combi.pipeline_perturb_id]
+    snippets = snippets if snippets is not None else SnippetIndex(configs, [combi.step])
 
     # Merge perturbation step
     merge_paths_identical = []
+    changes: list[Change] = []
     for merge_path in combi.step.merge_paths:
-        snippet = multi_get(pipeline_perturb.config, index=merge_path)
-        snippet_target = multi_get(pipeline.config, index=merge_path)
+        path = ConfigPath(merge_path)
+        snippet = snippets.get(combi.pipeline_perturb_id, merge_path).value
 
         if snippet is None:
             warning = f"Can't find path {merge_path} in {pipeline_perturb.name}"
             pipeline.notes = pipeline.notes + "\n" + warning if pipeline.notes else warning
             print_warning(warning)
-            multi_del(pipeline.config, index=merge_path)
+            path.delete(pipeline.config)
             continue
 
-        snippet_json = json.dumps(snippet, sort_keys=True, indent=2)
-        snippet_target_json = json.dumps(snippet_target, sort_keys=True, indent=2)
-
-        merge_paths_identical.append(snippet_json == snippet_target_json)
-        multi_set(pipeline.config, index=merge_path, value=snippet)
+        # Compare the (cached) subtree hashes of the source configs (merge paths do not overlap)
+        merge_changes = diff(
+            configs[combi.pipeline_id].subtree_hashes(), pipeline_perturb.subtree_hashes(), path=merge_path
+        )
+        merge_paths_identical.append(not merge_changes)
+        changes.extend(merge_changes)
+        path.set(pipeline.config, snippet)
 
     if all(merge_paths_identical):
         warning = (
@@ -235,134 +369,483 @@ def generate_pipeline_from_combi(
         )
         pipeline.notes = pipeline.notes + "\n" + warning if pipeline.notes else warning
         print_warning(warning)
-
-    # Set connectivity method
-    multi_set(
-        pipeline.config,
-        index=["timeseries_extraction", "run"],
-        value=True,
-    )
-    # multi_set(
-    #    pipeline.config,
-    #    index=["timeseries_extraction", "connectivity_matrix", "using"],
-    #    value=aslist(combi.connectivity_method),
-    # )
-    multi_set(
-        pipeline.config,
-        index=["timeseries_extraction", "connectivity_matrix", "measure"],
-        value=aslist("Pearson"),
-    )
+    elif changes:
+        summary = (
+            f'"{combi.step.name}" perturbation ({combi.pipeline_perturb_id}) changes '
+            f"{len(changes)} value{'s' if len(changes) != 1 else ''} of the target ({combi.pipeline_id}):\n"
+            + format_changes(changes)
+        )
+        pipeline.notes = pipeline.notes + "\n" + summary if pipeline.notes else summary
 
     # Set nuisance method
-    # # Using regressors for calculations
-    # multi_set(
-    #     pipeline.config,
-    #     index=["nuisance_corrections", "2-nuisance_regression", "run"],
-    #     value=aslist(combi.use_nuisance_correction),
-    # )
-    # # Generating regressors (opposed to ingressing them)
-    # multi_set(
-    #     pipeline.config,
-    #     index=["nuisance_corrections", "2-nuisance_regression", "create_regressors"],
-    #     value=combi.use_nuisance_correction,
-    # )
+    if combi.use_nuisance_correction is not None:
+        _NUISANCE_REGRESSION_RUN.set(pipeline.config, aslist(combi.use_nuisance_correction))
+        _NUISANCE_CREATE_REGRESSORS.set(pipeline.config, combi.use_nuisance_correction)
 
-    # Deactivate all other derivatives than connectomes
-    _config_deactivate_derivatives(pipeline)
+    _GENERATED_PIPELINE_SETTINGS.apply(pipeline.config)
 
-    # Remove coregistration reference
-    # Was told by CPAC member to remove it
-    # This field will be removed from CPAC in the future
-    _config_remove_coregistration_reference(pipeline)
+    # After the settings, which remove the connectivity matrix settings of the base pipeline
+    if combi.connectivity_method is not None:
+        _CONNECTIVITY_METHOD.set(pipeline.config, aslist(combi.connectivity_method))
 
-    # Activate Freesurfer ingress
-    multi_set(
-        pipeline.config,
-        index=["surface_analysis", "freesurfer", "ingress_reconall"],
-        value=True,
-    )
+    # Set pipeline name
+    pipeline.set_name(combi.name(pipeline_num))
 
-    # Dont run Freesurfer recon_all
-    multi_set(
-        pipeline.config,
-        index=["surface_analysis", "freesurfer", "run_reconall"],
-        value=False,
-    )
+    return pipeline
 
-    # Dont run any connectivity stuff
-    multi_del(
-        pipeline.config,
-        index=["timeseries_extraction", "connectivity_matrix"],
+
+@dataclass
+class GenerationContext:
+    """Inputs shared by all pipelines of a generation run (sent once to each worker process)"""
+
+    configs: ConfigLookupTable
+    dir_gen: pl.Path
+    serializer: Serializer = field(default_factory=lambda: get_serializer("yaml"))
+    rules: RuleTable = field(default_factory=lambda: DEFAULT_RULE_TABLE)
+    profile: bool = False
+    """Whether to record the time spent in the stages of each pipeline"""
+    validate: bool = True
+    """Whether to let C-PAC validate the generated pipelines"""
+    snippets: SnippetIndex = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.snippets = SnippetIndex(self.configs)
+
+
+ALIAS_MAP_FILE = "aliases.json"
+"""File (next to the generated pipelines) mapping deduplicated pipelines to their canonical pipeline"""
+
+
+def pipeline_aliases(
+    space: CombinationSpace[PipelineCombination], snippets: SnippetIndex, rules: RuleTable, suffix: str = ".yml"
+) -> dict[str, str]:
+    """
+    Maps the file name of each pipeline that generates the same config as a previous
+    pipeline (apart from its name) to the file name of the first such pipeline.
+    """
+    combis = dict(space.numbered())
+    return {
+        combis[pipeline_num].filename(pipeline_num, suffix=suffix): canonical
+        for pipeline_num, canonical in alias_canonicals(space, snippets, rules, suffix=suffix).items()
+    }
+
+
+def _generate_combination(
+    pipeline_num: int,
+    combi: PipelineCombination,
+    context: GenerationContext,
+    validator: ConfigValidator,
+    profiler: Profiler | None = None,
+) -> PipelineConfig:
+    """Generates, patches and validates the pipeline for a single combination"""
+    profiler = profiler if profiler is not None else Profiler(enabled=False)
+    filename = combi.filename(pipeline_num, suffix=context.serializer.suffix)
+
+    print(f"> Generating {filename}")
+
+    with profiler.stage("generate", pipeline=filename):
+        combined = generate_pipeline_from_combi(pipeline_num, combi, context.configs, context.snippets)
+    with profiler.stage("rules", pipeline=filename):
+        fired = context.rules.apply(combined.config, combi)
+    if fired:
+        applied = f"Applied special-case rules: {', '.join(fired)}"
+        combined.notes = combined.notes + "\n" + applied if combined.notes else applied
+        print(f"> {applied}")
+    combined.file = context.dir_gen / filename
+
+    if not context.validate:
+        return combined
+
+    # Let CPAC check if it is a valid config (once for all combinations generating the same config)
+    with profiler.stage("validate", pipeline=filename):
+        ok, err = validator.validate(combined.config, key=context.snippets.equivalence_key(combi, context.rules))
+    if not ok:
+        warning = f'CPAC-reported config validation error: "{err}"'
+        combined.notes = combined.notes + "\n" + warning if combined.notes else warning
+        print_warning(warning)
+
+    return combined
+
+
+GenerationTask = Tuple[int, PipelineCombination]
+"""A pipeline number and the combination it is generated from"""
+
+_worker_context: GenerationContext | None = None
+_worker_validator = ConfigValidator()
+_worker_profiler = Profiler(enabled=False)
+
+
+def _init_generation_worker(context: GenerationContext, sys_path: List[str]) -> None:
+    """Initializes a generation worker process with the source configs (sent once per worker)"""
+    global _worker_context, _worker_validator, _worker_profiler
+    _worker_context = context
+    _worker_validator = ConfigValidator()
+    _worker_profiler = Profiler(enabled=context.profile)
+    # Make C-PAC importable for validation when the worker was spawned instead of forked
+    extend_sys_path(sys_path)
+
+
+def _generation_worker(
+    task: GenerationTask,
+) -> Tuple[RenderedPipeline, str, ValidationStats, dict[str, StageStats]]:
+    """
+    Generates a single pipeline in a worker process and returns it rendered,
+    along with its console output, validation cache statistics and stage times
+    """
+    assert _worker_context is not None
+    pipeline_num, combi = task
+    filename = combi.filename(pipeline_num, suffix=_worker_context.serializer.suffix)
+    stats_before = copy.copy(_worker_validator.stats)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        pipeline = _generate_combination(pipeline_num, combi, _worker_context, _worker_validator, _worker_profiler)
+    stats = ValidationStats(
+        hits=_worker_validator.stats.hits - stats_before.hits,
+        misses=_worker_validator.stats.misses - stats_before.misses,
+    )
+    with _worker_profiler.stage("dump", pipeline=filename):
+        rendered = pipeline.render(_worker_context.serializer)
+    return rendered, log.getvalue(), stats, _worker_profiler.pipelines.pop(filename, {})
+
+
+def iter_rendered_pipelines(
+    tasks: Iterable[GenerationTask],
+    context: GenerationContext,
+    jobs: int = 1,
+    validator: ConfigValidator | None = None,
+    profiler: Profiler | None = None,
+) -> Generator[RenderedPipeline, Any, None]:
+    """
+    Generates and renders the pipelines for all tasks, in task order.
+    With jobs > 1 the pipelines are generated in a process pool and the console
+    output of each pipeline is replayed in task order once it is done.
+    Worker processes memoize validations separately, their cache statistics
+    are added up in the validator. The stage times of each pipeline are added to
+    the profiler (if `context.profile`), as measured in the worker processes.
+    """
+    validator = validator if validator is not None else ConfigValidator()
+    profiler = profiler if profiler is not None else Profiler(enabled=False)
+
+    if jobs <= 1:
+        for pipeline_num, combi in tasks:
+            pipeline = _generate_combination(pipeline_num, combi, context, validator, profiler)
+            with profiler.stage("dump", pipeline=pipeline.file.name):
+                rendered = pipeline.render(context.serializer)
+            yield rendered
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_generation_worker,
+        initargs=(context, list(sys.path)),
+    ) as pool:
+        for rendered, log, stats, stages in pool.map(_generation_worker, tasks):
+            sys.stdout.write(log)
+            validator.stats.hits += stats.hits
+            validator.stats.misses += stats.misses
+            for name, stage_stats in stages.items():
+                profiler.add(name, stage_stats, pipeline=rendered.file.name)
+            yield rendered
+
+
+def generate(
+    configs: ConfigLookupTable,
+    space: CombinationSpace[PipelineCombination] | None = None,
+    rules: RuleTable = DEFAULT_RULE_TABLE,
+    validate: bool = False,
+    dedupe: bool = False,
+    output_format: str = "yaml",
+    directory: pl.Path = pl.Path(),
+    validator: ConfigValidator | None = None,
+) -> Generator[PipelineConfig, Any, None]:
+    """
+    Generates the pipelines of a combination space from source configs (e.g. parsed with
+    `parse_pipeline_config`), for use as a library: pipelines are generated lazily in
+    pipeline order, one at a time, and nothing is read from or written to disk.
+
+    The `file` of each pipeline is its output file name (for `output_format`) in `directory`.
+    Pipelines share untouched subtrees with the source configs (see `PipelineConfig.derive`),
+    clone them before modifying them. With `dedupe`, pipelines generating the same config as
+    a previous pipeline of the space are skipped (see `pipeline_aliases`). With `validate`,
+    C-PAC validation warnings are added to the notes of the pipelines; C-PAC must be importable
+    (see `ensure_cpac_repo`).
+
+    The source configs are hashed anew by each call (so changes made to them between calls
+    are picked up), they must not be modified while the pipelines of a call are generated.
+    """
+    for config in configs.values():
+        config.reset_subtree_hashes()
+    space = space if space is not None else pipeline_combination_space()
+    validator = validator if validator is not None else ConfigValidator()
+    context = GenerationContext(
+        configs=configs,
+        dir_gen=directory,
+        serializer=get_serializer(output_format),
+        rules=rules,
+        validate=validate,
     )
+    aliases = pipeline_aliases(space, context.snippets, rules, suffix=context.serializer.suffix) if dedupe else {}
 
-    # Hardcode freesurfer ingress dir
-    multi_set(
-        pipeline.config,
-        index=["pipeline_setup", "freesurfer_dir"],
-        value="/ocean/projects/med220004p/trogers1/many_pipelines/freesurfer/outputs/ABCD_all_subjects",
+    for pipeline_num, combi in space.numbered():
+        if combi.filename(pipeline_num, suffix=context.serializer.suffix) in aliases:
+            continue
+        yield _generate_combination(pipeline_num, combi, context, validator)
+
+
+def _generation_code_hash() -> str:
+    """
+    Hash of the code generating pipelines from the source configs: the package version and the
+    code of all gen192 modules, as installed (source or bytecode, also from zip files)
+    (special-case rules are hashed per pipeline)
+    """
+    import hashlib
+    import importlib.metadata
+    import pkgutil
+
+    try:
+        version = importlib.metadata.version(__package__)
+    except importlib.metadata.PackageNotFoundError:
+        version = "unknown"
+    digest = hashlib.sha256(version.encode())
+    for module in sorted(pkgutil.iter_modules(sys.modules[__package__].__path__), key=lambda module: module.name):
+        spec = module.module_finder.find_spec(f"{__package__}.{module.name}", None)
+        get_data = getattr(spec.loader, "get_data", None) if spec is not None else None
+        if spec is None or spec.origin is None or get_data is None:
+            continue
+        digest.update(module.name.encode())
+        digest.update(hashlib.sha256(get_data(spec.origin)).digest())
+    return digest.hexdigest()
+
+
+def _zip_build_folders(dir_build: pl.Path, dir_dist: pl.Path, skip: set[pl.Path], incremental: bool) -> None:
+    """Zips folders in build that were not packaged while generating them"""
+    import shutil
+
+    for subfolder in dir_build.glob("*"):
+        if not subfolder.is_dir() or subfolder in skip:
+            continue
+        archive = dir_dist / subfolder.name
+        if incremental and archive.with_suffix(".zip").exists():
+            continue
+        shutil.make_archive(
+            base_name=str(archive),
+            format="zip",
+            root_dir=subfolder,
+        )
+
+
+def _archive_rendered(archive: StreamingZipWriter | None, rendered: RenderedPipeline) -> None:
+    """Adds a generated pipeline (and its notes) to an archive"""
+    if archive is None:
+        return
+    archive.write(rendered.file.name, rendered.content)
+    if rendered.notes is not None:
+        archive.write(rendered.file.with_suffix(".notes.txt").name, rendered.notes)
+
+
+def _archive_existing(archive: StreamingZipWriter | None, file: pl.Path) -> None:
+    """Adds a pipeline generated by a previous run (and its notes) to an archive"""
+    if archive is None:
+        return
+    archive.write_file(file)
+    notes_file = file.with_suffix(".notes.txt")
+    if notes_file.exists():
+        archive.write_file(notes_file)
+
+
+def _read_notes(file: pl.Path) -> str | None:
+    """Reads the notes of a pipeline generated by a previous run (if any)"""
+    notes_file = file.with_suffix(".notes.txt")
+    return notes_file.read_text(encoding="utf-8") if notes_file.exists() else None
+
+
+def _bundle_rendered(
+    bundle: BundleWriter, pipeline_num: int, combi: PipelineCombination, rendered: RenderedPipeline
+) -> None:
+    """Adds a generated pipeline to a bundle (parsed back from its rendered content)"""
+    pipeline = PipelineConfig(
+        name=combi.name(pipeline_num),
+        file=rendered.file,
+        config=serializer_for_file(rendered.file).loads(rendered.content),
+        notes=rendered.notes,
     )
+    bundle.add(pipeline_num, pipeline, base=combi.pipeline_id)
+
+
+def main(
+    force: bool = False,
+    jobs: int = 1,
+    use_preset_cache: bool = True,
+    fetch_options: CpacFetchOptions | None = None,
+    output_format: str = "yaml",
+    incremental: bool = False,
+    zip_compresslevel: int | None = None,
+    reproducible_zip: bool = False,
+    rules: RuleTable = DEFAULT_RULE_TABLE,
+    space: CombinationSpace[PipelineCombination] | None = None,
+    shard: Tuple[int, int] | None = None,
+    dedupe: bool = False,
+    profiler: Profiler | None = None,
+    validate: bool = True,
+    submit: Callable[[pl.Path], None] | None = None,
+    bundle: bool = False,
+) -> None:
+    """
+    Main entry point for the CLI
 
-    # Set pipeline name
-    pipeline.set_name(combi.name(pipeline_num))
+    In incremental mode, existing outputs that were generated from the same inputs
+    (source configs, combination, generation code, C-PAC version and output format)
+    are kept, and only new or changed outputs are generated, validated and zipped.
 
-    return pipeline
+    Generated pipelines are written into their dist/ archive as they are produced.
 
+    `rules` are the special-case fix-ups applied to the generated pipelines,
+    `space` the combinations to generate pipelines for (see `pipeline_combination_space`).
 
-def main(force=False) -> None:
-    """Main entry point for the CLI"""
+    With `shard` (K, N), only every N-th pipeline starting from the K-th (1-based) is
+    generated, numbered as in the whole space, into the shard's own build directory
+    along with a shard manifest. No archives are written; `merge_shards` combines
+    the shards into build/ and dist/.
 
-    # Delete build and dist directories if force is True
-    if force:
-        dir_dist = pl.Path("dist")
-        dir_build = pl.Path("build")
+    With `dedupe`, only the first of the pipelines generating the same config (apart from
+    their name) is generated, validated and written. The others are listed in an alias map
+    (`ALIAS_MAP_FILE`) next to the generated pipelines, from their file name to the file
+    name of the pipeline they are identical to.
 
-        if dir_dist.exists():
-            print(f"Force option enabled: Removing {dir_dist}")
-            shutil.rmtree(dir_dist)
+    `profiler` records the time spent in each stage of the run and in the stages of
+    each generated pipeline (see `Profiler`).
 
-        if dir_build.exists():
-            print(f"Force option enabled: Removing {dir_build}")
-            shutil.rmtree(dir_build)
+    Without `validate`, the generated pipelines are not validated by C-PAC. C-PAC is
+    only fetched (and imported) once a pipeline is validated, so generating from
+    expanded presets (`CpacFetchOptions.presets`) without validation works offline.
 
-    checkout_sha = CPAC_SHA
-    cpac_version_hash = b64_urlsafe_hash(checkout_sha)
+    `submit` is called with the file of each generated (or up to date) pipeline once it is
+    written, e.g. to submit it as a job while the next pipelines are generated
+    (see `BackgroundSubmitter`).
+
+    With `bundle`, the generated pipelines are also written into a single bundle in dist/
+    (see `PipelineBundle`), storing the source configs once and the changes of each pipeline
+    to its source config. Bundles are not written when sharding.
+    """
+    profiler = profiler if profiler is not None else Profiler(enabled=False)
+    import shutil
+
+    full_space = space if space is not None else pipeline_combination_space()
+    space = full_space if shard is None else full_space.shard(shard[0] - 1, shard[1])
+    serializer = get_serializer(output_format)
 
     dir_dist = pl.Path("dist")
-    dir_build = pl.Path("build")
+    dir_build = pl.Path("build") if shard is None else shard_build_dir(*shard)
     dir_temp = pl.Path("temp")
+
+    # Delete build and dist directories if force is True
+    if force:
+        for directory in [dir_dist, dir_build] if shard is None else [dir_build]:
+            if directory.exists():
+                print(f"Force option enabled: Removing {directory}")
+                shutil.rmtree(directory)
+
+    checkout_sha = CPAC_SHA
+    cpac_version_hash = b64_urlsafe_hash(checkout_sha)
+
     dir_build.mkdir(parents=True, exist_ok=True)
     dir_temp.mkdir(parents=True, exist_ok=True)
     dir_configs = dir_build / f"cpac_source_configs_{cpac_version_hash}"
 
     # Download C-PAC configs
-    fetch_and_expand_cpac_configs(
-        cpac_dir=dir_temp / "cpac_source",
-        output_dir=dir_configs,
-        checkout_sha=checkout_sha,
-        config_names_ids=PIPELINE_NAMES,
-    )
+    with profiler.stage("fetch and expand configs"):
+        sources = expand_cpac_configs(
+            cpac_dir=dir_temp / "cpac_source",
+            checkout_sha=checkout_sha,
+            config_names_ids=PIPELINE_NAMES,
+            cache_dir=dir_temp / "cpac_preset_cache" if use_preset_cache else None,
+            fetch_options=fetch_options,
+            jobs=jobs,
+        )
+
+    manifest = BuildManifest(dir_build)
+
+    def open_archive(folder: pl.Path, changed: bool) -> StreamingZipWriter | contextlib.nullcontext[None]:
+        """Opens the archive of a build folder, unless it is up to date (in incremental mode) or sharding"""
+        archive = dir_dist / f"{folder.name}.zip"
+        if shard is not None or (incremental and not changed and archive.exists()):
+            return contextlib.nullcontext()
+        return StreamingZipWriter(archive, compresslevel=zip_compresslevel, reproducible=reproducible_zip)
 
-    # Load pipeline YAMLS
+    def open_bundle(folder: pl.Path) -> BundleWriter | contextlib.nullcontext[None]:
+        """Opens the bundle of a build folder (if bundling and not sharding)"""
+        if not bundle or shard is not None:
+            return contextlib.nullcontext()
+        return BundleWriter(dir_dist / f"{folder.name}{BUNDLE_SUFFIX}", bases=configs)
+
+    # Load pipeline YAMLS (as expanded, the written copies are not read back)
     configs: ConfigLookupTable = {}
-    for config_name in PIPELINE_NAMES.keys():
+    source_hashes: dict[str, str] = {}
+    source_files: list[RenderedPipeline] = []
+    sources_changed = False
+    dir_configs.mkdir(parents=True, exist_ok=True)
+    for config_name, content in sources.items():
         config_path = dir_configs / (filesafe(config_name) + ".yml")
-        pipeline = load_pipeline_config(config_path)
+        with profiler.stage("load configs"):
+            pipeline = parse_pipeline_config(content, config_path)
         configs[config_name] = pipeline
+        source_hashes[config_name] = canonical_hash(pipeline.config)
+        source_files.append(RenderedPipeline(file=config_path, content=content))
+        if not manifest.is_current(config_path, source_hashes[config_name], content=content):
+            with profiler.stage("write"):
+                source_files[-1].write(exist_ok=True)
+            manifest.record(config_path, source_hashes[config_name], content)
+            sources_changed = True
         print(f"Loaded pipeline {config_name} from {config_path}")
 
+    with open_archive(dir_configs, changed=sources_changed) as archive:
+        for rendered in source_files:
+            _archive_rendered(archive, rendered)
+
+    input_hash_base: dict[str, Any] = {
+        "cpac_sha": checkout_sha,
+        "format": serializer.name,
+        # Also hashed when not incremental: the outputs are recorded for later incremental runs
+        # (and the records of shards have to match the records of an unsharded build)
+        "code": _generation_code_hash(),
+    }
+    if not validate:
+        # Validation adds warnings to the notes of the generated pipelines
+        input_hash_base["validated"] = False
+
     # Generate "pure" pipelines with derivatives turned off
     dir_gen = dir_build / "gen192_pure"
     dir_gen.mkdir(parents=True, exist_ok=True)
 
     print(f'Generating base pipeline configs in folder "{dir_gen}"')
 
+    pure_hashes: dict[pl.Path, str] = {}
     for config_name in PIPELINE_NAMES.keys():
-        config = configs[config_name].clone()
-        config.file = dir_gen / f"{config_name}.yml"
-        config.set_name(config_name)
-        _config_deactivate_derivatives(config)
-        config.dump(exist_ok=False)
-        print(f"> Generated pipeline {config_name}")
+        config_file = dir_gen / f"{config_name}{serializer.suffix}"
+        pure_hashes[config_file] = canonical_hash(
+            {**input_hash_base, "pure": config_name, "source": source_hashes[config_name]}
+        )
+    stale = {file for file, input_hash in pure_hashes.items() if not manifest.is_current(file, input_hash)}
+    pruned = manifest.prune(dir_gen, keep=set(pure_hashes)) if incremental else []
+
+    with profiler.stage("base pipelines"), open_archive(dir_gen, changed=bool(stale or pruned)) as archive:
+        for config_name, (config_file, input_hash) in zip(PIPELINE_NAMES.keys(), pure_hashes.items()):
+            if incremental and config_file not in stale:
+                print(f"> Up to date: pipeline {config_name}")
+                _archive_existing(archive, config_file)
+                continue
+
+            config = configs[config_name].derive()
+            config.file = config_file
+            config.set_name(config_name)
+            _config_deactivate_derivatives(config)
+            rendered = config.render()
+            rendered.write(exist_ok=incremental)
+            manifest.record(config_file, input_hash, rendered.content, rendered.notes)
+            _archive_rendered(archive, rendered)
+            print(f"> Generated pipeline {config_name}")
 
     # Generate permuted pipelines
     dir_gen = dir_build / "gen192_nofork"
@@ -370,193 +853,540 @@ def main(force=False) -> None:
 
     print(f'Generating 192 permutations in folder "{dir_gen}"')
 
-    for pipeline_num, combi in enumerate(iter_pipeline_combis_no_duplicates()):
-        filename = combi.filename(pipeline_num)
-
-        print(f"> Generating {filename}")
-
-        combined = generate_pipeline_from_combi(pipeline_num, combi, configs)
-
-        if (
-            combi.pipeline_id == "ABCD"
-            and combi.pipeline_perturb_id == "CCS"
-            and combi.step.name == "Functional Registration"
-        ) or (
-            combi.pipeline_id == "CCS"
-            and combi.pipeline_perturb_id == "ABCD"
-            and combi.step.name == "Functional Masking"
-        ):
-            # See text related to search term "apply_func_mask_in_native_space: false" in
-            # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-            # todo: sanity check
-            multi_set(
-                combined.config,
-                index=["functional_preproc", "func_masking", "apply_func_mask_in_native_space"],
-                value=True,
-            )
+    validator = ConfigValidator()
+    with profiler.stage("index snippets"):
+        context = GenerationContext(
+            configs=configs,
+            dir_gen=dir_gen,
+            serializer=serializer,
+            rules=rules,
+            profile=profiler.enabled,
+            validate=validate,
+        )
 
-        # if (
-        #     combi.pipeline_id == "CCS"
-        #     and combi.pipeline_perturb_id == "ABCD"
-        #     and combi.step.name == "Functional Masking"
-        #     #and combi.use_nuisance_correction == True
-        # ):
-        #     # See text related to search term "use_priors" and "lateral_ventricles_mask" in
-        #     # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-        #     # todo: sanity check
-        #     multi_set(
-        #         combined.config,
-        #         index=["segmentation", "tissue_segmentation", "FSL-FAST", "use_priors", "run"],
-        #         value=False,
-        #     )
-        #     multi_set(
-        #         combined.config,
-        #         index=["nuisance_corrections", "2-nuisance_regrtession", "lateral_ventricles_mask"],
-        #         value=None,
-        #     )
-
-        if (
-            combi.pipeline_id == "ABCD"
-            and combi.pipeline_perturb_id == "RBC"
-            and combi.step.name == "Structural Registration"
-        ):
-            # See text related to search term "overwrite transform" in
-            # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-            # todo: sanity check
-            multi_set(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "overwrite_transform", "run"],
-                value=True,
-            )
+    for rule in rules.dead_rules(full_space):
+        print_warning(f'Special-case rule "{rule.name}" does not apply to any pipeline')
 
-        if (
-            (
-                combi.pipeline_id == "ABCD"
-                and combi.pipeline_perturb_id == "RBC"
-                and combi.step.name == "Functional Registration"
-            )
-            or (
-                combi.pipeline_id == "ABCD"
-                and combi.pipeline_perturb_id == "fMRIPrep"
-                and combi.step.name == "Functional Registration"
-            )
-            or (
-                combi.pipeline_id == "RBC"
-                and combi.pipeline_perturb_id == "ABCD"
-                and combi.step.name == "Functional Masking"
-            )
-        ):
-            # See text related to search term "Anatomical_Resampled to CCS_Anatomical_Refined" in
-            # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-            # todo: sanity check
-            multi_set(
-                combined.config,
-                index=["functional_preproc", "func_masking", "using"],
-                value=["CCS_Anatomical_Refined"],  # string list, change from ["Anatomical_Resampled"]
-            )
+    # Pipelines identical to a previous pipeline (of the whole space, so all shards agree)
+    aliases = pipeline_aliases(full_space, context.snippets, rules, suffix=serializer.suffix) if dedupe else {}
 
-        if (
-            combi.pipeline_id == "ABCD"
-            and combi.pipeline_perturb_id == "fMRIPrep"
-            and combi.step.name == "Structural Registration"
-        ) or (
-            combi.pipeline_id == "CCS"
-            and combi.pipeline_perturb_id == "ABCD"
-            and combi.step.name == "Structural Masking"
-        ):
-            # See text related to search term "registration: using: ANTS" in
-            # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-            # todo: sanity check
-            multi_set(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "registration", "using"],
-                value=["FSL"],  # string list, change from ["ANTS"]
-            )
-            multi_set(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "overwrite_transform", "run"],
-                value=True,
-            )
+    tasks = []
+    input_hashes: dict[pl.Path, str] = {}
+    pipeline_nums: dict[str, int] = {}
+    for pipeline_num, combi in space.numbered():
+        file = dir_gen / combi.filename(pipeline_num, suffix=serializer.suffix)
+        pipeline_nums[file.name] = pipeline_num
+        if file.name in aliases:
+            continue
+        input_hashes[file] = canonical_hash(
+            {
+                **input_hash_base,
+                "pipeline_num": pipeline_num,
+                "combination": dataclasses.asdict(combi),
+                "base": source_hashes[combi.pipeline_id],
+                "perturb": source_hashes[combi.pipeline_perturb_id],
+                "rules": rules.hash_for(combi),
+            }
+        )
+        if not incremental or not manifest.is_current(file, input_hashes[file]):
+            tasks.append((pipeline_num, combi))
+    equivalence_classes = context.snippets.equivalence_classes(space.numbered(), rules)
+    noops = sum(context.snippets.is_noop(combi) for combi in space)
+    print(
+        f"{len(space)} combinations generate {len(equivalence_classes)} distinct pipeline configs "
+        f"({noops} perturbations do not change their base pipeline)"
+    )
 
-        if (
-            combi.pipeline_id == "RBC"
-            and combi.pipeline_perturb_id == "ABCD"
-            and combi.step.name == "Functional Masking"
-        ) and (
-            combi.pipeline_id == "fMRIPrep"
-            and combi.pipeline_perturb_id == "ABCD"
-            and combi.step.name == "Structural Masking"
-        ):
-            # See text related to search term "overwrite transform" in
-            # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-            # todo: sanity check
-            multi_set(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "overwrite_transform", "run"],
-                value=True,
-            )
+    if validate and tasks:
+        # Make C-PAC importable for config validation (expansion may have been skipped)
+        with profiler.stage("check out C-PAC"):
+            ensure_cpac_repo(cpac_dir=dir_temp / "cpac_source", checkout_sha=checkout_sha, fetch_options=fetch_options)
+
+    stale = {dir_gen / combi.filename(pipeline_num, suffix=serializer.suffix) for pipeline_num, combi in tasks}
+    alias_file = dir_gen / ALIAS_MAP_FILE
+    if dedupe:
+        alias_content = json.dumps(aliases, indent=2) + "\n"
+        alias_hash = canonical_hash(aliases)
+        if not incremental or not manifest.is_current(alias_file, alias_hash):
+            stale.add(alias_file)
+    pruned = (
+        manifest.prune(dir_gen, keep=set(input_hashes) | ({alias_file} if dedupe else set())) if incremental else []
+    )
 
-        if (
-            combi.pipeline_id == "RBC"
-            and combi.pipeline_perturb_id == "CCS"
-            and combi.step.name == "Structural Registration"
-        ):
-            # See text related to search term "overwrite transform" in
-            # https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0
-            # todo: sanity check
-            multi_set(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "registration", "using"],
-                value=["ANTS"],  # string list, change from ["FSL"]
-            )
+    combis = dict(space.numbered())
+    with (
+        open_archive(dir_gen, changed=bool(stale or pruned)) as archive,
+        open_bundle(dir_gen) as bundle_writer,
+        contextlib.closing(
+            iter_rendered_pipelines(tasks, context, jobs=jobs, validator=validator, profiler=profiler)
+        ) as rendered_iter,
+    ):
+        for file in input_hashes:
+            if file not in stale:
+                print(f"> Up to date: {file.name}")
+                with profiler.stage("archive"):
+                    _archive_existing(archive, file)
+                if bundle_writer is not None:
+                    rendered = RenderedPipeline(
+                        file=file, content=file.read_text(encoding="utf-8"), notes=_read_notes(file)
+                    )
+            else:
+                # Write pipeline
+                with profiler.stage("generate pipelines"):
+                    rendered = next(rendered_iter)
+                with profiler.stage("write"):
+                    rendered.write(exist_ok=incremental)
+                    manifest.record(rendered.file, input_hashes[rendered.file], rendered.content, rendered.notes)
+                with profiler.stage("archive"):
+                    _archive_rendered(archive, rendered)
+            if bundle_writer is not None:
+                with profiler.stage("bundle"):
+                    pipeline_num = pipeline_nums[file.name]
+                    _bundle_rendered(bundle_writer, pipeline_num, combis[pipeline_num], rendered)
+            if submit is not None:
+                with profiler.stage("submit"):
+                    submit(file)
+
+        if dedupe:
+            if alias_file in stale:
+                RenderedPipeline(file=alias_file, content=alias_content).write(exist_ok=incremental)
+                manifest.record(alias_file, alias_hash, alias_content)
+            _archive_existing(archive, alias_file)
+            print(f"> {len(aliases)} duplicate pipelines are listed in {alias_file}")
+            if bundle_writer is not None:
+                for alias, canonical in aliases.items():
+                    pipeline_num = pipeline_nums[alias]
+                    bundle_writer.add_alias(
+                        pipeline_num, combis[pipeline_num].name(pipeline_num), alias, pipeline_nums[canonical]
+                    )
+
+    if bundle_writer is not None:
+        print(f"> Bundled {len(bundle_writer.entries)} pipelines into {bundle_writer.file}")
+
+    manifest.save()
+
+    if validate:
+        print(f"Config validation: {validator.stats}")
+
+    if shard is not None:
+        ShardManifest(
+            shard=shard[0],
+            count=shard[1],
+            total=len(full_space),
+            cpac_sha=checkout_sha,
+            output_format=serializer.name,
+            folders={
+                dir_configs.name: [filesafe(config_name) + ".yml" for config_name in PIPELINE_NAMES.keys()],
+                dir_build.joinpath("gen192_pure").name: [file.name for file in pure_hashes],
+                dir_gen.name: [name for name in pipeline_nums if name not in aliases]
+                + ([ALIAS_MAP_FILE] if dedupe else []),
+            },
+            pipelines=pipeline_nums,
+        ).save(dir_build)
+        print(f'Generated shard {shard[0]}/{shard[1]} ({len(pipeline_nums)} pipelines) in "{dir_build}"')
+        return
+
+    # Zip all other folders in build
+    with profiler.stage("zip"):
+        _zip_build_folders(
+            dir_build, dir_dist, skip={dir_configs, dir_build / "gen192_pure", dir_gen}, incremental=incremental
+        )
 
-        if (
-            combi.pipeline_id == "fMRIPrep"
-            and combi.pipeline_perturb_id == "CCS"
-            and combi.step.name == "Structural Registration"
-        ) and (
-            combi.pipeline_id == "RBC"
-            and combi.pipeline_perturb_id == "CCS"
-            and combi.step.name == "Structural Registration"
-        ):
-            multi_del(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "overwrite_transform", "using"],
-            )
-            multi_set(
-                combined.config,
-                index=["registration_workflows", "anatomical_registration", "registration", "using"],
-                value=["ANTS"],  # string list, change from ["FSL"]
-            )
 
-        combined.file = dir_gen / filename
+def plan(
+    jobs: int = 1,
+    use_preset_cache: bool = True,
+    fetch_options: CpacFetchOptions | None = None,
+    output_format: str = "yaml",
+    rules: RuleTable = DEFAULT_RULE_TABLE,
+    space: CombinationSpace[PipelineCombination] | None = None,
+    shard: Tuple[int, int] | None = None,
+    dedupe: bool = False,
+    profile_report: dict | None = None,
+) -> GenerationPlan:
+    """
+    Plans what `main` would generate with the same arguments (a dry run): the combinations,
+    their output file names and special-case rules, and the rules that apply to no pipeline.
 
-        # Let CPAC check if it is a valid config
-        ok, err = check_cpac_config(combined.config)
-        if not ok:
-            warning = f'CPAC-reported config validation error: "{err}"'
-            combined.notes = combined.notes + "\n" + warning if combined.notes else warning
-            print_warning(warning)
+    Nothing is written and nothing is fetched. If the expanded presets are available offline
+    (`fetch_options.presets`, a previous build or the preset cache), no-op perturbations and
+    duplicate pipelines are detected as well. With the `profile_report` of a previous run
+    (see `Profiler.save`), the generation time is estimated.
+    """
+    full_space = space if space is not None else pipeline_combination_space()
+    space = full_space if shard is None else full_space.shard(shard[0] - 1, shard[1])
+    serializer = get_serializer(output_format)
+    dir_configs = pl.Path("build") if shard is None else shard_build_dir(*shard)
+    dir_configs = dir_configs / f"cpac_source_configs_{b64_urlsafe_hash(CPAC_SHA)}"
 
-        # Write pipeline
-        combined.dump(exist_ok=False)
+    sources = read_expanded_cpac_configs(
+        output_dir=dir_configs,
+        checkout_sha=CPAC_SHA,
+        config_names_ids=PIPELINE_NAMES,
+        cache_dir=pl.Path("temp") / "cpac_preset_cache" if use_preset_cache else None,
+        fetch_options=fetch_options,
+    )
+    snippets = None
+    if sources is not None:
+        configs = {
+            config_name: parse_pipeline_config(content, dir_configs / (filesafe(config_name) + ".yml"))
+            for config_name, content in sources.items()
+        }
+        snippets = SnippetIndex(configs)
+
+    return plan_generation(
+        space,
+        rules,
+        suffix=serializer.suffix,
+        snippets=snippets,
+        full_space=full_space,
+        dedupe=dedupe,
+        profile_report=profile_report,
+        jobs=jobs,
+    )
 
-    # Zip all folders in build
-    for subfolder in dir_build.glob("*"):
-        if subfolder.is_dir():
-            shutil.make_archive(
-                base_name=str(dir_dist / subfolder.name),
-                format="zip",
-                root_dir=subfolder,
-            )
 
+def merge_shards(
+    shard_dirs: Iterable[pl.Path] | None = None,
+    force: bool = False,
+    zip_compresslevel: int | None = None,
+    reproducible_zip: bool = False,
+) -> None:
+    """
+    Combines the build directories of all shards of a sharded build (see `main`) into
+    build/, along with their build manifests, and writes the dist/ archives with the
+    pipelines in global order (so they match the archives of an unsharded build).
+    """
+    import shutil
+
+    if shard_dirs is None:
+        shard_dirs = [directory for directory in sorted(pl.Path("shards").glob("*")) if directory.is_dir()]
+    shards = sorted(
+        ((directory, ShardManifest.load(directory)) for directory in shard_dirs), key=lambda shard: shard[1].shard
+    )
+    check_shards_complete([shard_manifest for _, shard_manifest in shards])
+    pipeline_nums = {name: num for _, shard_manifest in shards for name, num in shard_manifest.pipelines.items()}
+
+    dir_dist = pl.Path("dist")
+    dir_build = pl.Path("build")
+    if force:
+        for directory in [dir_dist, dir_build]:
+            if directory.exists():
+                print(f"Force option enabled: Removing {directory}")
+                shutil.rmtree(directory)
+
+    manifest = BuildManifest(dir_build)
+
+    # Shard build directory to take each output file from, by build folder
+    folders: dict[str, dict[str, pl.Path]] = {}
+    for shard_dir, shard_manifest in shards:
+        shard_records = BuildManifest(shard_dir).records
+        for folder, names in shard_manifest.folders.items():
+            sources = folders.setdefault(folder, {})
+            for name in names:
+                key = f"{folder}/{name}"
+                if name in sources:
+                    # Outputs generated by every shard (source and pure configs) must be identical
+                    if shard_records.get(key) != manifest.records.get(key):
+                        raise ValueError(f"{key} differs between shards")
+                    continue
+                sources[name] = shard_dir
+                manifest.records[key] = shard_records[key]
+
+    for folder, sources in folders.items():
+        # Pipelines in global order, other files (like the alias map) after them
+        names = sorted(sources, key=lambda name: pipeline_nums.get(name, len(pipeline_nums)))
+        (dir_build / folder).mkdir(parents=True, exist_ok=True)
+        with StreamingZipWriter(
+            dir_dist / f"{folder}.zip", compresslevel=zip_compresslevel, reproducible=reproducible_zip
+        ) as archive:
+            for name in names:
+                source = sources[name] / folder / name
+                for file in (source, source.with_suffix(".notes.txt")):
+                    target = dir_build / folder / file.name
+                    if not file.exists():
+                        continue
+                    if target.exists():
+                        raise FileExistsError(f"{target} already exists (use --force to overwrite)")
+                    shutil.copy2(file, target)
+                _archive_existing(archive, dir_build / folder / name)
+        print(f"> Merged {len(names)} files into {dir_build / folder}")
+
+    manifest.save()
+    print(f"Merged {len(shards)} shards into {dir_build} and {dir_dist}")
+
+
+def _shard_arg(value: str) -> Tuple[int, int]:
+    try:
+        return parse_shard(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err)) from None
+
+
+def cli() -> None:
+    output_options = argparse.ArgumentParser(add_help=False)
+    output_options.add_argument("-f", "--force", action="store_true", help="Force execution without prompts")
+    output_options.add_argument(
+        "--zip-level",
+        type=int,
+        choices=range(10),
+        metavar="{0-9}",
+        help="Compression level of the dist/ archives (default: zlib default)",
+    )
+    output_options.add_argument(
+        "--reproducible-zip",
+        action="store_true",
+        help="Use fixed timestamps in the dist/ archives, so identical outputs result in identical archives",
+    )
 
-def cli():
-    parser = argparse.ArgumentParser(description="Your script description")
-    parser.add_argument("-f", "--force", action="store_true", help="Force execution without prompts")
+    parser = argparse.ArgumentParser(description="Your script description", parents=[output_options])
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes to expand presets and generate pipelines with (0 uses all available cores)",
+    )
+    parser.add_argument(
+        "--no-preset-cache",
+        action="store_true",
+        help="Always re-expand the C-PAC presets instead of reusing expansions cached by previous runs",
+    )
+    parser.add_argument(
+        "--cpac-source",
+        default=CPAC_REPO_URL,
+        help="URL or path of the C-PAC git repository (e.g. a local bare mirror), or path of a tarball of it",
+    )
+    parser.add_argument(
+        "--shallow-fetch",
+        action="store_true",
+        help="Only fetch the C-PAC commit that is checked out instead of the full history",
+    )
+    parser.add_argument(
+        "--sparse-fetch",
+        action="store_true",
+        help=f"Only check out the parts of C-PAC needed for generation ({', '.join(CPAC_SPARSE_PATHS)})",
+    )
+    parser.add_argument(
+        "--presets",
+        type=pl.Path,
+        help="Directory or zip file of expanded C-PAC presets (e.g. the cpac_source_configs archive of a previous "
+        "build) to use instead of fetching C-PAC and expanding them",
+    )
+    parser.add_argument(
+        "--no-validate",
+        action="store_true",
+        help="Do not let C-PAC validate the generated pipelines (C-PAC is not needed with --presets)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(SERIALIZERS),
+        default="yaml",
+        help="File format of the generated pipeline configs",
+    )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Only regenerate outputs whose inputs changed since the last run (instead of refusing to overwrite)",
+    )
+    parser.add_argument(
+        "--rules",
+        type=pl.Path,
+        help="YAML file of special-case rules to apply instead of the built-in ones",
+    )
+    parser.add_argument(
+        "--connectivity-axis",
+        action="store_true",
+        help=f"Also vary the connectivity method ({', '.join(CONNECTIVITY_METHODS)})",
+    )
+    parser.add_argument(
+        "--nuisance-axis",
+        action="store_true",
+        help="Also vary whether nuisance regression is run",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_shard_arg,
+        metavar="K/N",
+        help="Only generate shard K of N (1-based, e.g. a SLURM array task) into shards/K-of-N/, "
+        "combine all shards with the merge command",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help=f"Only generate and validate one of the pipelines generating identical configs (apart from their name), "
+        f"the others are listed in {ALIAS_MAP_FILE}",
+    )
+    parser.add_argument(
+        "--profile",
+        type=pl.Path,
+        nargs="?",
+        const=pl.Path("gen192_profile.json"),
+        metavar="REPORT",
+        help="Record the time spent per stage and per pipeline, print a summary and write a JSON report "
+        "(default: gen192_profile.json)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="With --profile, also trace the peak memory of each stage (slow)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="append",
+        metavar="STAGE",
+        help='With --profile, run a stage (e.g. "generate pipelines") under cProfile and write its statistics '
+        "next to the report (can be repeated)",
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help=f"Also write the generated pipelines into a single file (dist/gen192_nofork{BUNDLE_SUFFIX}) storing the "
+        "source configs once and the changes of each pipeline, to load single pipelines quickly (see PipelineBundle)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        nargs="?",
+        choices=["text", "json"],
+        const="text",
+        help="Only print what would be generated (file names, special-case rules, duplicates and no-ops if the "
+        "expanded presets are available offline) as text or JSON, without writing or fetching anything. "
+        "With --profile REPORT, the generation time is estimated from the report of a previous run",
+    )
+    submit_options = parser.add_mutually_exclusive_group()
+    submit_options.add_argument(
+        "--submit-command",
+        metavar="TEMPLATE",
+        help="Run this command for each pipeline as it is written, while the next ones are generated "
+        '({config} and {name} are replaced by its config file and name, e.g. "cpac run ... --pipeline_file {config}")',
+    )
+    submit_options.add_argument(
+        "--submit-slurm",
+        type=pl.Path,
+        metavar="SCRIPT",
+        help="Submit this batch script with sbatch for each pipeline as it is written (with its config file as "
+        "argument), while the next ones are generated",
+    )
+    parser.add_argument(
+        "--sbatch-option",
+        action="append",
+        default=[],
+        metavar="OPTION",
+        help='With --submit-slurm, pass this option to sbatch (e.g. "--partition=compute", can be repeated)',
+    )
+    parser.add_argument(
+        "--submit-jobs", type=int, default=4, help="Number of submissions running at a time (default: 4)"
+    )
+    parser.add_argument(
+        "--submit-retries", type=int, default=2, help="Number of retries of a failed submission (default: 2)"
+    )
+    parser.add_argument(
+        "--submit-journal",
+        type=pl.Path,
+        default=pl.Path("gen192_submissions.jsonl"),
+        help="Log of the submissions, pipelines it lists as submitted are not submitted again "
+        "(default: gen192_submissions.jsonl)",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="{merge}")
+    merge_parser = commands.add_parser(
+        "merge",
+        parents=[output_options],
+        help="Combine the outputs of all shards of a sharded build into build/ and dist/",
+    )
+    merge_parser.add_argument(
+        "shard_dirs",
+        nargs="*",
+        type=pl.Path,
+        help="Shard build directories (default: all directories in shards/)",
+    )
     args = parser.parse_args()
 
-    main(force=args.force)
+    if args.command == "merge":
+        merge_shards(
+            shard_dirs=args.shard_dirs or None,
+            force=args.force,
+            zip_compresslevel=args.zip_level,
+            reproducible_zip=args.reproducible_zip,
+        )
+        return
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    fetch_options = CpacFetchOptions(
+        source=args.cpac_source,
+        shallow=args.shallow_fetch,
+        sparse_paths=CPAC_SPARSE_PATHS if args.sparse_fetch else None,
+        presets=args.presets,
+    )
+    rules = load_rule_table(args.rules) if args.rules is not None else DEFAULT_RULE_TABLE
+    space = pipeline_combination_space(connectivity=args.connectivity_axis, nuisance=args.nuisance_axis)
+
+    if args.dry_run is not None:
+        profile_report = None
+        if args.profile is not None and args.profile.is_file():
+            profile_report = json.loads(args.profile.read_text(encoding="utf-8"))
+        generation_plan = plan(
+            jobs=jobs,
+            use_preset_cache=not args.no_preset_cache,
+            fetch_options=fetch_options,
+            output_format=args.format,
+            rules=rules,
+            space=space,
+            shard=args.shard,
+            dedupe=args.dedupe,
+            profile_report=profile_report,
+        )
+        print(generation_plan.to_json() if args.dry_run == "json" else generation_plan.summary())
+        return
+
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler(
+            trace_memory=args.profile_memory,
+            cprofile_stages=args.cprofile or (),
+            cprofile_prefix=args.profile.with_suffix(""),
+        )
+    submitter = None
+    if args.submit_command is not None or args.submit_slurm is not None:
+        from .submission import BackgroundSubmitter, LocalExecutor, SlurmExecutor, SubmissionJournal
+
+        submitter = BackgroundSubmitter(
+            executor=(
+                LocalExecutor(args.submit_command)
+                if args.submit_command is not None
+                else SlurmExecutor(args.submit_slurm, options=args.sbatch_option)
+            ),
+            concurrency=args.submit_jobs,
+            retries=args.submit_retries,
+            journal=SubmissionJournal(args.submit_journal),
+        )
+    try:
+        with submitter if submitter is not None else contextlib.nullcontext():
+            main(
+                incremental=args.incremental,
+                force=args.force,
+                jobs=jobs,
+                use_preset_cache=not args.no_preset_cache,
+                fetch_options=fetch_options,
+                output_format=args.format,
+                zip_compresslevel=args.zip_level,
+                reproducible_zip=args.reproducible_zip,
+                rules=rules,
+                space=space,
+                shard=args.shard,
+                dedupe=args.dedupe,
+                profiler=profiler,
+                validate=not args.no_validate,
+                submit=submitter.put if submitter is not None else None,
+                bundle=args.bundle,
+            )
+    finally:
+        if submitter is not None:
+            print(f'Submissions: {submitter.summary()} (see "{args.submit_journal}")')
+        if profiler is not None:
+            profiler.save(args.profile)
+            print(profiler.summary())
+            print(f'Profile report written to "{args.profile}"')
 
 
 if __name__ == "__main__":
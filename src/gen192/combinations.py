@@ -0,0 +1,121 @@
+"""Lazy, indexable spaces of parameter combinations."""
+
+import copy
+import math
+from array import array
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import dataclass
+from typing import Any, Generic, TypeVar, overload
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Axis:
+    """A parameter of the combinations and the values it takes"""
+
+    name: str
+    """Keyword argument the value is passed as to the combination factory"""
+    values: Sequence[Any]
+
+
+class CombinationSpace(Generic[T]):
+    """
+    Cartesian product of axes in nested-loop order (the last axis varies fastest),
+    optionally filtered, that never materializes the combinations.
+
+    Length and access by index are O(1). A filtered space evaluates its filters once,
+    the first time it is indexed, and keeps the positions of the matching combinations
+    (as integers) to index them.
+
+    Slices and shards are views of the space: `numbered()` yields each combination
+    with its position in the whole space, so numbering stays the same however the
+    space is split.
+    """
+
+    def __init__(
+        self,
+        axes: Sequence[Axis],
+        factory: Callable[..., T],
+        filters: Sequence[Callable[[T], bool]] = (),
+    ) -> None:
+        self.axes = tuple(axes)
+        self.factory = factory
+        self.filters = tuple(filters)
+        self._sizes = [len(axis.values) for axis in self.axes]
+        self._product_len = math.prod(self._sizes)
+        self._matches: array | None = None
+        self._positions: range | None = None
+
+    def _decode(self, product_index: int) -> T:
+        """Returns the combination at an index of the unfiltered product"""
+        values = {}
+        for axis, size in zip(reversed(self.axes), reversed(self._sizes)):
+            product_index, value_index = divmod(product_index, size)
+            values[axis.name] = axis.values[value_index]
+        return self.factory(**{axis.name: values[axis.name] for axis in self.axes})
+
+    def _matching(self) -> array:
+        if self._matches is None:
+            self._matches = array(
+                "Q",
+                (
+                    index
+                    for index in range(self._product_len)
+                    if all(accept(self._decode(index)) for accept in self.filters)
+                ),
+            )
+        return self._matches
+
+    def _combination(self, position: int) -> T:
+        return self._decode(self._matching()[position] if self.filters else position)
+
+    @property
+    def positions(self) -> range:
+        """Positions of the combinations of this view in the whole space"""
+        if self._positions is not None:
+            return self._positions
+        return range(len(self._matching()) if self.filters else self._product_len)
+
+    def _view(self, positions: range) -> "CombinationSpace[T]":
+        view = copy.copy(self)
+        view._positions = positions
+        return view
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @overload
+    def __getitem__(self, index: int) -> T: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "CombinationSpace[T]": ...
+
+    def __getitem__(self, index: int | slice) -> "T | CombinationSpace[T]":
+        if isinstance(index, slice):
+            return self._view(self.positions[index])
+        return self._combination(self.positions[index])
+
+    def __iter__(self) -> Iterator[T]:
+        for position in self.positions:
+            yield self._combination(position)
+
+    def numbered(self) -> Iterator[tuple[int, T]]:
+        """Iterates over the combinations along with their position in the whole space"""
+        for position in self.positions:
+            yield position, self._combination(position)
+
+    def shard(self, index: int, count: int) -> "CombinationSpace[T]":
+        """
+        Returns shard `index` (0-based) of `count` disjoint shards covering this space.
+        Shards take every `count`-th combination, so they stay balanced across the axes.
+        """
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index} of {count}")
+        return self[index::count]
+
+    def where(self, *filters: Callable[[T], bool]) -> "CombinationSpace[T]":
+        """Returns the space of the combinations accepted by all filters"""
+        if self._positions is not None:
+            raise ValueError("Filter a combination space before slicing or sharding it")
+        return CombinationSpace(self.axes, self.factory, self.filters + filters)
@@ -1,3 +1,8 @@
 """Configuration for the gen192 package."""
 
 CPAC_SHA = "fd49ded9fc2148b4ef568cca3087d340d87970f0"
+
+CPAC_REPO_URL = "https://github.com/FCP-INDI/C-PAC.git"
+
+CPAC_SPARSE_PATHS = ["CPAC"]
+"""Paths of the C-PAC repository needed for preset expansion and validation (the package including its presets)"""
@@ -1,62 +1,315 @@
-import os
 import pathlib as pl
 import sys
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass
 from typing import Literal
 
-from .utils import cd, filesafe
+from .config import CPAC_REPO_URL
+from .overlay import materialize
+from .preset_cache import PresetCache
+from .utils import extend_sys_path, filesafe, print_warning
 
 
-def _download_cpac_repo(cpac_dir: pl.Path, checkout_sha: str) -> None:
-    """Downloads C-PAC configs from github and extracts them to the specified directory"""
+@dataclass
+class CpacFetchOptions:
+    """Options for fetching the C-PAC repository"""
 
-    print(f"Check out C-PAC ({checkout_sha}) from github...")
-    print("-------------------------------------------")
-    os.system(f"git clone https://github.com/FCP-INDI/C-PAC.git {cpac_dir}")
-    with cd(cpac_dir):
-        if os.system(f'git checkout "{checkout_sha}"') != 0:
-            print(f"Could not checkout {checkout_sha}")
-            exit(1)
-    print("-------------------------------------------")
+    source: str = CPAC_REPO_URL
+    """URL or path of a git repository (e.g. a local bare mirror), or path of a tarball of the repository"""
+    shallow: bool = False
+    """Only fetch the checked out commit instead of the full history"""
+    sparse_paths: list[str] | None = None
+    """Only check out these paths of the repository"""
+    presets: pl.Path | None = None
+    """
+    Directory or zip file of already expanded presets (like the cpac_source_configs archive
+    of a previous build) to use instead of fetching C-PAC and expanding them
+    """
 
 
-def fetch_and_expand_cpac_configs(
-    cpac_dir: pl.Path,
-    output_dir: pl.Path,
-    checkout_sha: str,
-    config_names_ids: dict[str, str],
-) -> None:
+_TARBALL_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def _git(*args: str, cwd: pl.Path | None = None) -> bool:
+    """Runs a git command and returns whether it succeeded"""
+    import subprocess
+
+    return subprocess.run(["git", *args], cwd=cwd).returncode == 0
+
+
+def _extract_cpac_tarball(cpac_dir: pl.Path, tarball: pl.Path, sparse_paths: list[str] | None) -> None:
+    """Extracts a tarball of the C-PAC repository, stripping the archive's top level folder (if any)"""
+    import tarfile
+
+    selected_paths = {path.strip("/") for path in sparse_paths} if sparse_paths is not None else None
+    with tarfile.open(tarball) as tar:
+        members = tar.getmembers()
+        top_levels = {pl.PurePosixPath(member.name).parts[0] for member in members}
+        # Archives do not necessarily list their folders, so the top level is judged from the member paths only
+        strip = len(top_levels) == 1 and top_levels != {"CPAC"}
+
+        selected = []
+        for member in members:
+            parts = pl.PurePosixPath(member.name).parts[1:] if strip else pl.PurePosixPath(member.name).parts
+            if not parts:
+                continue
+            if selected_paths is not None and parts[0] not in selected_paths:
+                continue
+            member.name = str(pl.PurePosixPath(*parts))
+            selected.append(member)
+
+        if not selected:
+            raise FileNotFoundError(
+                f"No files of {', '.join(sparse_paths or ['the repository'])} found in {tarball} "
+                f"(top level: {', '.join(sorted(top_levels))})"
+            )
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(cpac_dir, members=selected, filter="data")
+        else:
+            tar.extractall(cpac_dir, members=selected)
+
+
+def _download_cpac_repo(cpac_dir: pl.Path, checkout_sha: str, options: CpacFetchOptions | None = None) -> None:
     """
-    Fetches C-PAC configs from github, fully expands them (FROM: parent),
-    and then saves them to the specified directory.
+    Downloads C-PAC configs from github (or a local mirror or tarball)
+    and extracts them to the specified directory
     """
+    options = options or CpacFetchOptions()
+
+    source = options.source
+    if pl.Path(source).exists():
+        # Local mirror or tarball
+        source = str(pl.Path(source).absolute())
+
+        if source.endswith(_TARBALL_SUFFIXES):
+            print(f"Extract C-PAC from {source} (expected to contain {checkout_sha})...")
+            _extract_cpac_tarball(cpac_dir=cpac_dir, tarball=pl.Path(source), sparse_paths=options.sparse_paths)
+            return
+
+    print(f"Check out C-PAC ({checkout_sha}) from {source}...")
+    print("-------------------------------------------")
+    if options.shallow:
+        fetched = (
+            _git("init", "--quiet", str(cpac_dir))
+            and _git("remote", "add", "origin", source, cwd=cpac_dir)
+            and _git("fetch", "--depth", "1", "origin", checkout_sha, cwd=cpac_dir)
+        )
+        checkout_ref = "FETCH_HEAD"
+    else:
+        fetched = _git("clone", "--no-checkout", source, str(cpac_dir))
+        checkout_ref = checkout_sha
+    if fetched and options.sparse_paths is not None:
+        fetched = _git("sparse-checkout", "set", "--cone", *options.sparse_paths, cwd=cpac_dir)
+    if not fetched or not _git("checkout", "--quiet", "--detach", checkout_ref, cwd=cpac_dir):
+        print(f"Could not checkout {checkout_sha}")
+        exit(1)
+    print("-------------------------------------------")
+
+
+def ensure_cpac_repo(cpac_dir: pl.Path, checkout_sha: str, fetch_options: CpacFetchOptions | None = None) -> None:
+    """Downloads C-PAC to the specified directory (if not done before) and makes it importable"""
     if not (cpac_dir / "CPAC").exists():
         cpac_dir.mkdir(parents=True, exist_ok=True)
-        _download_cpac_repo(cpac_dir=cpac_dir, checkout_sha=checkout_sha)
-
-    output_dir.mkdir(parents=True, exist_ok=True)
+        _download_cpac_repo(cpac_dir=cpac_dir, checkout_sha=checkout_sha, options=fetch_options)
 
     cpac_module_path = str(cpac_dir.absolute())
 
     if cpac_module_path not in sys.path:
         sys.path.append(cpac_module_path)
 
+
+def _expand_cpac_preset(config_id: str, template: str) -> str:
+    """Fully expands a C-PAC preset (FROM: parent) and renders it with the specified YAML template"""
     from CPAC.utils.configuration.configuration import Preconfiguration  # noqa
     from CPAC.utils.configuration.yaml_template import create_yaml_from_template  # noqa
 
+    conf = Preconfiguration(config_id)
+    return create_yaml_from_template(conf.dict(), template)
+
+
+def _init_expansion_worker(sys_path: list[str]) -> None:
+    """Makes C-PAC importable in an expansion worker (when it was spawned instead of forked)"""
+    extend_sys_path(sys_path)
+
+
+def _expansion_worker(task: tuple[str, str]) -> tuple[str | None, str | None]:
+    """Expands a preset in a worker process, returns the YAML or the error (so one failure spares the others)"""
+    config_id, template = task
+    try:
+        return _expand_cpac_preset(config_id, template), None
+    except Exception as err:
+        return None, f"{type(err).__name__}: {err}"
+
+
+def _expand_cpac_presets(
+    config_ids: list[str], template: str, jobs: int = 1
+) -> Iterator[tuple[str | None, str | None]]:
+    """
+    Expands presets, yielding the YAML or the error of each (in order).
+    With jobs > 1 the presets are expanded in a process pool; each worker imports
+    C-PAC once, on its first preset.
+    """
+    tasks = [(config_id, template) for config_id in config_ids]
+    if jobs <= 1 or len(tasks) <= 1:
+        yield from map(_expansion_worker, tasks)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(tasks)), initializer=_init_expansion_worker, initargs=(list(sys.path),)
+    ) as pool:
+        yield from pool.map(_expansion_worker, tasks)
+
+
+def _read_vendored_presets(source: pl.Path, file_names: list[str]) -> dict[str, str]:
+    """Reads expanded presets by file name from a directory or zip file (in any of its folders)"""
+    import zipfile
+
+    found: dict[str, str] = {}
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for name in archive.namelist():
+                file_name = pl.PurePosixPath(name).name
+                if file_name in file_names and file_name not in found:
+                    found[file_name] = archive.read(name).decode("utf-8")
+    else:
+        for file_name in file_names:
+            file = next(iter(sorted(source.rglob(file_name))), None)
+            if file is not None:
+                found[file_name] = file.read_text(encoding="utf-8")
+
+    missing = [file_name for file_name in file_names if file_name not in found]
+    if missing:
+        raise FileNotFoundError(f"Expanded presets missing from {source}: {', '.join(missing)}")
+    return found
+
+
+def read_expanded_cpac_configs(
+    output_dir: pl.Path,
+    checkout_sha: str,
+    config_names_ids: dict[str, str],
+    cache_dir: pl.Path | None = None,
+    template: str = "blank",
+    fetch_options: CpacFetchOptions | None = None,
+) -> dict[str, str] | None:
+    """
+    Returns the expanded presets (YAML by config name) if they are available without fetching
+    C-PAC: from `fetch_options.presets`, from `output_dir` (expanded by a previous run) or from
+    the cache. Returns None if any preset is missing. Nothing is written.
+    """
+    file_names = {config_name: filesafe(config_name) + ".yml" for config_name in config_names_ids}
+    if fetch_options is not None and fetch_options.presets is not None:
+        vendored = _read_vendored_presets(fetch_options.presets, list(file_names.values()))
+        return {config_name: vendored[file_name] for config_name, file_name in file_names.items()}
+
+    if all((output_dir / file_name).is_file() for file_name in file_names.values()):
+        return {
+            config_name: (output_dir / file_name).read_text(encoding="utf-8")
+            for config_name, file_name in file_names.items()
+        }
+
+    if cache_dir is None:
+        return None
+    cache = PresetCache(cache_dir)
+    cached = {
+        config_name: cache.get(checkout_sha, config_id, template) for config_name, config_id in config_names_ids.items()
+    }
+    if any(content is None for content in cached.values()):
+        return None
+    return {config_name: content for config_name, content in cached.items() if content is not None}
+
+
+def expand_cpac_configs(
+    cpac_dir: pl.Path,
+    checkout_sha: str,
+    config_names_ids: dict[str, str],
+    cache_dir: pl.Path | None = None,
+    template: str = "blank",
+    fetch_options: CpacFetchOptions | None = None,
+    jobs: int = 1,
+) -> dict[str, str]:
+    """
+    Fetches C-PAC configs from github, fully expands them (FROM: parent) and returns
+    them (YAML by config name), without writing them anywhere.
+    If a cache directory is given, presets expanded by previous runs are reused
+    and C-PAC is only fetched and imported if some presets are not cached yet.
+    With jobs > 1, presets are expanded in parallel worker processes.
+    A preset that fails to expand does not stop the others (which are cached),
+    the failures are reported together.
+    With `fetch_options.presets`, the expanded presets are read from there instead
+    (by their output file name) and C-PAC is neither fetched nor imported.
+    """
+    if fetch_options is not None and fetch_options.presets is not None:
+        print(f"Using expanded C-PAC presets from {fetch_options.presets} (expected to match {checkout_sha})")
+        file_names = {config_name: filesafe(config_name) + ".yml" for config_name in config_names_ids}
+        vendored = _read_vendored_presets(fetch_options.presets, list(file_names.values()))
+        return {config_name: vendored[file_name] for config_name, file_name in file_names.items()}
+
+    cache = PresetCache(cache_dir) if cache_dir is not None else None
+
+    config_yaml_strings: dict[str, str] = {}
+    missing: dict[str, str] = {}
     for config_name, config_id in config_names_ids.items():
-        conf = Preconfiguration(config_id)
-        config_yaml_string = create_yaml_from_template(conf.dict(), "blank")
+        cached = cache.get(checkout_sha, config_id, template) if cache is not None else None
+        if cached is None:
+            missing[config_name] = config_id
+        else:
+            print(f"Using cached expansion of C-PAC preset {config_id}")
+            config_yaml_strings[config_name] = cached
+
+    if missing:
+        ensure_cpac_repo(cpac_dir=cpac_dir, checkout_sha=checkout_sha, fetch_options=fetch_options)
+
+        failed: list[str] = []
+        expanded = _expand_cpac_presets(list(missing.values()), template, jobs=jobs)
+        for (config_name, config_id), (expansion, error) in zip(missing.items(), expanded):
+            if expansion is None:
+                print_warning(f"Could not expand C-PAC preset {config_id}: {error}")
+                failed.append(config_id)
+                continue
+            config_yaml_strings[config_name] = expansion
+            if cache is not None:
+                cache.put(checkout_sha, config_id, template, expansion)
+        if failed:
+            raise RuntimeError(f"Could not expand C-PAC presets: {', '.join(failed)}")
+
+    return {config_name: config_yaml_strings[config_name] for config_name in config_names_ids}
+
+
+def fetch_and_expand_cpac_configs(
+    cpac_dir: pl.Path,
+    output_dir: pl.Path,
+    checkout_sha: str,
+    config_names_ids: dict[str, str],
+    cache_dir: pl.Path | None = None,
+    template: str = "blank",
+    fetch_options: CpacFetchOptions | None = None,
+    jobs: int = 1,
+) -> None:
+    """Fetches and expands C-PAC configs (see `expand_cpac_configs`) and saves them to the specified directory"""
+    expanded = expand_cpac_configs(
+        cpac_dir=cpac_dir,
+        checkout_sha=checkout_sha,
+        config_names_ids=config_names_ids,
+        cache_dir=cache_dir,
+        template=template,
+        fetch_options=fetch_options,
+        jobs=jobs,
+    )
+    output_dir.mkdir(parents=True, exist_ok=True)
 
+    for config_name, content in expanded.items():
         with open(output_dir / (filesafe(config_name) + ".yml"), "w", encoding="utf-8") as handle:
-            handle.write(config_yaml_string)
+            handle.write(content)
 
 
-def check_cpac_config(config: dict) -> tuple[Literal[True], None] | tuple[Literal[False], Exception]:
+def check_cpac_config(config: Mapping) -> tuple[Literal[True], None] | tuple[Literal[False], Exception]:
     """Checks if the specified file is a valid C-PAC config file"""
     from CPAC.utils.configuration.configuration import Configuration  # noqa
 
     try:
-        Configuration(config)
+        Configuration(materialize(config))
     except Exception as e:
         return False, e
     return True, None
@@ -0,0 +1,118 @@
+"""Copy-on-write views of nested C-PAC config dictionaries."""
+
+import copy
+from collections.abc import Iterator, Mapping, MutableMapping
+from typing import Any
+
+
+class ConfigOverlay(MutableMapping):
+    """
+    Copy-on-write view of a nested dictionary.
+
+    Reads fall through to the (never modified) base mapping, nested dictionaries
+    are wrapped in overlays of their own on access and lists are copied on
+    first access, so a pipeline derived from a source config only materializes
+    the paths it actually touches. Writes and deletions are recorded locally.
+    """
+
+    __slots__ = ("_base", "_local", "_children", "_deleted")
+
+    def __init__(self, base: Mapping | None = None) -> None:
+        self._base: Mapping = base if base is not None else {}
+        self._local: dict = {}
+        """Values set explicitly on this overlay"""
+        self._children: dict = {}
+        """Copy-on-write wrappers of base values created on access"""
+        self._deleted: set = set()
+        """Base keys that were deleted"""
+
+    def __getitem__(self, key: Any) -> Any:  # noqa: ANN401
+        if key in self._local:
+            return self._local[key]
+        if key in self._children:
+            return self._children[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        value = self._base[key]
+        if type(value) is dict or isinstance(value, Mapping):
+            value = self._children[key] = ConfigOverlay(value)
+        elif isinstance(value, list):
+            value = self._children[key] = copy.deepcopy(value)
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:  # noqa: ANN401
+        self._children.pop(key, None)
+        self._deleted.discard(key)
+        self._local[key] = _adopt(value)
+
+    def __delitem__(self, key: Any) -> None:  # noqa: ANN401
+        if key not in self:
+            raise KeyError(key)
+        self._local.pop(key, None)
+        self._children.pop(key, None)
+        if key in self._base:
+            self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._local:
+            return True
+        return key in self._base and key not in self._deleted
+
+    def __iter__(self) -> Iterator:
+        for key in self._base:
+            if key in self._local or key not in self._deleted:
+                yield key
+        for key in self._local:
+            if key not in self._base:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        """
+        Flattens the overlay into a plain nested dictionary (e.g. for dumping).
+        The result shares no mutable containers with the base.
+        """
+        result = {}
+        for key in self:
+            if key in self._local:
+                value = self._local[key]
+            elif key in self._children:
+                value = self._children[key]
+            else:
+                value = self._base[key]
+            result[key] = _flatten(value)
+        return result
+
+
+def _adopt(value: Any) -> Any:  # noqa: ANN401
+    """Wraps a value that is stored in an overlay so that its source is never mutated through the overlay"""
+    if type(value) is dict or isinstance(value, Mapping):
+        return ConfigOverlay(value)
+    if isinstance(value, list):
+        return copy.deepcopy(value)
+    return value
+
+
+def _flatten(value: Any) -> Any:  # noqa: ANN401
+    if isinstance(value, ConfigOverlay):
+        return value.to_dict()
+    if isinstance(value, Mapping):
+        return {key: _flatten(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_flatten(item) for item in value]
+    return value
+
+
+def materialize(value: Any) -> Any:  # noqa: ANN401
+    """
+    Returns a config (or config snippet) with overlays flattened into plain dictionaries.
+    Values that are not overlays are returned as is.
+    """
+    if isinstance(value, ConfigOverlay):
+        return value.to_dict()
+    return value
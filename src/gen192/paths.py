@@ -0,0 +1,194 @@
+"""Precompiled paths into nested config mappings."""
+
+import copy
+from collections.abc import Iterable, Mapping, MutableMapping, Sequence
+from typing import Any
+
+from .overlay import ConfigOverlay
+
+_MUTABLE_MAPPING_TYPES = frozenset({dict, ConfigOverlay})
+"""Types checked by identity before falling back to the (slow) abstract base class check"""
+
+
+def _resolve(obj: Any, keys: Iterable, create: bool) -> MutableMapping | None:  # noqa: ANN401
+    """
+    Walks down `keys` and returns the mutable mapping at their end, creating missing
+    dictionaries along the way if `create` (like `multi_set`). Returns None if the path
+    does not exist or leads through a value that is not a mutable mapping.
+    """
+    if not (type(obj) in _MUTABLE_MAPPING_TYPES or isinstance(obj, MutableMapping)):
+        return None
+    for key in keys:
+        if key not in obj:
+            if not create:
+                return None
+            obj[key] = {}
+        obj = obj[key]
+        if not (type(obj) in _MUTABLE_MAPPING_TYPES or isinstance(obj, MutableMapping)):
+            return None
+    return obj
+
+
+class ConfigPath:
+    """
+    A path into nested config mappings, compiled once and used on many configs.
+    `get`, `set` and `delete` behave like `multi_get`, `multi_set` and `multi_del`.
+    """
+
+    __slots__ = ("keys", "parent", "leaf", "_prefixes")
+
+    def __init__(self, keys: Sequence) -> None:
+        self.keys = tuple(keys)
+        self.parent = self.keys[:-1]
+        self.leaf = self.keys[-1] if self.keys else None
+        self._prefixes = tuple(self.keys[:length] for length in range(len(self.keys)))
+        """All prefixes of the path (from the root to the parent)"""
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self.keys)!r})"
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ConfigPath) and self.keys == other.keys
+
+    def __hash__(self) -> int:
+        return hash(self.keys)
+
+    def _check_not_root(self) -> None:
+        if not self.keys:
+            raise ValueError("Cannot set or delete the root of a config")
+
+    def get(self, obj: Mapping) -> Any | None:  # noqa: ANN401
+        """Returns the value at the path or None if the path does not exist"""
+        for key in self.keys:
+            if not (type(obj) in _MUTABLE_MAPPING_TYPES or isinstance(obj, Mapping)) or key not in obj:
+                return None
+            obj = obj[key]
+        return obj
+
+    def set(self, obj: MutableMapping, value: Any) -> bool:  # noqa: ANN401
+        """
+        Sets the value at the path, creating missing parents.
+        Returns False if a parent is not a mutable mapping.
+        """
+        self._check_not_root()
+        parent = _resolve(obj, self.parent, create=True)
+        if parent is None:
+            return False
+        parent[self.leaf] = value
+        return True
+
+    def delete(self, obj: MutableMapping) -> Any | None:  # noqa: ANN401
+        """Deletes the value at the path and returns it (None if the path does not exist)"""
+        self._check_not_root()
+        parent = _resolve(obj, self.parent, create=False)
+        if parent is None or self.leaf not in parent:
+            return None
+        value = parent[self.leaf]
+        del parent[self.leaf]
+        return value
+
+
+def as_config_path(path: "ConfigPath | Sequence") -> ConfigPath:
+    return path if isinstance(path, ConfigPath) else ConfigPath(path)
+
+
+class ConfigPatch:
+    """
+    Set and delete operations on config paths, applied together and in order.
+
+    Applying the patch resolves each parent mapping once and reuses it for all
+    operations below it, instead of walking every path from the root. Resolved
+    parents are forgotten once an operation replaces or deletes them (or one of
+    their parents), so the result is the same as applying the operations one by one.
+    Lists and dictionaries are copied when set, so configs patched with the same
+    patch never share them.
+    """
+
+    def __init__(self) -> None:
+        self.operations: list[tuple[bool, ConfigPath, Any]] = []
+        """Whether each operation is a set (or a delete), its path and the value to set"""
+        self._invalidating: list[bool] | None = None
+
+    def set(self, path: ConfigPath | Sequence, value: Any) -> "ConfigPatch":  # noqa: ANN401
+        path = as_config_path(path)
+        path._check_not_root()
+        self.operations.append((True, path, value))
+        self._invalidating = None
+        return self
+
+    def delete(self, path: ConfigPath | Sequence) -> "ConfigPatch":
+        path = as_config_path(path)
+        path._check_not_root()
+        self.operations.append((False, path, None))
+        self._invalidating = None
+        return self
+
+    def set_many(self, paths: Iterable[ConfigPath | Sequence], value: Any) -> "ConfigPatch":  # noqa: ANN401
+        """Sets the same value at several paths"""
+        for path in paths:
+            self.set(path, value)
+        return self
+
+    def extend(self, patch: "ConfigPatch") -> "ConfigPatch":
+        """Appends the operations of another patch"""
+        self.operations.extend(patch.operations)
+        self._invalidating = None
+        return self
+
+    def __repr__(self) -> str:
+        operations = [
+            ("set", list(path.keys), value) if is_set else ("delete", list(path.keys))
+            for is_set, path, value in self.operations
+        ]
+        return f"{type(self).__name__}({operations!r})"
+
+    def _invalidating_operations(self) -> list[bool]:
+        """Which operations change a mapping that another operation resolves as a parent"""
+        if self._invalidating is None:
+            prefixes = {prefix for _, path, _ in self.operations for prefix in path._prefixes}
+            self._invalidating = [path.keys in prefixes for _, path, _ in self.operations]
+        return self._invalidating
+
+    def apply(self, obj: MutableMapping) -> list[Any]:
+        """
+        Applies all operations to a config and returns their results
+        (as `ConfigPath.set` and `ConfigPath.delete` would).
+        """
+        if not (type(obj) in _MUTABLE_MAPPING_TYPES or isinstance(obj, MutableMapping)):
+            return [False if is_set else None for is_set, _, _ in self.operations]
+        resolved: dict[tuple, MutableMapping] = {(): obj}
+        results: list[Any] = []
+        for (is_set, path, value), invalidating in zip(self.operations, self._invalidating_operations()):
+            # Start from the deepest parent resolved by a previous operation
+            depth = len(path._prefixes) - 1
+            while path._prefixes[depth] not in resolved:
+                depth -= 1
+            parent: Any = resolved[path._prefixes[depth]]
+            for prefix in path._prefixes[depth + 1 :]:
+                key = prefix[-1]
+                if key not in parent:
+                    if not is_set:
+                        parent = None
+                        break
+                    parent[key] = {}
+                parent = parent[key]
+                if not (type(parent) in _MUTABLE_MAPPING_TYPES or isinstance(parent, MutableMapping)):
+                    parent = None
+                    break
+                resolved[prefix] = parent
+
+            if is_set:
+                if parent is not None:
+                    parent[path.leaf] = copy.deepcopy(value) if isinstance(value, (list, dict)) else value
+                results.append(parent is not None)
+            elif parent is not None and path.leaf in parent:
+                results.append(parent[path.leaf])
+                del parent[path.leaf]
+            else:
+                results.append(None)
+
+            if invalidating:
+                length = len(path.keys)
+                for prefix in [prefix for prefix in resolved if prefix[:length] == path.keys]:
+                    del resolved[prefix]
+        return results
@@ -0,0 +1,182 @@
+"""Generation plans: what a run would generate, without generating anything."""
+
+import json
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .cli import PipelineCombination
+    from .combinations import CombinationSpace
+    from .rules import RuleTable
+    from .snippets import SnippetIndex
+
+
+@dataclass
+class PlannedPipeline:
+    """A pipeline a run would generate"""
+
+    pipeline_num: int
+    file_name: str
+    combination: "PipelineCombination"
+    rules: list[str]
+    """Special-case rules applied to the pipeline"""
+    noop: bool | None = None
+    """Whether the perturbation leaves the base pipeline unchanged (None if the source configs are unknown)"""
+    alias_of: str | None = None
+    """File name of the first pipeline generating the same config (None if it is the first or unknown)"""
+
+
+@dataclass
+class GenerationPlan:
+    """The pipelines a run would generate, and what generating them would cost"""
+
+    pipelines: list[PlannedPipeline]
+    total: int
+    """Number of pipelines in the whole combination space (all shards)"""
+    dead_rules: list[str] = field(default_factory=list)
+    """Special-case rules that do not apply to any pipeline of the whole space"""
+    sources_known: bool = False
+    """Whether the source configs were available to detect no-ops and duplicates"""
+    dedupe: bool = False
+    """Whether duplicates are listed in the alias map instead of being generated"""
+
+    seconds_per_pipeline: float | None = None
+    """Mean generation time of a pipeline in a previous run (from its profile report)"""
+    jobs: int = 1
+
+    @property
+    def generated(self) -> list[PlannedPipeline]:
+        """The pipelines that would be generated (without the duplicates, if deduplicating)"""
+        return [pipeline for pipeline in self.pipelines if not (self.dedupe and pipeline.alias_of is not None)]
+
+    @property
+    def validations(self) -> int:
+        """Number of C-PAC validations (one per distinct config, if the source configs are known)"""
+        return len([pipeline for pipeline in self.pipelines if pipeline.alias_of is None])
+
+    @property
+    def estimated_seconds(self) -> float | None:
+        """Estimated time to generate the pipelines (None without a previous profile)"""
+        if self.seconds_per_pipeline is None:
+            return None
+        return self.seconds_per_pipeline * len(self.generated) / self.jobs
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "planned": len(self.pipelines),
+            "generated": len(self.generated),
+            "validations": self.validations,
+            "estimated_seconds": self.estimated_seconds,
+            "sources_known": self.sources_known,
+            "dead_rules": self.dead_rules,
+            "pipelines": [
+                {
+                    "pipeline_num": pipeline.pipeline_num,
+                    "file": pipeline.file_name,
+                    "base": pipeline.combination.pipeline_id,
+                    "perturb": pipeline.combination.pipeline_perturb_id,
+                    "step": pipeline.combination.step.name,
+                    "connectivity_method": pipeline.combination.connectivity_method,
+                    "use_nuisance_correction": pipeline.combination.use_nuisance_correction,
+                    "rules": pipeline.rules,
+                    "noop": pipeline.noop,
+                    "alias_of": pipeline.alias_of,
+                }
+                for pipeline in self.pipelines
+            ],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def summary(self) -> str:
+        """One line per pipeline, followed by the totals"""
+        lines = []
+        for pipeline in self.pipelines:
+            notes = []
+            if pipeline.rules:
+                notes.append(f"rules: {', '.join(pipeline.rules)}")
+            if pipeline.noop:
+                notes.append("perturbation is a no-op")
+            if pipeline.alias_of is not None:
+                notes.append(f"{'alias' if self.dedupe else 'duplicate'} of {pipeline.alias_of}")
+            lines.append(pipeline.file_name + (f" ({'; '.join(notes)})" if notes else ""))
+
+        for rule in self.dead_rules:
+            lines.append(f'Special-case rule "{rule}" does not apply to any pipeline')
+        lines.append(f"{len(self.pipelines)} of {self.total} pipelines planned, {len(self.generated)} generated")
+        if self.sources_known:
+            noops = sum(bool(pipeline.noop) for pipeline in self.pipelines)
+            lines.append(f"{self.validations} distinct configs to validate, {noops} no-op perturbations")
+        else:
+            lines.append("Source configs not available offline, no-ops and duplicates are not detected")
+        if self.estimated_seconds is not None:
+            lines.append(f"Estimated generation time: {self.estimated_seconds:.1f}s (from a previous profile)")
+        return "\n".join(lines)
+
+
+def seconds_per_pipeline(profile_report: Mapping[str, Any]) -> float | None:
+    """Mean time spent in the stages of a pipeline in a profile report (see `Profiler.save`)"""
+    pipelines = profile_report.get("pipelines", {})
+    if not pipelines:
+        return None
+    return sum(stats["wall"] for stages in pipelines.values() for stats in stages.values()) / len(pipelines)
+
+
+def alias_canonicals(
+    space: "CombinationSpace[PipelineCombination]", snippets: "SnippetIndex", rules: "RuleTable", suffix: str = ".yml"
+) -> dict[int, str]:
+    """
+    Maps the number of each pipeline that generates the same config as a previous
+    pipeline of the space (apart from its name) to the file name of the first such pipeline.
+    """
+    combis = dict(space.numbered())
+    aliases: dict[int, str] = {}
+    for pipeline_nums in snippets.equivalence_classes(combis.items(), rules):
+        canonical = combis[pipeline_nums[0]].filename(pipeline_nums[0], suffix=suffix)
+        aliases.update({pipeline_num: canonical for pipeline_num in pipeline_nums[1:]})
+    return aliases
+
+
+def plan_generation(
+    space: "CombinationSpace[PipelineCombination]",
+    rules: "RuleTable",
+    suffix: str = ".yml",
+    snippets: "SnippetIndex | None" = None,
+    full_space: "CombinationSpace[PipelineCombination] | None" = None,
+    dedupe: bool = False,
+    profile_report: Mapping[str, Any] | None = None,
+    jobs: int = 1,
+) -> GenerationPlan:
+    """
+    Plans the generation of the pipelines of `space` (e.g. a shard of `full_space`).
+    With the snippet index of the source configs, no-op perturbations and duplicates
+    (pipelines generating the same config as a previous pipeline of the whole space) are detected.
+    With the profile report of a previous run, the generation time is estimated.
+    """
+    full_space = full_space if full_space is not None else space
+    aliases = alias_canonicals(full_space, snippets, rules, suffix=suffix) if snippets is not None else {}
+
+    pipelines = []
+    for pipeline_num, combi in space.numbered():
+        pipelines.append(
+            PlannedPipeline(
+                pipeline_num=pipeline_num,
+                file_name=combi.filename(pipeline_num, suffix=suffix),
+                combination=combi,
+                rules=[rule.name for rule in rules.lookup(combi)],
+                noop=snippets.is_noop(combi) if snippets is not None else None,
+                alias_of=aliases.get(pipeline_num),
+            )
+        )
+    return GenerationPlan(
+        pipelines=pipelines,
+        total=len(full_space),
+        dead_rules=[rule.name for rule in rules.dead_rules(full_space)],
+        sources_known=snippets is not None,
+        dedupe=dedupe,
+        seconds_per_pipeline=seconds_per_pipeline(profile_report) if profile_report is not None else None,
+        jobs=jobs,
+    )
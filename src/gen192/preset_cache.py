@@ -0,0 +1,99 @@
+"""Persistent content-addressed cache of expanded C-PAC preset configs."""
+
+import hashlib
+import json
+import os
+import pathlib as pl
+from dataclasses import asdict, dataclass
+
+from .utils import b64_urlsafe_hash
+
+MANIFEST_VERSION = 1
+"""Version of the cache manifest format"""
+
+
+@dataclass
+class CachedPreset:
+    """Manifest entry of an expanded preset"""
+
+    cpac_sha: str
+    config_id: str
+    template: str
+    sha256: str
+    """Hash of the expanded YAML, which is also the name of the file it is stored in"""
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _write_atomic(path: pl.Path, content: bytes) -> None:
+    """Writes a file so that readers never see partially written content"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as handle:
+        handle.write(content)
+    os.replace(tmp_path, path)
+
+
+class PresetCache:
+    """
+    Stores expanded preset YAMLs keyed by (C-PAC SHA, config ID, template name).
+    The YAMLs are stored under their content hash and verified on every read,
+    so corrupted or missing entries are treated as cache misses.
+    """
+
+    def __init__(self, cache_dir: pl.Path) -> None:
+        self.cache_dir = cache_dir
+        self.manifest_file = cache_dir / "manifest.json"
+        self._entries: dict[str, CachedPreset] = self._read_manifest()
+
+    @staticmethod
+    def key(cpac_sha: str, config_id: str, template: str) -> str:
+        return b64_urlsafe_hash(json.dumps([cpac_sha, config_id, template]))
+
+    def _read_manifest(self) -> dict[str, CachedPreset]:
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return {key: CachedPreset(**entry) for key, entry in manifest["presets"].items()}
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "presets": {key: asdict(entry) for key, entry in sorted(self._entries.items())},
+        }
+        _write_atomic(self.manifest_file, json.dumps(manifest, indent=2).encode())
+
+    def _content_file(self, sha256: str) -> pl.Path:
+        return self.cache_dir / f"{sha256}.yml"
+
+    def get(self, cpac_sha: str, config_id: str, template: str) -> str | None:
+        """Returns the cached expanded YAML, or None if it is missing or fails the integrity check"""
+        entry = self._entries.get(self.key(cpac_sha, config_id, template))
+        if entry is None:
+            return None
+        try:
+            content = self._content_file(entry.sha256).read_bytes()
+        except OSError:
+            return None
+        if _sha256(content) != entry.sha256:
+            return None
+        return content.decode("utf-8")
+
+    def put(self, cpac_sha: str, config_id: str, template: str, content: str) -> None:
+        """Stores an expanded YAML and records it in the manifest"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        data = content.encode("utf-8")
+        sha256 = _sha256(data)
+        _write_atomic(self._content_file(sha256), data)
+        self._entries[self.key(cpac_sha, config_id, template)] = CachedPreset(
+            cpac_sha=cpac_sha,
+            config_id=config_id,
+            template=template,
+            sha256=sha256,
+        )
+        self._write_manifest()
@@ -0,0 +1,159 @@
+"""Per-stage and per-pipeline timing and memory instrumentation."""
+
+import contextlib
+import json
+import pathlib as pl
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import cProfile
+
+PROFILE_REPORT_VERSION = 1
+"""Version of the profile report format"""
+
+
+@dataclass
+class StageStats:
+    """Time (and memory) spent in a stage, added up over all its calls"""
+
+    wall: float = 0.0
+    """Wall time in seconds"""
+    cpu: float = 0.0
+    """CPU time of the process in seconds"""
+    calls: int = 0
+    peak_memory_bytes: int | None = None
+    """Peak of the memory allocated during a call (if memory is traced)"""
+
+    def add(self, other: "StageStats") -> None:
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.calls += other.calls
+        if other.peak_memory_bytes is not None:
+            self.peak_memory_bytes = max(self.peak_memory_bytes or 0, other.peak_memory_bytes)
+
+
+def _max_rss_bytes() -> int | None:
+    """Peak resident memory of the process (None where it is not available, e.g. on Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+@dataclass
+class Profiler:
+    """
+    Records the wall and CPU time of stages (and of the stages of each pipeline).
+
+    With `trace_memory`, the peak memory of each stage is traced with `tracemalloc`
+    (which slows everything down). Stages in `cprofile_stages` are run under cProfile
+    and their statistics written to `<cprofile_prefix>.<stage>.prof`.
+    A disabled profiler records nothing and costs (almost) nothing.
+    """
+
+    enabled: bool = True
+    trace_memory: bool = False
+    cprofile_stages: Iterable[str] = ()
+    cprofile_prefix: pl.Path = pl.Path("gen192_profile")
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    """Stats by stage name, in order of first use (pipeline stages are added up over all pipelines)"""
+    pipelines: dict[str, dict[str, StageStats]] = field(default_factory=dict)
+    """Stats of the stages of each pipeline"""
+    _peaks: list[int] = field(default_factory=list, init=False, repr=False)
+    _profiles: dict[str, "cProfile.Profile"] = field(default_factory=dict, init=False, repr=False)
+    _profiling: bool = field(default=False, init=False, repr=False)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, pipeline: str | None = None) -> Iterator[None]:
+        """Records the time spent in the `with` block as a stage (of a pipeline)"""
+        if not self.enabled:
+            yield
+            return
+
+        if self.trace_memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # The peak is reset for this stage, the enclosing stage keeps its peak so far
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+
+        profile = None
+        if name in self.cprofile_stages and not self._profiling:
+            import cProfile
+
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stats = StageStats(wall=time.perf_counter() - wall, cpu=time.process_time() - cpu, calls=1)
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            if self.trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                stats.peak_memory_bytes = peak
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self.add(name, stats, pipeline)
+
+    def add(self, name: str, stats: StageStats, pipeline: str | None = None) -> None:
+        """Adds stats of a stage (e.g. recorded in a worker process)"""
+        self.stages.setdefault(name, StageStats()).add(stats)
+        if pipeline is not None:
+            self.pipelines.setdefault(pipeline, {}).setdefault(name, StageStats()).add(stats)
+
+    def report(self) -> dict:
+        """Machine-readable report of all recorded stats"""
+        report: dict = {"version": PROFILE_REPORT_VERSION}
+        max_rss = _max_rss_bytes()
+        if max_rss is not None:
+            report["max_rss_bytes"] = max_rss
+        return {
+            **report,
+            "stages": {name: asdict(stats) for name, stats in self.stages.items()},
+            "pipelines": {
+                pipeline: {name: asdict(stats) for name, stats in stages.items()}
+                for pipeline, stages in self.pipelines.items()
+            },
+            "cprofile": {name: str(self._cprofile_file(name)) for name in self._profiles},
+        }
+
+    def _cprofile_file(self, stage: str) -> pl.Path:
+        return self.cprofile_prefix.with_name(f"{self.cprofile_prefix.name}.{stage.replace(' ', '_')}.prof")
+
+    def save(self, file: pl.Path) -> None:
+        """Writes the report as JSON, and the cProfile statistics next to it"""
+        for name, profile in self._profiles.items():
+            profile.dump_stats(self._cprofile_file(name))
+        with open(file, "w", encoding="utf-8") as handle:
+            json.dump(self.report(), handle, indent=2)
+
+    def summary(self, slowest_pipelines: int = 5) -> str:
+        """Table of the time spent per stage, and the slowest pipelines"""
+        lines = [f"{'stage':<28}{'calls':>7}{'wall':>11}{'cpu':>11}{'peak memory':>14}"]
+        for name, stats in self.stages.items():
+            memory = f"{stats.peak_memory_bytes / 2**20:>11.1f}MiB" if stats.peak_memory_bytes is not None else ""
+            lines.append(f"{name:<28}{stats.calls:>7}{stats.wall:>10.3f}s{stats.cpu:>10.3f}s{memory}")
+        slowest = sorted(
+            self.pipelines.items(), key=lambda item: sum(stats.wall for stats in item[1].values()), reverse=True
+        )
+        if slowest and slowest_pipelines:
+            lines.append("Slowest pipelines:")
+        for pipeline, stages in slowest[:slowest_pipelines]:
+            breakdown = ", ".join(f"{name} {stats.wall:.3f}s" for name, stats in stages.items())
+            lines.append(f"  {pipeline}: {breakdown}")
+        return "\n".join(lines)
@@ -0,0 +1,227 @@
+"""Declarative special-case fix-ups applied to generated pipelines."""
+
+import copy
+import pathlib as pl
+from collections.abc import Iterable, MutableMapping
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Literal
+
+from .serialization import serializer_for_file
+from .utils import canonical_hash, multi_del, multi_set
+
+if TYPE_CHECKING:
+    from .cli import PipelineCombination
+
+RuleKey = tuple[str, str, str]
+"""Base pipeline, perturbation pipeline and step name of a combination"""
+
+SPECIAL_CASES_DOC = "https://docs.google.com/document/d/1WyARU5wkkAd9VrT24Tc7xJWJf7CIGO29PY0IM4tdGgQ/edit?tab=t.0"
+"""Document explaining the special cases (rule references are search terms in it)"""
+
+
+@dataclass(frozen=True)
+class RuleMatcher:
+    """Combination a rule applies to"""
+
+    base: str
+    perturb: str
+    step: str
+
+    @property
+    def key(self) -> RuleKey:
+        return (self.base, self.perturb, self.step)
+
+
+@dataclass(frozen=True)
+class RuleOperation:
+    """Sets or deletes a single config value"""
+
+    op: Literal["set", "delete"]
+    path: tuple[str, ...]
+    value: Any = None
+
+    def apply(self, config: MutableMapping) -> None:
+        if self.op == "set":
+            multi_set(config, index=list(self.path), value=copy.deepcopy(self.value))
+        else:
+            multi_del(config, index=list(self.path))
+
+
+@dataclass(frozen=True)
+class SpecialCaseRule:
+    """Fix-up applied to the pipelines generated from specific combinations"""
+
+    name: str
+    matchers: tuple[RuleMatcher, ...]
+    operations: tuple[RuleOperation, ...]
+    reference: str | None = None
+    """Search term in `SPECIAL_CASES_DOC` explaining the rule"""
+
+    def hash(self) -> str:
+        return canonical_hash(asdict(self))
+
+
+@dataclass
+class RuleTable:
+    """
+    Special-case rules indexed by the combination they apply to, so looking up the
+    rules of a combination does not scan the whole table.
+    Rules matching the same combination are applied in table order.
+    """
+
+    rules: list[SpecialCaseRule]
+    _index: dict[RuleKey, list[SpecialCaseRule]] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        names = [rule.name for rule in self.rules]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate special-case rule names: {', '.join(duplicates)}")
+        self._index = {}
+        for rule in self.rules:
+            for key in dict.fromkeys(matcher.key for matcher in rule.matchers):
+                self._index.setdefault(key, []).append(rule)
+
+    def lookup(self, combi: "PipelineCombination") -> list[SpecialCaseRule]:
+        """Returns the rules applying to a combination"""
+        return self._index.get((combi.pipeline_id, combi.pipeline_perturb_id, combi.step.name), [])
+
+    def apply(self, config: MutableMapping, combi: "PipelineCombination") -> list[str]:
+        """Applies the rules of a combination to a config and returns the names of the rules that fired"""
+        fired = []
+        for rule in self.lookup(combi):
+            for operation in rule.operations:
+                operation.apply(config)
+            fired.append(rule.name)
+        return fired
+
+    def hash_for(self, combi: "PipelineCombination") -> str:
+        """Hash of the rules applying to a combination (changes only if one of them changes)"""
+        return canonical_hash([rule.hash() for rule in self.lookup(combi)])
+
+    def dead_rules(self, combis: Iterable["PipelineCombination"]) -> list[SpecialCaseRule]:
+        """Returns the rules that do not apply to any of the combinations"""
+        live = {id(rule) for combi in combis for rule in self.lookup(combi)}
+        return [rule for rule in self.rules if id(rule) not in live]
+
+
+def _rule_from_dict(data: dict) -> SpecialCaseRule:
+    operations = []
+    for operation in data.get("operations", []):
+        if "set" in operation:
+            operations.append(RuleOperation(op="set", path=tuple(operation["set"]), value=operation.get("value")))
+        elif "delete" in operation:
+            operations.append(RuleOperation(op="delete", path=tuple(operation["delete"])))
+        else:
+            raise ValueError(f'Special-case rule "{data["name"]}" has an operation without "set" or "delete"')
+    return SpecialCaseRule(
+        name=data["name"],
+        matchers=tuple(RuleMatcher(**matcher) for matcher in data.get("match", [])),
+        operations=tuple(operations),
+        reference=data.get("reference"),
+    )
+
+
+def load_rule_table(file: pl.Path) -> RuleTable:
+    """
+    Loads special-case rules from a YAML (or JSON) file of the form:
+
+        rules:
+          - name: overwrite-transform
+            reference: overwrite transform
+            match:
+              - {base: ABCD, perturb: RBC, step: Structural Registration}
+            operations:
+              - set: [registration_workflows, anatomical_registration, overwrite_transform, run]
+                value: true
+              - delete: [registration_workflows, anatomical_registration, overwrite_transform, using]
+    """
+    data = serializer_for_file(file).loads(file.read_text(encoding="utf-8"))
+    return RuleTable([_rule_from_dict(rule) for rule in data.get("rules") or []])
+
+
+def _set(path: list[str], value: Any) -> RuleOperation:  # noqa: ANN401
+    return RuleOperation(op="set", path=tuple(path), value=value)
+
+
+def _delete(path: list[str]) -> RuleOperation:
+    return RuleOperation(op="delete", path=tuple(path))
+
+
+DEFAULT_RULES: list[SpecialCaseRule] = [
+    # todo: sanity check all rules
+    SpecialCaseRule(
+        name="func-mask-in-native-space",
+        reference="apply_func_mask_in_native_space: false",
+        matchers=(
+            RuleMatcher("ABCD", "CCS", "Functional Registration"),
+            RuleMatcher("CCS", "ABCD", "Functional Masking"),
+        ),
+        operations=(_set(["functional_preproc", "func_masking", "apply_func_mask_in_native_space"], True),),
+    ),
+    # Disabled (only applies with nuisance correction, see "use_priors" and "lateral_ventricles_mask"):
+    # CCS / ABCD / Functional Masking:
+    #   set segmentation.tissue_segmentation.FSL-FAST.use_priors.run = False
+    #   set nuisance_corrections.2-nuisance_regrtession.lateral_ventricles_mask = None
+    SpecialCaseRule(
+        name="overwrite-transform-abcd-rbc",
+        reference="overwrite transform",
+        matchers=(RuleMatcher("ABCD", "RBC", "Structural Registration"),),
+        operations=(_set(["registration_workflows", "anatomical_registration", "overwrite_transform", "run"], True),),
+    ),
+    SpecialCaseRule(
+        name="func-masking-ccs-anatomical-refined",
+        reference="Anatomical_Resampled to CCS_Anatomical_Refined",
+        matchers=(
+            RuleMatcher("ABCD", "RBC", "Functional Registration"),
+            RuleMatcher("ABCD", "fMRIPrep", "Functional Registration"),
+            RuleMatcher("RBC", "ABCD", "Functional Masking"),
+        ),
+        # change from ["Anatomical_Resampled"]
+        operations=(_set(["functional_preproc", "func_masking", "using"], ["CCS_Anatomical_Refined"]),),
+    ),
+    SpecialCaseRule(
+        name="anatomical-registration-fsl",
+        reference="registration: using: ANTS",
+        matchers=(
+            RuleMatcher("ABCD", "fMRIPrep", "Structural Registration"),
+            RuleMatcher("CCS", "ABCD", "Structural Masking"),
+        ),
+        operations=(
+            # change from ["ANTS"]
+            _set(["registration_workflows", "anatomical_registration", "registration", "using"], ["FSL"]),
+            _set(["registration_workflows", "anatomical_registration", "overwrite_transform", "run"], True),
+        ),
+    ),
+    SpecialCaseRule(
+        name="overwrite-transform-masking",
+        reference="overwrite transform",
+        # Never applied: its condition required RBC / ABCD / Functional Masking *and*
+        # fMRIPrep / ABCD / Structural Masking at the same time
+        matchers=(),
+        operations=(_set(["registration_workflows", "anatomical_registration", "overwrite_transform", "run"], True),),
+    ),
+    SpecialCaseRule(
+        name="anatomical-registration-ants-rbc-ccs",
+        reference="overwrite transform",
+        matchers=(RuleMatcher("RBC", "CCS", "Structural Registration"),),
+        operations=(
+            # change from ["FSL"]
+            _set(["registration_workflows", "anatomical_registration", "registration", "using"], ["ANTS"]),
+        ),
+    ),
+    SpecialCaseRule(
+        name="anatomical-registration-ants-ccs",
+        # Never applied: its condition required fMRIPrep / CCS / Structural Registration *and*
+        # RBC / CCS / Structural Registration at the same time
+        matchers=(),
+        operations=(
+            _delete(["registration_workflows", "anatomical_registration", "overwrite_transform", "using"]),
+            # change from ["FSL"]
+            _set(["registration_workflows", "anatomical_registration", "registration", "using"], ["ANTS"]),
+        ),
+    ),
+]
+"""Special cases of the 192 pipelines (see `SPECIAL_CASES_DOC`)"""
+
+DEFAULT_RULE_TABLE = RuleTable(DEFAULT_RULES)
@@ -0,0 +1,80 @@
+"""Serialization of pipeline configs to and from text."""
+
+import functools
+import json
+import pathlib as pl
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from .overlay import materialize
+
+
+@functools.cache
+def _yaml_dumper_loader() -> tuple[type, type]:
+    """The fastest available YAML dumper and loader (PyYAML is only imported when needed, it is slow to import)"""
+    try:
+        from yaml import CSafeDumper as YamlDumper
+        from yaml import CSafeLoader as YamlLoader
+    except ImportError:  # PyYAML built without libyaml
+        from yaml import SafeDumper as YamlDumper  # type: ignore[assignment]
+        from yaml import SafeLoader as YamlLoader  # type: ignore[assignment]
+    return YamlDumper, YamlLoader
+
+
+@dataclass(frozen=True)
+class Serializer:
+    """A config file format"""
+
+    name: str
+    suffix: str
+    dumps: Callable[[Mapping], str]
+    loads: Callable[[str], Any]
+
+
+def _yaml_dumps(config: Mapping) -> str:
+    # Options pinned explicitly so the output stays byte-for-byte stable
+    import yaml
+
+    dumper, _ = _yaml_dumper_loader()
+    return yaml.dump(materialize(config), Dumper=dumper, default_flow_style=False, sort_keys=True)
+
+
+def _yaml_loads(text: str) -> Any:  # noqa: ANN401
+    import yaml
+
+    _, loader = _yaml_dumper_loader()
+    return yaml.load(text, Loader=loader)
+
+
+def _json_dumps(config: Mapping) -> str:
+    # Note: YAML 1.1 readers (like PyYAML, which C-PAC uses) read floats in exponent notation without a dot
+    # (e.g. 1e-07) as strings, so JSON output is meant for JSON tooling rather than for running C-PAC
+    return json.dumps(materialize(config), indent=2, sort_keys=True) + "\n"
+
+
+SERIALIZERS: dict[str, Serializer] = {
+    "yaml": Serializer(name="yaml", suffix=".yml", dumps=_yaml_dumps, loads=_yaml_loads),
+    "json": Serializer(name="json", suffix=".json", dumps=_json_dumps, loads=json.loads),
+}
+"""Available config formats by name"""
+
+
+def register_serializer(serializer: Serializer) -> None:
+    """Adds (or replaces) a config format"""
+    SERIALIZERS[serializer.name] = serializer
+
+
+def get_serializer(name: str) -> Serializer:
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown config format {name!r} (available: {', '.join(SERIALIZERS)})") from None
+
+
+def serializer_for_file(file: pl.Path) -> Serializer:
+    """Returns the format of a config file by its suffix (YAML if unknown)"""
+    for serializer in SERIALIZERS.values():
+        if file.suffix == serializer.suffix:
+            return serializer
+    return SERIALIZERS["yaml"]
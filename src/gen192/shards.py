@@ -0,0 +1,78 @@
+"""Manifests of builds that generate one shard of the pipelines."""
+
+import json
+import pathlib as pl
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+
+SHARD_MANIFEST_VERSION = 1
+"""Version of the shard manifest format"""
+
+SHARD_MANIFEST_FILE = "shard.json"
+"""File name of the shard manifest in a shard build directory"""
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parses a shard given as "K/N" (shard K of N, 1-based)"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f'Invalid shard "{value}", expected K/N (e.g. 1/4)') from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f'Invalid shard "{value}", K must be between 1 and N')
+    return index, count
+
+
+def shard_build_dir(index: int, count: int, root: pl.Path = pl.Path("shards")) -> pl.Path:
+    """Build directory of shard `index` (1-based) of `count`"""
+    return root / f"{index}-of-{count}"
+
+
+@dataclass
+class ShardManifest:
+    """Outputs of a build generating one shard of the pipelines"""
+
+    shard: int
+    """Number of the shard (1-based)"""
+    count: int
+    """Number of shards"""
+    total: int
+    """Number of pipelines over all shards"""
+    cpac_sha: str
+    output_format: str
+    folders: dict[str, list[str]] = field(default_factory=dict)
+    """Output files (without notes) by build folder, in the order they were generated"""
+    pipelines: dict[str, int] = field(default_factory=dict)
+    """Global number of each generated pipeline by file name"""
+
+    def save(self, build_dir: pl.Path) -> None:
+        with open(build_dir / SHARD_MANIFEST_FILE, "w", encoding="utf-8") as handle:
+            json.dump({"version": SHARD_MANIFEST_VERSION, **asdict(self)}, handle, indent=2)
+
+    @classmethod
+    def load(cls, build_dir: pl.Path) -> "ShardManifest":
+        with open(build_dir / SHARD_MANIFEST_FILE, "r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        if manifest.pop("version", None) != SHARD_MANIFEST_VERSION:
+            raise ValueError(f"Unsupported shard manifest in {build_dir}")
+        return cls(**manifest)
+
+
+def check_shards_complete(manifests: Sequence[ShardManifest]) -> None:
+    """Raises a ValueError unless the shards are all shards of the same build, each exactly once"""
+    if not manifests:
+        raise ValueError("No shards to merge")
+    first = manifests[0]
+    for manifest in manifests:
+        settings = (manifest.count, manifest.total, manifest.cpac_sha, manifest.output_format)
+        if settings != (first.count, first.total, first.cpac_sha, first.output_format):
+            raise ValueError(f"Shard {manifest.shard}/{manifest.count} was built with different settings")
+
+    shards = sorted(manifest.shard for manifest in manifests)
+    if shards != list(range(1, first.count + 1)):
+        missing = sorted(set(range(1, first.count + 1)) - set(shards))
+        raise ValueError(f"Expected shards 1 to {first.count} once each (missing: {missing}, found: {shards})")
+
+    numbers = sorted(num for manifest in manifests for num in manifest.pipelines.values())
+    if numbers != list(range(first.total)):
+        raise ValueError(f"Shards do not cover pipelines 0 to {first.total - 1} exactly once")
@@ -0,0 +1,105 @@
+"""Index of the source config snippets that pipeline steps merge."""
+
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from .structdiff import MISSING
+from .utils import canonical_hash, canonical_json
+
+if TYPE_CHECKING:
+    from .cli import PipelineCombination, PipelineConfig, PipelineStep
+    from .rules import RuleTable
+
+
+@dataclass(frozen=True)
+class Snippet:
+    """A subtree of a source config at a merge path"""
+
+    value: Any
+    """The subtree (None if the path does not exist, like `multi_get`)"""
+    hash: str | None
+    """Canonical hash of the subtree (None if the path does not exist)"""
+    size: int
+    """Length of the canonical JSON of the subtree"""
+
+
+class SnippetIndex:
+    """
+    The snippets of all source configs at the merge paths of pipeline steps,
+    with their canonical hashes and sizes, computed once per config and merge path.
+
+    The merge paths of `steps` are indexed up front, any other merge path the first
+    time it is looked up (so combinations of any step can be looked up).
+
+    Answers which perturbations are no-ops and which combinations generate identical
+    configs (apart from their name) without generating them.
+    """
+
+    def __init__(self, configs: Mapping[str, "PipelineConfig"], steps: Iterable["PipelineStep"] = ()) -> None:
+        self._configs = configs
+        self._snippets: dict[tuple[str, tuple], Snippet] = {}
+        merge_paths = {tuple(merge_path) for step in steps for merge_path in step.merge_paths}
+        for name in configs:
+            for path in merge_paths:
+                self._index(name, path)
+
+    def _index(self, config_name: str, path: tuple) -> Snippet:
+        hashes = self._configs[config_name].subtree_hashes()
+        value = hashes.get(path)
+        if value is MISSING:
+            snippet = Snippet(value=None, hash=None, size=0)
+        else:
+            snippet = Snippet(value=value, hash=hashes.hash(path), size=len(canonical_json(value)))
+        self._snippets[(config_name, path)] = snippet
+        return snippet
+
+    def get(self, config_name: str, merge_path: Sequence) -> Snippet:
+        path = tuple(merge_path)
+        snippet = self._snippets.get((config_name, path))
+        return snippet if snippet is not None else self._index(config_name, path)
+
+    def changes(self, combi: "PipelineCombination") -> list[tuple[tuple, str | None]]:
+        """
+        Returns the merge paths a combination changes in its base config, each with
+        the hash of the merged snippet (None if the path is deleted because the
+        perturbation config does not have it).
+        """
+        changes: list[tuple[tuple, str | None]] = []
+        for merge_path in combi.step.merge_paths:
+            base = self.get(combi.pipeline_id, merge_path)
+            perturb = self.get(combi.pipeline_perturb_id, merge_path)
+            if perturb.value is None:
+                if base.hash is not None:
+                    changes.append((tuple(merge_path), None))
+            elif perturb.hash != base.hash:
+                changes.append((tuple(merge_path), perturb.hash))
+        return changes
+
+    def is_noop(self, combi: "PipelineCombination") -> bool:
+        """Whether merging the perturbation step leaves the base config unchanged"""
+        return not self.changes(combi)
+
+    def equivalence_key(self, combi: "PipelineCombination", rules: "RuleTable") -> str:
+        """
+        Hash that is equal for combinations generating identical configs (apart from the
+        pipeline name): same base config, merged snippets, settings and special-case operations.
+        """
+        return canonical_hash(
+            [
+                combi.pipeline_id,
+                sorted(self.changes(combi)),
+                combi.connectivity_method,
+                combi.use_nuisance_correction,
+                [[op.op, op.path, op.value] for rule in rules.lookup(combi) for op in rule.operations],
+            ]
+        )
+
+    def equivalence_classes(
+        self, combis: Iterable[tuple[int, "PipelineCombination"]], rules: "RuleTable"
+    ) -> list[list[int]]:
+        """Groups numbered combinations by the config they generate (in order of their first pipeline)"""
+        classes: dict[str, list[int]] = {}
+        for pipeline_num, combi in combis:
+            classes.setdefault(self.equivalence_key(combi, rules), []).append(pipeline_num)
+        return list(classes.values())
@@ -0,0 +1,146 @@
+"""Structural hashes and path-level diffs of nested configs."""
+
+import hashlib
+import json
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from .utils import canonical_json
+
+
+class _Missing:
+    """Marks a path that does not exist in a config"""
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+MISSING: Any = _Missing()
+
+
+def _lookup(root: Any, path: Sequence) -> Any:  # noqa: ANN401
+    node = root
+    for key in path:
+        if not isinstance(node, Mapping) or key not in node:
+            return MISSING
+        node = node[key]
+    return node
+
+
+def _key_json(key: Any) -> str:  # noqa: ANN401
+    return json.dumps(key)
+
+
+class SubtreeHashes:
+    """
+    Canonical hashes of all subtrees of a config, computed at most once per subtree.
+
+    A mapping is hashed from the sorted keys and the hashes of its values (so hashing
+    a subtree also hashes, and caches, everything below it), any other value from its
+    canonical JSON. Equal hashes mean equal canonical JSON, independently of key order.
+
+    The config must not be modified while its hashes are in use.
+    """
+
+    def __init__(self, config: Any) -> None:  # noqa: ANN401
+        self.config = config
+        self._hashes: dict[tuple, str] = {}
+
+    def get(self, path: Sequence = ()) -> Any:  # noqa: ANN401
+        """Returns the value at a path (`MISSING` if the path does not exist)"""
+        return _lookup(self.config, path)
+
+    def hash(self, path: Sequence = ()) -> str | None:
+        """Returns the hash of the subtree at a path (None if the path does not exist)"""
+        path = tuple(path)
+        if path in self._hashes:
+            return self._hashes[path]
+        value = self.get(path)
+        if value is MISSING:
+            return None
+        return self._hash(value, path)
+
+    def _hash(self, value: Any, path: tuple) -> str:  # noqa: ANN401
+        cached = self._hashes.get(path)
+        if cached is not None:
+            return cached
+        if isinstance(value, Mapping):
+            items = sorted((_key_json(key), self._hash(item, path + (key,))) for key, item in value.items())
+            content = "{" + ",".join(f"{key}:{item}" for key, item in items) + "}"
+        else:
+            content = canonical_json(value)
+        digest = self._hashes[path] = hashlib.sha1(content.encode()).hexdigest()
+        return digest
+
+
+def subtree_hash(value: Any) -> str:  # noqa: ANN401
+    """Canonical hash of a config value (see `SubtreeHashes`)"""
+    return SubtreeHashes(value)._hash(value, ())
+
+
+@dataclass(frozen=True)
+class Change:
+    """A value that differs between two configs"""
+
+    path: tuple
+    old: Any = MISSING
+    """Value before the change (`MISSING` if it was added)"""
+    new: Any = MISSING
+    """Value after the change (`MISSING` if it was removed)"""
+
+    def format(self, max_value_length: int = 80) -> str:
+        def value(obj: Any) -> str:  # noqa: ANN401
+            text = canonical_json(obj)
+            return text if len(text) <= max_value_length else text[: max_value_length - 3] + "..."
+
+        path = ".".join(str(key) for key in self.path)
+        if self.old is MISSING:
+            return f"+ {path}: {value(self.new)}"
+        if self.new is MISSING:
+            return f"- {path}"
+        return f"~ {path}: {value(self.old)} -> {value(self.new)}"
+
+
+def diff(old: SubtreeHashes | Any, new: SubtreeHashes | Any, path: Sequence = ()) -> list[Change]:  # noqa: ANN401
+    """
+    Returns the leaf-level changes from `old` to `new` below a path.
+    Subtrees with equal hashes are skipped, so diffing configs with cached hashes
+    (`SubtreeHashes`) only walks the parts that differ.
+    """
+    old = old if isinstance(old, SubtreeHashes) else SubtreeHashes(old)
+    new = new if isinstance(new, SubtreeHashes) else SubtreeHashes(new)
+    changes: list[Change] = []
+    _diff(old, new, old.get(path), new.get(path), tuple(path), changes)
+    return changes
+
+
+def _diff(
+    old: SubtreeHashes,
+    new: SubtreeHashes,
+    old_value: Any,  # noqa: ANN401
+    new_value: Any,  # noqa: ANN401
+    path: tuple,
+    changes: list[Change],
+) -> None:
+    if old_value is MISSING and new_value is MISSING:
+        return
+    if old_value is not MISSING and new_value is not MISSING:
+        if old._hash(old_value, path) == new._hash(new_value, path):
+            return
+        if isinstance(old_value, Mapping) and isinstance(new_value, Mapping):
+            for key in old_value:
+                _diff(old, new, old_value[key], new_value.get(key, MISSING), path + (key,), changes)
+            for key in new_value:
+                if key not in old_value:
+                    _diff(old, new, MISSING, new_value[key], path + (key,), changes)
+            return
+    changes.append(Change(path=path, old=old_value, new=new_value))
+
+
+def format_changes(changes: Sequence[Change], limit: int = 50) -> str:
+    """Formats changes one per line (at most `limit` of them)"""
+    lines = [change.format() for change in changes[:limit]]
+    if len(changes) > limit:
+        lines.append(f"... and {len(changes) - limit} more changes")
+    return "\n".join(lines)
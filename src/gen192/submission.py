@@ -0,0 +1,280 @@
+"""Submission of generated pipelines as C-PAC jobs, overlapping with their generation."""
+
+import asyncio
+import contextlib
+import json
+import pathlib as pl
+import queue
+import shlex
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Protocol
+
+from .utils import print_warning
+
+if TYPE_CHECKING:
+    from .cli import PipelineConfig
+
+
+class Executor(Protocol):
+    """Backend running a job per pipeline config file"""
+
+    async def submit(self, name: str, config_file: pl.Path) -> str:
+        """Submits the job of a pipeline and returns its job ID (raises if the submission failed)"""
+        ...
+
+
+async def _run_command(command: list[str]) -> tuple[int, str]:
+    """Runs a command and returns its process ID and output (raises if it fails)"""
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"{command[0]} exited with {process.returncode}: {stderr.decode().strip()}")
+    return process.pid, stdout.decode()
+
+
+@dataclass
+class LocalExecutor:
+    """
+    Runs a command per pipeline in a local subprocess (the job is done when it exits).
+    `{config}` and `{name}` in the command template are replaced by the (quoted)
+    config file and pipeline name, e.g. `"cpac run /data /outputs participant --pipeline_file {config}"`.
+    """
+
+    template: str
+
+    def command(self, name: str, config_file: pl.Path) -> list[str]:
+        return shlex.split(self.template.format(config=shlex.quote(str(config_file)), name=shlex.quote(name)))
+
+    async def submit(self, name: str, config_file: pl.Path) -> str:
+        pid, _ = await _run_command(self.command(name, config_file))
+        return f"local-{pid}"
+
+
+@dataclass
+class SlurmExecutor:
+    """Submits a batch script per pipeline with `sbatch`, which gets the config file as its argument"""
+
+    script: pl.Path
+    options: list[str] = field(default_factory=list)
+    """Additional `sbatch` options (e.g. `["--partition=compute", "--time=48:00:00"]`)"""
+    sbatch: str = "sbatch"
+
+    def command(self, name: str, config_file: pl.Path) -> list[str]:
+        return [self.sbatch, "--parsable", f"--job-name={name}", *self.options, str(self.script), str(config_file)]
+
+    async def submit(self, name: str, config_file: pl.Path) -> str:
+        _, output = await _run_command(self.command(name, config_file))
+        # --parsable prints "<job id>[;<cluster>]"
+        return output.strip().split(";")[0]
+
+
+SUBMISSION_STATUSES = ("submitted", "skipped", "failed")
+"""Outcomes of submitting a pipeline ("skipped" if it was submitted by a previous run)"""
+
+
+@dataclass
+class SubmissionResult:
+    """Outcome of submitting a pipeline"""
+
+    pipeline: str
+    config_file: str
+    status: str
+    """One of `SUBMISSION_STATUSES`"""
+    attempts: int = 0
+    job_id: str | None = None
+    error: str | None = None
+    time: float = field(default_factory=time.time)
+
+
+class SubmissionJournal:
+    """
+    Append-only log (JSON lines) of the submission of each pipeline, so the status of a
+    submission can be followed while it runs and a resumed run skips submitted pipelines
+    """
+
+    def __init__(self, file: pl.Path) -> None:
+        self.file = file
+
+    def results(self) -> Iterator[SubmissionResult]:
+        if not self.file.exists():
+            return
+        with open(self.file, "r", encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    yield SubmissionResult(**json.loads(line))
+
+    def submitted(self) -> dict[str, str]:
+        """Job IDs of the pipelines submitted so far, by pipeline name"""
+        return {
+            result.pipeline: result.job_id
+            for result in self.results()
+            if result.status == "submitted" and result.job_id is not None
+        }
+
+    def record(self, result: SubmissionResult) -> None:
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(asdict(result)) + "\n")
+
+
+def _name(item: "PipelineConfig | pl.Path") -> str:
+    return item.stem if isinstance(item, pl.Path) else item.name
+
+
+def _config_file(item: "PipelineConfig | pl.Path") -> pl.Path:
+    """Config file of a pipeline to submit, (re)written unless it has the current content of the pipeline"""
+    if isinstance(item, pl.Path):
+        return item
+    rendered = item.render()
+    if not item.file.is_file() or item.file.read_text(encoding="utf-8") != rendered.content:
+        rendered.write(exist_ok=True)
+    return item.file
+
+
+async def submit_pipelines(
+    pipelines: Iterable["PipelineConfig | pl.Path"],
+    executor: Executor,
+    concurrency: int = 4,
+    retries: int = 2,
+    retry_delay: float = 1.0,
+    journal: SubmissionJournal | None = None,
+) -> list[SubmissionResult]:
+    """
+    Submits pipelines as they are produced (e.g. by `generate`), with at most `concurrency`
+    submissions running at a time. The next pipeline is only taken from `pipelines` once a
+    submission is done, in a thread, so generating it overlaps with the running submissions.
+
+    Pipelines are written to their `file` first unless it has their current content (in a thread);
+    files of pipelines written before (e.g. by `main`) are submitted as they are. Failed submissions are retried
+    `retries` times (waiting `retry_delay` seconds times the attempt). Every outcome is
+    recorded in the `journal`, pipelines it lists as submitted are skipped.
+    """
+    submitted = journal.submitted() if journal is not None else {}
+    results: list[SubmissionResult] = []
+    slots = asyncio.Semaphore(concurrency)
+    iterator = iter(pipelines)
+
+    async def submit(name: str, item: "PipelineConfig | pl.Path") -> None:
+        try:
+            config_file = await asyncio.to_thread(_config_file, item)
+            result = SubmissionResult(pipeline=name, config_file=str(config_file), status="failed")
+            for attempt in range(1, retries + 2):
+                result.attempts = attempt
+                try:
+                    result.job_id = await executor.submit(name, config_file)
+                    result.status, result.error = "submitted", None
+                    print(f"> Submitted {name} (job {result.job_id})")
+                    break
+                except Exception as err:
+                    result.error = f"{type(err).__name__}: {err}"
+                    if attempt <= retries:
+                        await asyncio.sleep(retry_delay * attempt)
+            if result.status == "failed":
+                print_warning(f"Could not submit {name} after {result.attempts} attempts: {result.error}")
+            result.time = time.time()
+            results.append(result)
+            if journal is not None:
+                journal.record(result)
+        finally:
+            slots.release()
+
+    tasks = []
+    while True:
+        await slots.acquire()
+        item = await asyncio.to_thread(next, iterator, None)
+        if item is None:
+            slots.release()
+            break
+        name = _name(item)
+        if name in submitted:
+            print(f"> Already submitted: {name} (job {submitted[name]})")
+            results.append(SubmissionResult(pipeline=name, config_file="", status="skipped", job_id=submitted[name]))
+            slots.release()
+            continue
+        tasks.append(asyncio.create_task(submit(name, item)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+class BackgroundSubmitter:
+    """
+    Runs `submit_pipelines` in a background thread, fed from a bounded queue, so synchronous
+    code (like `main`) can hand over pipelines as it writes them:
+
+        with BackgroundSubmitter(executor) as submitter:
+            main(submit=submitter.put)
+        print(submitter.results)
+
+    `put` blocks while `concurrency` pipelines are waiting to be submitted.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        concurrency: int = 4,
+        retries: int = 2,
+        retry_delay: float = 1.0,
+        journal: SubmissionJournal | None = None,
+    ) -> None:
+        self.results: list[SubmissionResult] = []
+        self._queue: queue.Queue[PipelineConfig | pl.Path | None] = queue.Queue(maxsize=concurrency)
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._run, args=(executor, concurrency, retries, retry_delay, journal), daemon=True
+        )
+
+    def _run(
+        self,
+        executor: Executor,
+        concurrency: int,
+        retries: int,
+        retry_delay: float,
+        journal: SubmissionJournal | None,
+    ) -> None:
+        try:
+            self.results = asyncio.run(
+                submit_pipelines(
+                    iter(self._queue.get, None),
+                    executor,
+                    concurrency=concurrency,
+                    retries=retries,
+                    retry_delay=retry_delay,
+                    journal=journal,
+                )
+            )
+        except BaseException as err:
+            self._error = err
+
+    def _put(self, item: "PipelineConfig | pl.Path | None") -> None:
+        while True:
+            if self._error is not None:
+                raise RuntimeError("Pipeline submission failed") from self._error
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def put(self, item: "PipelineConfig | pl.Path") -> None:
+        self._put(item)
+
+    def __enter__(self) -> "BackgroundSubmitter":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *exc_info: object) -> None:
+        # Pipelines handed over so far are still submitted if the producer failed
+        with contextlib.suppress(RuntimeError):
+            self._put(None)
+        self._thread.join()
+        if self._error is not None and exc_type is None:
+            raise RuntimeError("Pipeline submission failed") from self._error
+
+    def summary(self) -> str:
+        counts = {status: sum(result.status == status for result in self.results) for status in SUBMISSION_STATUSES}
+        return ", ".join(f"{count} {status}" for status, count in counts.items())
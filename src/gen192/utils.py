@@ -1,7 +1,10 @@
 import base64
 import hashlib
+import json
 import os
 import re
+import sys
+from collections.abc import Mapping, MutableMapping
 from contextlib import contextmanager
 from typing import Any, Generator, Sequence
 
@@ -17,6 +20,13 @@ def cd(path: str | os.PathLike[str]) -> Generator[None, None, None]:
         os.chdir(old_wd)
 
 
+def extend_sys_path(paths: Sequence[str]) -> None:
+    """Appends paths to sys.path that are not in it yet (e.g. to make C-PAC importable in worker processes)"""
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+
+
 def filesafe(s: str, replacement: str = "-") -> str:
     """
     Converts a string to a file safe string.
@@ -31,26 +41,26 @@ def print_warning(msg: str) -> None:
     print(f"\033[93mWARNING: {msg}\033[0m")
 
 
-def multi_get(obj: dict, index: Sequence) -> Any | None:  # noqa: ANN401
+def multi_get(obj: Mapping, index: Sequence) -> Any | None:  # noqa: ANN401
     """
     Gets a value from a nested dictionary.
     Returns None if the path does not exist.
     """
     for i in index:
-        if not isinstance(obj, dict) or i not in obj:
+        if not isinstance(obj, Mapping) or i not in obj:
             return None
         obj = obj[i]
     return obj
 
 
-def multi_set(obj: dict, index: Sequence, value: Any) -> bool:  # noqa: ANN401
+def multi_set(obj: MutableMapping, index: Sequence, value: Any) -> bool:  # noqa: ANN401
     """
     Sets a value in a nested dictionary.
     Returns True if the path exists or was able to be created
     and the value was set.
     """
     for idx, i in enumerate(index):
-        if not isinstance(obj, dict):
+        if not isinstance(obj, MutableMapping):
             return False
 
         if idx == len(index) - 1:
@@ -64,14 +74,14 @@ def multi_set(obj: dict, index: Sequence, value: Any) -> bool:  # noqa: ANN401
     assert False
 
 
-def multi_del(obj: dict, index: Sequence) -> Any | None:  # noqa: ANN401
+def multi_del(obj: MutableMapping, index: Sequence) -> Any | None:  # noqa: ANN401
     """
     Deletes a value from a nested dictionary.
     Returns the value if the path exists and
     the value was deleted.
     """
     for idx, i in enumerate(index):
-        if not isinstance(obj, dict):
+        if not isinstance(obj, MutableMapping):
             return None
 
         if idx == len(index) - 1:
@@ -103,3 +113,26 @@ def b64_urlsafe_hash(s: str) -> str:
     Hashes a string and returns a base64 urlsafe encoded version of the hash.
     """
     return base64.urlsafe_b64encode(hashlib.sha1(s.encode()).digest()).decode().replace("=", "")
+
+
+def _canonical_json_default(obj: Any) -> Any:  # noqa: ANN401
+    if isinstance(obj, Mapping):
+        return dict(obj.items())
+    if isinstance(obj, tuple):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not supported in configs")
+
+
+def canonical_json(obj: Any) -> str:  # noqa: ANN401
+    """
+    Serializes a (nested) config value to a canonical JSON string
+    (sorted keys, no whitespace), also supporting non-dict mappings.
+    """
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=_canonical_json_default)
+
+
+def canonical_hash(obj: Any) -> str:  # noqa: ANN401
+    """
+    Hashes a (nested) config value independently of key order.
+    """
+    return hashlib.sha1(canonical_json(obj).encode()).hexdigest()
@@ -0,0 +1,79 @@
+"""Memoized validation of C-PAC configs."""
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Sequence
+
+from .cpac_config_extractor import check_cpac_config
+from .overlay import ConfigOverlay
+from .utils import canonical_hash, multi_del
+
+ValidationResult = tuple[bool, Exception | None]
+"""Whether a config is valid and the validation error if it is not"""
+
+VALIDATION_IGNORE_PATHS: list[list[str]] = [
+    ["pipeline_setup", "pipeline_name"],
+]
+"""
+Free-form config fields that do not affect whether a config is valid.
+They are left out when hashing a config, so configs differing only in these fields share one validation.
+"""
+
+
+@dataclass
+class ValidationStats:
+    """Counts validations answered from the cache (hits) and by C-PAC (misses)"""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.total if self.total else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.total} validations, {self.hits} cache hits ({self.hit_rate:.0%}), {self.misses} C-PAC runs"
+
+
+def _check_config(config: Mapping) -> ValidationResult:
+    return check_cpac_config(config)
+
+
+class ConfigValidator:
+    """
+    Validates C-PAC configs and memoizes the results by canonical config hash.
+
+    C-PAC validates a config as a whole (its schema has cross-section checks),
+    so results are reused for configs that are identical except for the fields
+    in `ignore_paths`, rather than per config section.
+    """
+
+    def __init__(self, ignore_paths: Sequence[Sequence[str]] = VALIDATION_IGNORE_PATHS) -> None:
+        self.ignore_paths = ignore_paths
+        self.stats = ValidationStats()
+        self._results: dict[str, ValidationResult] = {}
+
+    def config_hash(self, config: Mapping) -> str:
+        """Canonical hash of a config, excluding the ignored fields"""
+        view = ConfigOverlay(config)
+        for path in self.ignore_paths:
+            multi_del(view, index=path)
+        return canonical_hash(view)
+
+    def validate(self, config: Mapping, key: str | None = None) -> ValidationResult:
+        """
+        Validates a single config (or returns the memoized result).
+        `key` can identify the config instead of its hash, if it is known to be equal for
+        configs that only differ in the ignored fields (e.g. `SnippetIndex.equivalence_key`).
+        """
+        key = key if key is not None else self.config_hash(config)
+        if key in self._results:
+            self.stats.hits += 1
+            return self._results[key]
+        self.stats.misses += 1
+        result = self._results[key] = _check_config(config)
+        return result
@@ -36,3 +36,58 @@ def test_config() -> PipelineConfig:
         file=pl.Path(test_config_path),
         config=test_config,
     )
+
+
+def _synthetic_config(name: str, variant: int) -> dict:
+    """Small C-PAC-shaped config whose merge paths differ between variants"""
+    return {
+        "pipeline_setup": {"pipeline_name": name, "output_directory": {"path": "/outputs"}},
+        "anatomical_preproc": {"run": True, "brain_extraction": {"using": [f"tool{variant % 2}"]}},
+        "registration_workflows": {
+            "anatomical_registration": {
+                "T1w_brain_template_mask": f"/template/mask{variant}.nii.gz",
+                "registration": {"using": ["ANTS" if variant % 2 else "FSL"]},
+            },
+            "functional_registration": {
+                "coregistration": {"run": True, "reference": "mean", "cost": f"cost{variant}"},
+                "func_registration_to_template": {
+                    "target_template": {"T1_template": {"T1w_brain_template_mask_funcreg": f"/mask{variant}"}}
+                },
+            },
+        },
+        "functional_preproc": {"func_masking": {"using": [f"method{variant}"]}},
+        "timeseries_extraction": {"run": False, "connectivity_matrix": {"using": ["Nilearn"]}},
+        "surface_analysis": {"freesurfer": {"run_reconall": True}},
+    }
+
+
+@pytest.fixture
+def synthetic_configs(tmp_path: pl.Path) -> dict[str, PipelineConfig]:
+    """Offline stand-in for the expanded C-PAC source configs of all pipelines"""
+    from gen192.cli import PIPELINE_NAMES
+
+    return {
+        name: PipelineConfig(name=name, file=tmp_path / f"{name}.yml", config=_synthetic_config(name, variant))
+        for variant, name in enumerate(PIPELINE_NAMES)
+    }
+
+
+@pytest.fixture
+def offline_cpac(tmp_path: pl.Path, monkeypatch: pytest.MonkeyPatch) -> dict[str, dict]:
+    """
+    Runs the CLI in an empty working directory with synthetic source configs instead of
+    fetching and expanding C-PAC, and with validation stubbed out.
+    Returns the source configs by pipeline name, changes to them are picked up by later runs.
+    """
+    from gen192 import cli, validation
+
+    sources = {name: _synthetic_config(name, variant) for variant, name in enumerate(cli.PIPELINE_NAMES)}
+
+    def fake_expand(config_names_ids: dict[str, str], **kwargs: object) -> dict[str, str]:
+        return {config_name: yaml.dump(sources[config_name]) for config_name in config_names_ids}
+
+    monkeypatch.setattr(cli, "expand_cpac_configs", fake_expand)
+    monkeypatch.setattr(cli, "ensure_cpac_repo", lambda **kwargs: None)
+    monkeypatch.setattr(validation, "check_cpac_config", lambda config: (True, None))
+    monkeypatch.chdir(tmp_path)
+    return sources
@@ -0,0 +1,61 @@
+"""Test gen192.archive"""
+
+import pathlib as pl
+import zipfile
+
+import pytest
+
+from gen192.archive import REPRODUCIBLE_DATE_TIME, StreamingZipWriter
+
+
+def _write_archive(file: pl.Path, source_file: pl.Path, **kwargs: object) -> None:
+    with StreamingZipWriter(file, **kwargs) as archive:  # type: ignore[arg-type]
+        archive.write("a.yml", "a: 1\n")
+        archive.write("a.notes.txt", b"notes")
+        archive.write_file(source_file)
+
+
+class TestStreamingZipWriter:
+    @pytest.fixture
+    def source_file(self, tmp_path: pl.Path) -> pl.Path:
+        file = tmp_path / "b.yml"
+        file.write_text("b: 2\n")
+        return file
+
+    def test_contents(self, tmp_path: pl.Path, source_file: pl.Path) -> None:
+        file = tmp_path / "dist" / "out.zip"
+        _write_archive(file, source_file)
+
+        with zipfile.ZipFile(file) as archive:
+            assert archive.namelist() == ["a.yml", "a.notes.txt", "b.yml"]
+            assert archive.read("a.yml") == b"a: 1\n"
+            assert archive.read("b.yml") == b"b: 2\n"
+        assert list(file.parent.iterdir()) == [file]
+
+    def test_reproducible(self, tmp_path: pl.Path, source_file: pl.Path) -> None:
+        first, second = tmp_path / "first.zip", tmp_path / "second.zip"
+        _write_archive(first, source_file, reproducible=True)
+        source_file.touch()
+        _write_archive(second, source_file, reproducible=True)
+
+        assert first.read_bytes() == second.read_bytes()
+        with zipfile.ZipFile(first) as archive:
+            assert {info.date_time for info in archive.infolist()} == {REPRODUCIBLE_DATE_TIME}
+
+    def test_compresslevel(self, tmp_path: pl.Path) -> None:
+        content = "pipeline_setup: {}\n" * 1000
+        sizes = []
+        for level in (0, 9):
+            file = tmp_path / f"level{level}.zip"
+            with StreamingZipWriter(file, compresslevel=level) as archive:
+                archive.write("a.yml", content)
+            sizes.append(file.stat().st_size)
+        assert sizes[1] < sizes[0]
+
+    def test_abort_on_error(self, tmp_path: pl.Path) -> None:
+        file = tmp_path / "out.zip"
+        with pytest.raises(RuntimeError):
+            with StreamingZipWriter(file) as archive:
+                archive.write("a.yml", "a: 1\n")
+                raise RuntimeError("generation failed")
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,45 @@
+"""Smoke test of the benchmark scripts (so they keep working with the code they benchmark)"""
+
+import importlib.util
+import json
+import pathlib as pl
+import types
+
+BENCHMARKS_DIR = pl.Path(__file__).parent.parent / "benchmarks"
+
+
+def _load(name: str) -> types.ModuleType:
+    spec = importlib.util.spec_from_file_location(name, BENCHMARKS_DIR / f"{name}.py")
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_bench_generation(tmp_path: pl.Path) -> None:
+    bench = _load("bench_generation")
+    output = tmp_path / "results.json"
+
+    assert bench.main(["--size", "1", "--repeat", "1", "--output", str(output)]) == 0
+    results = json.loads(output.read_text())
+    assert set(results["results"]) == {
+        "clone",
+        "multi_helpers",
+        "settings_multi_helpers",
+        "settings_patch",
+        "merge_paths_multi_get",
+        "merge_paths_compiled",
+        "generate_pipeline_from_combi",
+        "yaml_dump",
+        "yaml_load",
+        "validation",
+        "zip",
+    }
+
+    assert (
+        bench.main(["--size", "1", "--repeat", "1", "--only", "zip", "--compare", str(output), "--threshold", "1e6"])
+        == 0
+    )
+    results["results"]["zip"]["seconds"] = 1e-9
+    output.write_text(json.dumps(results))
+    assert bench.main(["--size", "1", "--repeat", "1", "--only", "zip", "--compare", str(output)]) == 1
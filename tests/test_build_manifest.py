@@ -0,0 +1,54 @@
+"""Test gen192.build_manifest"""
+
+import pathlib as pl
+
+from gen192.build_manifest import BuildManifest
+
+
+def _write(file: pl.Path, content: str, notes: str | None, manifest: BuildManifest, input_hash: str) -> None:
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(content)
+    if notes is not None:
+        file.with_suffix(".notes.txt").write_text(notes)
+    manifest.record(file, input_hash, content, notes)
+
+
+class TestBuildManifest:
+    def test_is_current(self, tmp_path: pl.Path) -> None:
+        manifest = BuildManifest(tmp_path)
+        file = tmp_path / "gen" / "p000.yml"
+        assert not manifest.is_current(file, "inputs")
+
+        _write(file, "content", "notes", manifest, "inputs")
+        manifest.save()
+
+        reloaded = BuildManifest(tmp_path)
+        assert reloaded.is_current(file, "inputs")
+        assert not reloaded.is_current(file, "other inputs")
+        assert reloaded.is_current(file, "inputs", content="content")
+        assert not reloaded.is_current(file, "inputs", content="other content")
+
+    def test_modified_outputs_are_not_current(self, tmp_path: pl.Path) -> None:
+        manifest = BuildManifest(tmp_path)
+        file = tmp_path / "gen" / "p000.yml"
+        _write(file, "content", "notes", manifest, "inputs")
+
+        file.with_suffix(".notes.txt").unlink()
+        assert not manifest.is_current(file, "inputs")
+
+        _write(file, "content", None, manifest, "inputs")
+        file.write_text("modified")
+        assert not manifest.is_current(file, "inputs")
+
+    def test_prune(self, tmp_path: pl.Path) -> None:
+        manifest = BuildManifest(tmp_path)
+        kept, removed = tmp_path / "gen" / "p000.yml", tmp_path / "gen" / "p001.yml"
+        other_dir = tmp_path / "other" / "p001.yml"
+        for file in (kept, removed, other_dir):
+            _write(file, "content", "notes", manifest, "inputs")
+
+        assert manifest.prune(tmp_path / "gen", keep={kept}) == [removed]
+
+        assert kept.exists() and other_dir.exists()
+        assert not removed.exists() and not removed.with_suffix(".notes.txt").exists()
+        assert not manifest.is_current(removed, "inputs")
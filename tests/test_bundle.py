@@ -0,0 +1,97 @@
+"""Test gen192.bundle"""
+
+import json
+import pathlib as pl
+
+import pytest
+import yaml
+
+import gen192.cli as cli
+from gen192.bundle import BundleWriter, PipelineBundle
+from gen192.overlay import materialize
+
+
+def _write_bundle(file: pl.Path, configs: cli.ConfigLookupTable, space: cli.CombinationSpace) -> dict[int, dict]:
+    """Writes the pipelines of a space into a bundle and returns their configs by pipeline number"""
+    expected = {}
+    with BundleWriter(file, bases=configs) as bundle:
+        for (pipeline_num, combi), pipeline in zip(space.numbered(), cli.generate(configs, space=space)):
+            bundle.add(pipeline_num, pipeline, base=combi.pipeline_id)
+            expected[pipeline_num] = materialize(pipeline.config)
+    return expected
+
+
+def test_round_trip(synthetic_configs: cli.ConfigLookupTable, tmp_path: pl.Path) -> None:
+    space = cli.pipeline_combination_space(connectivity=True)
+    file = tmp_path / "dist" / "pipelines.bundle"
+    expected = _write_bundle(file, synthetic_configs, space)
+
+    with PipelineBundle(file) as bundle:
+        assert sorted(bundle) == sorted(expected)
+        for pipeline_num in reversed(list(expected)):
+            pipeline = bundle[pipeline_num]
+            assert materialize(pipeline.config) == expected[pipeline_num]
+            assert pipeline.file.name == space[pipeline_num].filename(pipeline_num)
+            assert pipeline.name == pipeline.config["pipeline_setup"]["pipeline_name"]
+        assert set(bundle._bases) == {combi.pipeline_id for combi in space}
+    assert list(file.parent.iterdir()) == [file]
+
+
+def test_stores_deltas(synthetic_configs: cli.ConfigLookupTable, tmp_path: pl.Path) -> None:
+    space = cli.pipeline_combination_space()
+    file = tmp_path / "pipelines.bundle"
+    _write_bundle(file, synthetic_configs, space)
+
+    with PipelineBundle(file) as bundle:
+        combi = space[0]
+        delta = bundle.delta(0)
+        assert 0 < len(delta.operations) < 20
+        assert any(path.keys == ("pipeline_setup", "pipeline_name") for _, path, _ in delta.operations)
+
+        # The source config is read once and is not modified by the pipelines applied to it
+        base = json.loads(json.dumps(bundle.base(combi.pipeline_id)))
+        bundle[0]
+        assert bundle.base(combi.pipeline_id) == base == materialize(synthetic_configs[combi.pipeline_id].config)
+        assert bundle.notes(0) == next(cli.generate(synthetic_configs, space=space)).notes
+
+
+def test_not_a_bundle(tmp_path: pl.Path) -> None:
+    file = tmp_path / "pipeline.yml"
+    file.write_text("pipeline_setup: {}\n")
+
+    with pytest.raises(ValueError, match="not a pipeline bundle"):
+        PipelineBundle(file)
+
+
+def test_failed_write_leaves_nothing(synthetic_configs: cli.ConfigLookupTable, tmp_path: pl.Path) -> None:
+    with pytest.raises(KeyError):
+        with BundleWriter(tmp_path / "pipelines.bundle", bases=synthetic_configs) as bundle:
+            bundle.add(0, next(cli.generate(synthetic_configs)), base="unknown")
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("dedupe", [False, True])
+def test_main_bundle_matches_build(offline_cpac: dict[str, dict], dedupe: bool) -> None:
+    cli.main(bundle=True, dedupe=dedupe)
+    dir_gen = pl.Path("build/gen192_nofork")
+    aliases = json.loads((dir_gen / cli.ALIAS_MAP_FILE).read_text()) if dedupe else {}
+
+    with PipelineBundle(pl.Path("dist/gen192_nofork.bundle")) as bundle:
+        assert len(bundle) == len(cli.pipeline_combination_space())
+        for pipeline_num in bundle:
+            pipeline = bundle[pipeline_num]
+            file = dir_gen / aliases.get(pipeline.file.name, pipeline.file.name)
+            expected = yaml.safe_load(file.read_text())
+            expected["pipeline_setup"]["pipeline_name"] = pipeline.name
+            assert materialize(pipeline.config) == expected
+            if pipeline.file.name not in aliases:
+                assert pipeline.notes == file.with_suffix(".notes.txt").read_text()
+
+
+def test_main_incremental_bundle(offline_cpac: dict[str, dict]) -> None:
+    cli.main(incremental=True, bundle=True)
+    first = pl.Path("dist/gen192_nofork.bundle").read_bytes()
+
+    cli.main(incremental=True, bundle=True)
+    assert pl.Path("dist/gen192_nofork.bundle").read_bytes() == first
@@ -1,18 +1,30 @@
 """Test gen192.cli"""
 
+import compileall
+import copy
 import itertools as it
+import json
 import os
 import pathlib as pl
 import random
 import shutil
+import subprocess
+import sys
 import tempfile
+import zipfile
 from typing import Any, Generator
 
 import pytest
+import yaml
 from pytest_mock import MockerFixture
 
 import gen192.cli as cli
-from gen192.utils import filesafe
+from gen192 import cpac_config_extractor, serialization, validation
+from gen192.preset_cache import PresetCache
+from gen192.profiling import Profiler
+from gen192.rules import DEFAULT_RULE_TABLE
+from gen192.structdiff import SubtreeHashes
+from gen192.utils import filesafe, multi_get, multi_set
 
 
 class TestPipelineConfig:
@@ -36,6 +48,18 @@ class TestPipelineConfig:
 
         assert pipeline_cfg == test_config
 
+    def test_subtree_hashes_follow_config(self, synthetic_configs: cli.ConfigLookupTable) -> None:
+        test_config = synthetic_configs["ABCD"]
+        hashes = test_config.subtree_hashes()
+        assert test_config.subtree_hashes() is hashes
+
+        test_config.config = {"pipeline_setup": {}}
+        assert test_config.subtree_hashes().config is test_config.config
+
+        test_config.config["pipeline_setup"]["pipeline_name"] = "changed"
+        test_config.reset_subtree_hashes()
+        assert test_config.subtree_hashes().hash() == SubtreeHashes(test_config.config).hash()
+
     def test_set_name(self, test_config: cli.PipelineConfig, new_name: str = "RandomPipeline") -> None:
         # Set up test pipeline config
         test_config.set_name(new_name)
@@ -75,7 +99,7 @@ def test_combi() -> cli.PipelineCombination:
         pipeline_id="1",
         pipeline_perturb_id="2",
         step=pipeline_step,
-        # connectivity_method="connectivity_method1",
+        connectivity_method="connectivity_method1",
         use_nuisance_correction=True,
     )
 
@@ -86,7 +110,7 @@ def test_combi_name(test_combi: cli.PipelineCombination) -> str:
         f"base-{filesafe(test_combi.pipeline_id)}_"
         f"perturb-{filesafe(test_combi.pipeline_perturb_id)}_"
         f"step-{filesafe(test_combi.step.name)}_"
-        # f"conn-{filesafe(test_combi.connectivity_method)}_"
+        f"conn-{filesafe(str(test_combi.connectivity_method))}_"
         f"nuisance-{filesafe(str(test_combi.use_nuisance_correction))}"
     )
 
@@ -173,6 +197,255 @@ class TestGeneratePipelineFromCombi:
 
         assert isinstance(pipeline, cli.PipelineConfig)
 
+    def test_connectivity_method(self, synthetic_configs: cli.ConfigLookupTable) -> None:
+        space = cli.pipeline_combination_space(connectivity=True)
+        afni, nilearn = (cli.generate_pipeline_from_combi(num, space[num], synthetic_configs) for num in range(2))
+
+        assert (space[0].connectivity_method, space[1].connectivity_method) == ("AFNI", "Nilearn")
+        assert afni.config["timeseries_extraction"]["connectivity_matrix"] == {"using": ["AFNI"]}
+        assert nilearn.config["timeseries_extraction"]["connectivity_matrix"] == {"using": ["Nilearn"]}
+
+    def test_generate_pipeline_from_combi_keeps_sources(self, synthetic_configs: cli.ConfigLookupTable) -> None:
+        sources = {name: pipeline.clone() for name, pipeline in synthetic_configs.items()}
+
+        for pipeline_num, combi in enumerate(cli.iter_pipeline_combis_no_duplicates()):
+            pipeline = cli.generate_pipeline_from_combi(pipeline_num, combi, synthetic_configs)
+            DEFAULT_RULE_TABLE.apply(pipeline.config, combi)
+            assert pipeline.config["pipeline_setup"]["pipeline_name"] == combi.name(pipeline_num)
+
+        for name, pipeline in synthetic_configs.items():
+            assert pipeline.config == sources[name].config
+
+
+class TestIterRenderedPipelines:
+    @pytest.fixture(autouse=True)
+    def skip_validation(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(validation, "check_cpac_config", lambda config: (True, None))
+
+    def test_parallel_matches_serial(
+        self,
+        synthetic_configs: cli.ConfigLookupTable,
+        tmp_path: pl.Path,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        tasks = list(enumerate(cli.iter_pipeline_combis_no_duplicates()))
+
+        context = cli.GenerationContext(configs=synthetic_configs, dir_gen=tmp_path)
+
+        serial = list(cli.iter_rendered_pipelines(tasks, context, jobs=1))
+        serial_out = capsys.readouterr().out
+        parallel = list(cli.iter_rendered_pipelines(tasks, context, jobs=3))
+        parallel_out = capsys.readouterr().out
+
+        assert len(serial) == len(tasks)
+        assert parallel == serial
+        assert parallel_out == serial_out
+        assert [rendered.file.name for rendered in parallel] == [combi.filename(num) for num, combi in tasks]
+
+    def test_json_format(self, synthetic_configs: cli.ConfigLookupTable, tmp_path: pl.Path) -> None:
+        tasks = list(enumerate(cli.iter_pipeline_combis_no_duplicates()))[:2]
+        context = cli.GenerationContext(
+            configs=synthetic_configs, dir_gen=tmp_path, serializer=serialization.get_serializer("json")
+        )
+
+        for rendered in cli.iter_rendered_pipelines(tasks, context):
+            assert rendered.file.suffix == ".json"
+            rendered.write()
+            loaded = cli.load_pipeline_config(rendered.file)
+            assert loaded.name == rendered.file.stem
+
+
+def _custom_step_space() -> cli.CombinationSpace[cli.PipelineCombination]:
+    """Space of a single pipeline step that is not one of `PIPELINE_STEPS`"""
+    step = cli.PipelineStep(name="Surface Analysis", merge_paths=[["surface_analysis"], ["anatomical_preproc"]])
+    return cli.CombinationSpace(
+        [
+            cli.Axis("pipeline_id", list(cli.PIPELINE_NAMES)),
+            cli.Axis("pipeline_perturb_id", list(cli.PIPELINE_NAMES)),
+            cli.Axis("step", [step]),
+        ],
+        cli.PipelineCombination,
+    )
+
+
+class TestGenerate:
+    def test_custom_step(self, synthetic_configs: cli.ConfigLookupTable) -> None:
+        space = _custom_step_space()
+
+        generated = list(cli.generate(synthetic_configs, space=space))
+
+        assert len(generated) == len(space)
+        for combi, pipeline in zip(space, generated):
+            perturb = synthetic_configs[combi.pipeline_perturb_id].config
+            assert pipeline.config["anatomical_preproc"] == perturb["anatomical_preproc"]
+
+    def test_matches_main(self, offline_cpac: dict[str, dict]) -> None:
+        cli.main()
+        configs = {
+            config_name: cli.load_pipeline_config(
+                next(pl.Path("build").glob(f"cpac_source_configs_*/{filesafe(config_name)}.yml"))
+            )
+            for config_name in cli.PIPELINE_NAMES
+        }
+        dir_gen = pl.Path("build") / "gen192_nofork"
+
+        generated = list(cli.generate(configs, validate=True, directory=dir_gen))
+
+        assert [pipeline.file for pipeline in generated] == sorted(dir_gen.glob("*.yml"))
+        for pipeline in generated:
+            assert pipeline.render().content == pipeline.file.read_text()
+
+    def test_source_changes_between_calls(self, synthetic_configs: cli.ConfigLookupTable) -> None:
+        space = cli.pipeline_combination_space()[:1]
+        combi = space[0]
+        assert "is identical to target" not in str(next(cli.generate(synthetic_configs, space=space)).notes)
+
+        base, perturb = synthetic_configs[combi.pipeline_id].config, synthetic_configs[combi.pipeline_perturb_id].config
+        for merge_path in combi.step.merge_paths:
+            multi_set(perturb, index=merge_path, value=copy.deepcopy(multi_get(base, index=merge_path)))
+
+        assert "is identical to target" in str(next(cli.generate(synthetic_configs, space=space)).notes)
+
+    def test_lazy_without_disk(
+        self,
+        synthetic_configs: cli.ConfigLookupTable,
+        tmp_path: pl.Path,
+        monkeypatch: pytest.MonkeyPatch,
+        capsys: pytest.CaptureFixture[str],
+    ) -> None:
+        monkeypatch.chdir(tmp_path)
+        space = cli.pipeline_combination_space(connectivity=True)
+        pipelines = cli.generate(synthetic_configs, space=space)
+
+        first = next(pipelines)
+        assert first.name == first.file.stem == space[0].name(0)
+        assert capsys.readouterr().out.count("> Generating") == 1
+        assert list(tmp_path.iterdir()) == []
+
+    def test_dedupe(self, synthetic_configs: cli.ConfigLookupTable) -> None:
+        space = cli.pipeline_combination_space(connectivity=True)
+        aliases = cli.pipeline_aliases(
+            space, cli.SnippetIndex(synthetic_configs, cli.PIPELINE_STEPS), DEFAULT_RULE_TABLE
+        )
+
+        generated = [pipeline.file.name for pipeline in cli.generate(synthetic_configs, space=space, dedupe=True)]
+
+        assert generated == [
+            combi.filename(num) for num, combi in space.numbered() if combi.filename(num) not in aliases
+        ]
+
+
+class TestMainArchives:
+    def test_archives_match_build(self, offline_cpac: dict[str, dict]) -> None:
+        cli.main()
+
+        for folder in pl.Path("build").iterdir():
+            if not folder.is_dir():
+                continue
+            with zipfile.ZipFile(pl.Path("dist") / f"{folder.name}.zip") as archive:
+                assert sorted(archive.namelist()) == sorted(file.name for file in folder.iterdir())
+                for file in folder.iterdir():
+                    assert archive.read(file.name) == file.read_bytes()
+
+    def test_reproducible_archives(self, offline_cpac: dict[str, dict]) -> None:
+        cli.main(reproducible_zip=True)
+        first = {file.name: file.read_bytes() for file in pl.Path("dist").iterdir()}
+
+        cli.main(force=True, reproducible_zip=True, jobs=2)
+        assert {file.name: file.read_bytes() for file in pl.Path("dist").iterdir()} == first
+
+
+class TestMainIncremental:
+    def test_second_run_skips_everything(
+        self, offline_cpac: dict[str, dict], capsys: pytest.CaptureFixture[str]
+    ) -> None:
+        cli.main(incremental=True)
+        first_out = capsys.readouterr().out
+        assert "Up to date" not in first_out
+        zips = {path: path.stat().st_mtime_ns for path in pl.Path("dist").glob("*.zip")}
+        assert len(zips) == 3
+
+        cli.main(incremental=True)
+        second_out = capsys.readouterr().out
+        assert "> Generating" not in second_out
+        assert "Config validation: 0 validations" in second_out
+        assert {path: path.stat().st_mtime_ns for path in pl.Path("dist").glob("*.zip")} == zips
+
+    def test_code_hash_covers_all_modules(self, tmp_path: pl.Path) -> None:
+        package_dir = pl.Path(cli.__file__).parent
+
+        def code_hash(archive: pl.Path, changed_module: str | None = None) -> str:
+            with zipfile.ZipFile(archive, "w") as bundle:
+                for file in sorted(package_dir.glob("*.py")):
+                    content = file.read_text()
+                    bundle.writestr(
+                        f"gen192/{file.name}", content + ("\n# changed\n" if file.stem == changed_module else "")
+                    )
+            return code_hash_in(archive)
+
+        def code_hash_in(path: pl.Path) -> str:
+            code = "import gen192.cli as cli; print(cli._generation_code_hash())"
+            env = {**os.environ, "PYTHONPATH": str(path)}
+            return subprocess.run(
+                [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+            ).stdout.strip()
+
+        # Works without source files on disk (e.g. from a zipapp)
+        original = code_hash(tmp_path / "original.zip")
+        assert original == code_hash(tmp_path / "same.zip")
+        assert code_hash(tmp_path / "structdiff.zip", changed_module="structdiff") != original
+        assert code_hash(tmp_path / "serialization.zip", changed_module="serialization") != original
+
+        # Works with bytecode only
+        bytecode_dir = tmp_path / "bytecode"
+        shutil.copytree(package_dir, bytecode_dir / "gen192", ignore=shutil.ignore_patterns("__pycache__"))
+        compileall.compile_dir(bytecode_dir, legacy=True, quiet=1)
+        for file in bytecode_dir.rglob("*.py"):
+            file.unlink()
+        assert code_hash_in(bytecode_dir)
+
+    def test_changed_inputs_are_regenerated(
+        self, offline_cpac: dict[str, dict], capsys: pytest.CaptureFixture[str]
+    ) -> None:
+        cli.main(incremental=True)
+        capsys.readouterr()
+
+        offline_cpac["RBC"]["anatomical_preproc"]["run"] = False
+        tampered = next(pl.Path("build/gen192_nofork").glob("*base-abcd*.yml"))
+        tampered.write_text("tampered")
+        cli.main(incremental=True)
+        out = capsys.readouterr().out
+
+        regenerated = {line.split()[-1] for line in out.splitlines() if line.startswith("> Generating")}
+        expected = {
+            combi.filename(num)
+            for num, combi in enumerate(cli.iter_pipeline_combis_no_duplicates())
+            if "RBC" in (combi.pipeline_id, combi.pipeline_perturb_id)
+        } | {tampered.name}
+        assert regenerated == expected
+        assert "> Generated pipeline RBC" in out
+        assert tampered.read_text() != "tampered"
+        with zipfile.ZipFile("dist/gen192_nofork.zip") as archive:
+            for file in pl.Path("build/gen192_nofork").iterdir():
+                assert archive.read(file.name) == file.read_bytes()
+
+    def test_unchanged_source_configs_are_not_rewritten(self, offline_cpac: dict[str, dict]) -> None:
+        cli.main(incremental=True)
+        source_files = list(pl.Path("build").glob("cpac_source_configs_*/*.yml"))
+        written = {file: file.stat().st_mtime_ns for file in source_files}
+
+        offline_cpac["RBC"]["anatomical_preproc"]["run"] = False
+        cli.main(incremental=True)
+
+        rewritten = [file for file in source_files if file.stat().st_mtime_ns != written[file]]
+        assert [file.name for file in rewritten] == [filesafe("RBC") + ".yml"]
+        assert yaml.safe_load(rewritten[0].read_text()) == offline_cpac["RBC"]
+
+    def test_not_incremental_refuses_overwrite(self, offline_cpac: dict[str, dict]) -> None:
+        cli.main()
+        with pytest.raises(FileExistsError):
+            cli.main()
+
 
 class TestMain:
     def test_main(self, capsys: Generator[pytest.CaptureFixture[str], None, None]) -> None:
@@ -189,3 +462,201 @@ class TestMain:
             "> Generating",
         ]:
             assert msg in captured
+
+
+class TestMainShards:
+    def test_merged_shards_match_unsharded_build(self, offline_cpac: dict[str, dict]) -> None:
+        for index in range(1, 4):
+            cli.main(shard=(index, 3), reproducible_zip=True)
+        assert not pl.Path("dist").exists()
+
+        cli.merge_shards(reproducible_zip=True)
+        merged = {file.name: file.read_bytes() for file in pl.Path("dist").iterdir()}
+        merged_build = {file: file.read_bytes() for file in pl.Path("build").rglob("*") if file.is_file()}
+
+        cli.main(force=True, reproducible_zip=True)
+        assert {file.name: file.read_bytes() for file in pl.Path("dist").iterdir()} == merged
+        assert {file: file.read_bytes() for file in pl.Path("build").rglob("*") if file.is_file()} == merged_build
+
+    def test_merged_build_is_up_to_date(
+        self, offline_cpac: dict[str, dict], capsys: pytest.CaptureFixture[str]
+    ) -> None:
+        for index in range(1, 3):
+            cli.main(shard=(index, 2))
+        cli.merge_shards()
+        capsys.readouterr()
+
+        cli.main(incremental=True)
+        assert "> Generating" not in capsys.readouterr().out
+
+    def test_merge_missing_shard(self, offline_cpac: dict[str, dict]) -> None:
+        cli.main(shard=(1, 2))
+        with pytest.raises(ValueError, match=r"missing: \[2\]"):
+            cli.merge_shards()
+
+
+class TestMainDedupe:
+    def test_aliases_are_identical_to_their_canonical_pipeline(
+        self, offline_cpac: dict[str, dict], capsys: pytest.CaptureFixture[str]
+    ) -> None:
+        cli.main()
+        full = {file.name: yaml.safe_load(file.read_text()) for file in pl.Path("build/gen192_nofork").glob("*.yml")}
+        for config in full.values():
+            del config["pipeline_setup"]["pipeline_name"]
+        capsys.readouterr()
+
+        cli.main(force=True, dedupe=True)
+        out = capsys.readouterr().out
+        aliases = json.loads(pl.Path("build/gen192_nofork", cli.ALIAS_MAP_FILE).read_text())
+        generated = {file.name for file in pl.Path("build/gen192_nofork").glob("*.yml")}
+
+        assert aliases
+        assert generated | set(aliases) == set(full)
+        assert not generated & set(aliases)
+        for alias, canonical in aliases.items():
+            assert canonical in generated
+            assert full[alias] == full[canonical]
+        assert f"{len(aliases)} duplicate pipelines" in out
+        assert out.count("> Generating") == len(generated)
+        assert f"Config validation: {len(generated)} validations" in out
+
+    def test_merged_shards_match_unsharded_build(self, offline_cpac: dict[str, dict]) -> None:
+        for index in range(1, 3):
+            cli.main(shard=(index, 2), reproducible_zip=True, dedupe=True)
+        cli.merge_shards(reproducible_zip=True)
+        merged = {file.name: file.read_bytes() for file in pl.Path("dist").iterdir()}
+
+        cli.main(force=True, reproducible_zip=True, dedupe=True)
+        assert {file.name: file.read_bytes() for file in pl.Path("dist").iterdir()} == merged
+
+    def test_incremental(self, offline_cpac: dict[str, dict], capsys: pytest.CaptureFixture[str]) -> None:
+        cli.main(incremental=True, dedupe=True)
+        capsys.readouterr()
+
+        cli.main(incremental=True, dedupe=True)
+        assert "> Generating" not in capsys.readouterr().out
+
+        cli.main(incremental=True)
+        assert not pl.Path("build/gen192_nofork", cli.ALIAS_MAP_FILE).exists()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main_profile(offline_cpac: dict[str, dict], jobs: int) -> None:
+    profiler = Profiler()
+    cli.main(jobs=jobs, profiler=profiler)
+
+    files = {file.name for file in pl.Path("build/gen192_nofork").glob("*.yml")}
+    assert set(profiler.pipelines) == files
+    for stages in profiler.pipelines.values():
+        assert list(stages) == ["generate", "rules", "validate", "dump"]
+    for stage in ["fetch and expand configs", "load configs", "base pipelines", "generate pipelines", "write", "zip"]:
+        assert stage in profiler.stages
+    assert profiler.stages["generate pipelines"].calls == len(files)
+
+
+def test_main_from_vendored_presets(offline_cpac: dict[str, dict], monkeypatch: pytest.MonkeyPatch) -> None:
+    cli.main()
+    presets = pl.Path(shutil.copy(next(pl.Path("dist").glob("cpac_source_configs_*.zip")), "presets.zip"))
+    expected = {file: file.read_bytes() for file in pl.Path("build").rglob("*.yml")}
+
+    def fail(*args: object, **kwargs: object) -> None:
+        raise AssertionError("C-PAC must not be fetched or imported")
+
+    monkeypatch.setattr(cli, "expand_cpac_configs", cpac_config_extractor.expand_cpac_configs)
+    monkeypatch.setattr(cli, "ensure_cpac_repo", fail)
+    monkeypatch.setattr(cpac_config_extractor, "ensure_cpac_repo", fail)
+    monkeypatch.setattr(validation, "check_cpac_config", fail)
+    cli.main(force=True, validate=False, fetch_options=cpac_config_extractor.CpacFetchOptions(presets=presets))
+
+    assert {file: file.read_bytes() for file in pl.Path("build").rglob("*.yml")} == expected
+
+
+class TestPlan:
+    def test_dry_run_touches_nothing(
+        self, offline_cpac: dict[str, dict], monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+    ) -> None:
+        def fail(*args: object, **kwargs: object) -> None:
+            raise AssertionError("A dry run must not fetch anything")
+
+        monkeypatch.setattr(cli, "expand_cpac_configs", fail)
+        monkeypatch.setattr(cli, "ensure_cpac_repo", fail)
+        monkeypatch.setattr(sys, "argv", ["gen192", "--dry-run", "json", "--shard", "2/4"])
+        cli.cli()
+
+        assert list(pl.Path().iterdir()) == []
+        plan = json.loads(capsys.readouterr().out)
+        assert not plan["sources_known"]
+        assert plan["total"] == len(cli.pipeline_combination_space())
+        assert [pipeline["pipeline_num"] for pipeline in plan["pipelines"]] == list(range(1, plan["total"], 4))
+
+    def test_plan_matches_main(self, offline_cpac: dict[str, dict]) -> None:
+        space = cli.pipeline_combination_space(connectivity=True)
+        cli.main(space=space, dedupe=True)
+        outputs = {file.relative_to("build") for file in pl.Path("build").rglob("*")}
+        aliases = json.loads((pl.Path("build") / "gen192_nofork" / cli.ALIAS_MAP_FILE).read_text())
+
+        plan = cli.plan(space=space, dedupe=True, use_preset_cache=False)
+
+        assert {file.relative_to("build") for file in pl.Path("build").rglob("*")} == outputs
+        assert plan.sources_known
+        assert {pipeline.file_name: pipeline.alias_of for pipeline in plan.pipelines if pipeline.alias_of} == aliases
+        assert {pipeline.file_name for pipeline in plan.generated} == {
+            file.name for file in (pl.Path("build") / "gen192_nofork").glob("*.yml")
+        }
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_custom_step_space(self, offline_cpac: dict[str, dict], jobs: int) -> None:
+        space = _custom_step_space()
+        cli.main(space=space, dedupe=True, jobs=jobs)
+        aliases = json.loads((pl.Path("build") / "gen192_nofork" / cli.ALIAS_MAP_FILE).read_text())
+
+        plan = cli.plan(space=space, dedupe=True, use_preset_cache=False)
+
+        assert plan.total == len(space)
+        assert {pipeline.file_name: pipeline.alias_of for pipeline in plan.pipelines if pipeline.alias_of} == aliases
+        assert {pipeline.file_name for pipeline in plan.generated} == {
+            file.name for file in (pl.Path("build") / "gen192_nofork").glob("*.yml")
+        }
+
+    def test_plan_from_preset_cache(self, offline_cpac: dict[str, dict]) -> None:
+        cache = PresetCache(pl.Path("temp") / "cpac_preset_cache")
+        for config_name, config_id in cli.PIPELINE_NAMES.items():
+            cache.put(cli.CPAC_SHA, config_id, "blank", yaml.dump(offline_cpac[config_name]))
+
+        assert cli.plan().sources_known
+        assert not cli.plan(use_preset_cache=False).sources_known
+
+
+class TestStartup:
+    """The CLI is started many times per job, heavy dependencies are only imported when needed"""
+
+    HEAVY_MODULES = ["yaml", "concurrent", "multiprocessing", "zipfile", "tarfile", "subprocess", "pickle", "CPAC"]
+    IMPORT_TIME_BUDGET = 0.5
+    """Seconds (a few times the usual import time, to catch regressions rather than slow machines)"""
+
+    def _run(self, code: str, *options: str) -> subprocess.CompletedProcess:
+        env = {**os.environ, "PYTHONPATH": str(pl.Path(cli.__file__).parent.parent)}
+        return subprocess.run(
+            [sys.executable, *options, "-c", code], env=env, capture_output=True, text=True, check=True
+        )
+
+    def test_import_time(self) -> None:
+        importtime = self._run("import gen192.cli", "-X", "importtime").stderr.splitlines()
+        modules = {line.split("|")[-1].strip() for line in importtime if line.startswith("import time:")}
+        cumulative = next(int(line.split("|")[1]) for line in importtime if line.endswith("| gen192.cli"))
+
+        assert not [module for module in modules if module.split(".")[0] in self.HEAVY_MODULES]
+        assert cumulative / 1e6 < self.IMPORT_TIME_BUDGET
+
+    def test_help(self) -> None:
+        code = (
+            "import sys\n"
+            "from gen192.cli import cli\n"
+            "sys.argv = ['gen192', '--help']\n"
+            "try:\n"
+            "    cli()\n"
+            "except SystemExit:\n"
+            "    print(' '.join(sys.modules))\n"
+        )
+        modules = self._run(code).stdout.splitlines()[-1].split()
+        assert not [module for module in modules if module.split(".")[0] in self.HEAVY_MODULES]
@@ -0,0 +1,81 @@
+"""Test gen192.combinations"""
+
+import itertools as it
+
+import pytest
+
+import gen192.cli as cli
+from gen192.combinations import Axis, CombinationSpace
+
+
+def _space() -> CombinationSpace[tuple]:
+    return CombinationSpace(
+        [Axis("a", [1, 2, 3]), Axis("b", "xy"), Axis("c", [True, False])],
+        factory=lambda a, b, c: (a, b, c),
+    )
+
+
+class TestCombinationSpace:
+    def test_matches_nested_loops(self) -> None:
+        space = _space()
+        expected = list(it.product([1, 2, 3], "xy", [True, False]))
+
+        assert len(space) == len(expected)
+        assert list(space) == expected
+        assert [space[index] for index in range(-len(expected), len(expected))] == expected + expected
+
+    def test_index_out_of_range(self) -> None:
+        with pytest.raises(IndexError):
+            _space()[12]
+
+    def test_len_without_materializing(self) -> None:
+        space: CombinationSpace[dict] = CombinationSpace([Axis(str(axis), range(50)) for axis in range(10)], dict)
+
+        assert len(space) == 50**10
+        assert space[-1] == {str(axis): 49 for axis in range(10)}
+
+    def test_slice_keeps_numbering(self) -> None:
+        space = _space()
+        view = space[3:9:2]
+
+        assert len(view) == 3
+        assert list(view) == list(space)[3:9:2]
+        assert [num for num, _ in view.numbered()] == [3, 5, 7]
+        assert list(view[1:].numbered()) == [(5, space[5]), (7, space[7])]
+
+    @pytest.mark.parametrize("count", [1, 2, 5, 12, 20])
+    def test_shards_are_disjoint_and_complete(self, count: int) -> None:
+        space = _space().where(lambda combi: combi[1] == "x")
+        shards = [list(space.shard(index, count).numbered()) for index in range(count)]
+
+        numbered = sorted(item for shard in shards for item in shard)
+        assert numbered == list(space.numbered())
+        assert max(len(shard) for shard in shards) - min(len(shard) for shard in shards) <= 1
+
+    def test_invalid_shard(self) -> None:
+        with pytest.raises(ValueError):
+            _space().shard(2, 2)
+
+    def test_filters(self) -> None:
+        space = _space().where(lambda combi: combi[0] != 2, lambda combi: combi[2])
+
+        assert list(space) == [(1, "x", True), (1, "y", True), (3, "x", True), (3, "y", True)]
+        assert space[-1] == (3, "y", True)
+        assert list(space.numbered())[2] == (2, (3, "x", True))
+
+    def test_filter_after_slice(self) -> None:
+        with pytest.raises(ValueError, match="before slicing"):
+            _space()[1:].where(lambda combi: True)
+
+
+def test_pipeline_combination_space_axes() -> None:
+    full = cli.pipeline_combination_space(connectivity=True, nuisance=True, duplicates=True)
+    expected = it.product(
+        cli.PIPELINE_NAMES, cli.PIPELINE_NAMES, cli.PIPELINE_STEPS, cli.CONNECTIVITY_METHODS, cli.NUISANCE_METHODS
+    )
+
+    assert [
+        (c.pipeline_id, c.pipeline_perturb_id, c.step, c.connectivity_method, c.use_nuisance_correction) for c in full
+    ] == list(expected)
+    assert list(cli.pipeline_combination_space()) == list(cli.iter_pipeline_combis_no_duplicates())
+    assert all(combi.pipeline_id != combi.pipeline_perturb_id for combi in cli.pipeline_combination_space())
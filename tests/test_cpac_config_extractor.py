@@ -2,7 +2,10 @@
 
 import os
 import pathlib as pl
+import subprocess
 import sys
+import tarfile
+import zipfile
 from typing import Generator
 
 import pytest
@@ -10,6 +13,7 @@ import pytest
 from gen192 import cpac_config_extractor, utils
 from gen192.cli import PIPELINE_NAMES, load_pipeline_config
 from gen192.config import CPAC_SHA
+from gen192.preset_cache import PresetCache
 
 
 class TestDownloadCPACRepo:
@@ -32,6 +36,120 @@ class TestDownloadCPACRepo:
         assert os.path.exists(f"{tmp_path}/CPAC")
 
 
+@pytest.fixture
+def local_cpac_repo(tmp_path: pl.Path) -> tuple[pl.Path, str]:
+    """Local stand-in for the C-PAC repository with two commits, returns its path and the first commit"""
+    repo = tmp_path / "cpac_upstream"
+    (repo / "CPAC" / "resources" / "configs").mkdir(parents=True)
+    (repo / "docs").mkdir()
+    (repo / "CPAC" / "__init__.py").write_text("")
+    (repo / "CPAC" / "resources" / "configs" / "pipeline_config_abcd-options.yml").write_text("FROM: default\n")
+    (repo / "docs" / "index.md").write_text("docs\n")
+
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+            cwd=repo,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+
+    git("init", "--quiet")
+    git("add", ".")
+    git("commit", "--quiet", "-m", "first")
+    sha = git("rev-parse", "HEAD")
+    (repo / "CPAC" / "later.py").write_text("")
+    git("add", ".")
+    git("commit", "--quiet", "-m", "second")
+    return repo, sha
+
+
+class TestDownloadCPACRepoOffline:
+    def _commit_count(self, cpac_dir: pl.Path) -> int:
+        out = subprocess.run(["git", "rev-list", "--count", "HEAD"], cwd=cpac_dir, capture_output=True, text=True)
+        return int(out.stdout)
+
+    def test_full_clone(self, tmp_path: pl.Path, local_cpac_repo: tuple[pl.Path, str]) -> None:
+        repo, sha = local_cpac_repo
+        cpac_dir = tmp_path / "cpac_source"
+        cpac_config_extractor._download_cpac_repo(
+            cpac_dir=cpac_dir, checkout_sha=sha, options=cpac_config_extractor.CpacFetchOptions(source=str(repo))
+        )
+        assert (cpac_dir / "CPAC" / "__init__.py").exists()
+        assert not (cpac_dir / "CPAC" / "later.py").exists()
+        assert (cpac_dir / "docs").exists()
+
+    @pytest.mark.parametrize("bare", [(False), (True)])
+    def test_shallow_sparse(self, tmp_path: pl.Path, local_cpac_repo: tuple[pl.Path, str], bare: bool) -> None:
+        repo, sha = local_cpac_repo
+        source = repo
+        if bare:
+            source = tmp_path / "mirror.git"
+            subprocess.run(["git", "clone", "--quiet", "--mirror", str(repo), str(source)], check=True)
+
+        cpac_dir = tmp_path / "cpac_source"
+        cpac_config_extractor._download_cpac_repo(
+            cpac_dir=cpac_dir,
+            checkout_sha=sha,
+            options=cpac_config_extractor.CpacFetchOptions(source=str(source), shallow=True, sparse_paths=["CPAC"]),
+        )
+        assert (cpac_dir / "CPAC" / "resources" / "configs" / "pipeline_config_abcd-options.yml").exists()
+        assert not (cpac_dir / "CPAC" / "later.py").exists()
+        assert not (cpac_dir / "docs").exists()
+        assert self._commit_count(cpac_dir) == 1
+
+    def test_shallow_invalid_sha(self, tmp_path: pl.Path, local_cpac_repo: tuple[pl.Path, str]) -> None:
+        repo, _ = local_cpac_repo
+        with pytest.raises(SystemExit) as cmd_exit:
+            cpac_config_extractor._download_cpac_repo(
+                cpac_dir=tmp_path / "cpac_source",
+                checkout_sha="0" * 40,
+                options=cpac_config_extractor.CpacFetchOptions(source=str(repo), shallow=True),
+            )
+        assert cmd_exit.value.code == 1
+
+    def test_tarball(self, tmp_path: pl.Path, local_cpac_repo: tuple[pl.Path, str]) -> None:
+        repo, sha = local_cpac_repo
+        tarball = tmp_path / "cpac.tar.gz"
+        with tarfile.open(tarball, "w:gz") as tar:
+            tar.add(repo / "CPAC", arcname=f"C-PAC-{sha}/CPAC")
+            tar.add(repo / "docs", arcname=f"C-PAC-{sha}/docs")
+
+        cpac_dir = tmp_path / "cpac_source"
+        cpac_config_extractor._download_cpac_repo(
+            cpac_dir=cpac_dir,
+            checkout_sha=sha,
+            options=cpac_config_extractor.CpacFetchOptions(source=str(tarball), sparse_paths=["CPAC"]),
+        )
+        assert (cpac_dir / "CPAC" / "resources" / "configs" / "pipeline_config_abcd-options.yml").exists()
+        assert not (cpac_dir / "docs").exists()
+
+    def test_tarball_without_folder_entries(self, tmp_path: pl.Path, local_cpac_repo: tuple[pl.Path, str]) -> None:
+        repo, sha = local_cpac_repo
+        tarball = tmp_path / "cpac.tgz"
+        with tarfile.open(tarball, "w:gz") as tar:
+            for file in sorted(repo.rglob("*")):
+                if file.is_file() and ".git" not in file.parts:
+                    tar.add(file, arcname=f"C-PAC-{sha}/{file.relative_to(repo).as_posix()}")
+
+        cpac_dir = tmp_path / "cpac_source"
+        cpac_config_extractor._download_cpac_repo(
+            cpac_dir=cpac_dir,
+            checkout_sha=sha,
+            options=cpac_config_extractor.CpacFetchOptions(source=str(tarball), sparse_paths=["CPAC/"]),
+        )
+        assert (cpac_dir / "CPAC" / "resources" / "configs" / "pipeline_config_abcd-options.yml").exists()
+        assert not (cpac_dir / "docs").exists()
+
+        with pytest.raises(FileNotFoundError, match="No files of nothing"):
+            cpac_config_extractor._download_cpac_repo(
+                cpac_dir=tmp_path / "empty",
+                checkout_sha=sha,
+                options=cpac_config_extractor.CpacFetchOptions(source=str(tarball), sparse_paths=["nothing"]),
+            )
+
+
 class TestFetchAndExpandCPACConfig:
     def test_fetch_and_expand(self, tmp_path: pl.Path) -> None:
         cpac_dir = tmp_path / "cpac_source"
@@ -52,6 +170,133 @@ class TestFetchAndExpandCPACConfig:
             assert os.path.exists(output_dir / (utils.filesafe(config_name) + ".yml"))
 
 
+class TestFetchAndExpandCached:
+    @pytest.fixture
+    def expansions(self, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+        """Records presets expanded by a fake C-PAC instead of fetching it"""
+        expanded: list[str] = []
+
+        def fake_expand(config_id: str, template: str) -> str:
+            expanded.append(config_id)
+            return f"pipeline_setup:\n  pipeline_name: {config_id}-{template}\n"
+
+        monkeypatch.setattr(cpac_config_extractor, "ensure_cpac_repo", lambda **kwargs: None)
+        monkeypatch.setattr(cpac_config_extractor, "_expand_cpac_preset", fake_expand)
+        return expanded
+
+    def _fetch(self, tmp_path: pl.Path, jobs: int = 1) -> None:
+        cpac_config_extractor.fetch_and_expand_cpac_configs(
+            cpac_dir=tmp_path / "cpac_source",
+            output_dir=tmp_path / "cpac_configs",
+            checkout_sha=CPAC_SHA,
+            config_names_ids=PIPELINE_NAMES,
+            cache_dir=tmp_path / "cache",
+            jobs=jobs,
+        )
+
+    def test_second_run_skips_expansion(self, tmp_path: pl.Path, expansions: list[str]) -> None:
+        self._fetch(tmp_path)
+        assert expansions == list(PIPELINE_NAMES.values())
+        first = {p.name: p.read_text() for p in (tmp_path / "cpac_configs").iterdir()}
+
+        expansions.clear()
+        self._fetch(tmp_path)
+        assert expansions == []
+        assert {p.name: p.read_text() for p in (tmp_path / "cpac_configs").iterdir()} == first
+
+    def test_stale_entry_is_regenerated(self, tmp_path: pl.Path, expansions: list[str]) -> None:
+        self._fetch(tmp_path)
+        for content_file in (tmp_path / "cache").glob("*.yml"):
+            if "abcd-options" in content_file.read_text():
+                content_file.write_text("tampered")
+
+        expansions.clear()
+        self._fetch(tmp_path)
+        assert expansions == ["abcd-options"]
+
+    def test_expand_writes_nothing(self, tmp_path: pl.Path, expansions: list[str]) -> None:
+        expanded = cpac_config_extractor.expand_cpac_configs(
+            cpac_dir=tmp_path / "cpac_source", checkout_sha=CPAC_SHA, config_names_ids=PIPELINE_NAMES
+        )
+        assert list(tmp_path.iterdir()) == []
+
+        self._fetch(tmp_path)
+        for config_name, content in expanded.items():
+            assert (tmp_path / "cpac_configs" / (utils.filesafe(config_name) + ".yml")).read_text() == content
+
+    def test_parallel_expansion(self, tmp_path: pl.Path, expansions: list[str]) -> None:
+        self._fetch(tmp_path)
+        serial = {p.name: p.read_text() for p in (tmp_path / "cpac_configs").iterdir()}
+
+        parallel_dir = tmp_path / "parallel"
+        parallel_dir.mkdir()
+        self._fetch(parallel_dir, jobs=3)
+        assert {p.name: p.read_text() for p in (parallel_dir / "cpac_configs").iterdir()} == serial
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_failure_is_isolated(self, tmp_path: pl.Path, monkeypatch: pytest.MonkeyPatch, jobs: int) -> None:
+        def fake_expand(config_id: str, template: str) -> str:
+            if config_id == "ccs-options":
+                raise ValueError("broken preset")
+            return f"pipeline_setup:\n  pipeline_name: {config_id}\n"
+
+        monkeypatch.setattr(cpac_config_extractor, "ensure_cpac_repo", lambda **kwargs: None)
+        monkeypatch.setattr(cpac_config_extractor, "_expand_cpac_preset", fake_expand)
+        with pytest.raises(RuntimeError, match="presets: ccs-options$"):
+            self._fetch(tmp_path, jobs=jobs)
+
+        cache = PresetCache(tmp_path / "cache")
+        for config_id in PIPELINE_NAMES.values():
+            assert (cache.get(CPAC_SHA, config_id, "blank") is None) == (config_id == "ccs-options")
+
+
+class TestVendoredPresets:
+    @pytest.fixture
+    def no_cpac(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        def fail(*args: object, **kwargs: object) -> None:
+            raise AssertionError("C-PAC must not be fetched or imported")
+
+        monkeypatch.setattr(cpac_config_extractor, "ensure_cpac_repo", fail)
+        monkeypatch.setattr(cpac_config_extractor, "_expand_cpac_preset", fail)
+
+    def _presets(self) -> dict[str, str]:
+        return {utils.filesafe(name) + ".yml": f"pipeline_setup:\n  pipeline_name: {name}\n" for name in PIPELINE_NAMES}
+
+    def _fetch(self, tmp_path: pl.Path, presets: pl.Path) -> dict[str, str]:
+        cpac_config_extractor.fetch_and_expand_cpac_configs(
+            cpac_dir=tmp_path / "cpac_source",
+            output_dir=tmp_path / "cpac_configs",
+            checkout_sha=CPAC_SHA,
+            config_names_ids=PIPELINE_NAMES,
+            fetch_options=cpac_config_extractor.CpacFetchOptions(presets=presets),
+        )
+        return {file.name: file.read_text() for file in (tmp_path / "cpac_configs").iterdir()}
+
+    def test_directory(self, tmp_path: pl.Path, no_cpac: None) -> None:
+        presets = tmp_path / "presets" / "nested"
+        presets.mkdir(parents=True)
+        for name, content in self._presets().items():
+            (presets / name).write_text(content)
+
+        assert self._fetch(tmp_path, tmp_path / "presets") == self._presets()
+
+    def test_zip(self, tmp_path: pl.Path, no_cpac: None) -> None:
+        presets = tmp_path / "cpac_source_configs.zip"
+        with zipfile.ZipFile(presets, "w") as archive:
+            for name, content in self._presets().items():
+                archive.writestr(f"configs/{name}", content)
+
+        assert self._fetch(tmp_path, presets) == self._presets()
+
+    def test_missing_preset(self, tmp_path: pl.Path, no_cpac: None) -> None:
+        presets = tmp_path / "presets"
+        presets.mkdir()
+        (presets / "abcd.yml").write_text("pipeline_setup: {}\n")
+
+        with pytest.raises(FileNotFoundError, match="ccs.yml"):
+            self._fetch(tmp_path, presets)
+
+
 class TestCheckCPACConfig:
     def test_check_valid_config(self, tmp_path: pl.Path) -> None:
         cpac_dir = tmp_path / "cpac_source"
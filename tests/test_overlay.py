@@ -0,0 +1,97 @@
+"""Test gen192.overlay"""
+
+import copy
+import pickle
+
+import pytest
+
+from gen192 import utils
+from gen192.overlay import ConfigOverlay, materialize
+
+
+@pytest.fixture
+def base() -> dict:
+    return {
+        "a": 1,
+        "b": {"c": [1, 2], "d": {"e": "foo"}},
+        "f": "bar",
+    }
+
+
+class TestConfigOverlay:
+    def test_reads_fall_through(self, base: dict) -> None:
+        overlay = ConfigOverlay(base)
+        assert overlay["a"] == 1
+        assert overlay["b"]["d"]["e"] == "foo"
+        assert list(overlay) == ["a", "b", "f"]
+        assert len(overlay) == 3
+        assert overlay == base
+
+    def test_writes_do_not_touch_base(self, base: dict) -> None:
+        expected = copy.deepcopy(base)
+        overlay = ConfigOverlay(base)
+
+        overlay["b"]["d"]["e"] = "changed"
+        overlay["b"]["c"].append(3)
+        overlay["g"] = {"h": True}
+        del overlay["f"]
+
+        assert base == expected
+        assert overlay.to_dict() == {"a": 1, "b": {"c": [1, 2, 3], "d": {"e": "changed"}}, "g": {"h": True}}
+
+    def test_set_values_are_not_aliased(self, base: dict) -> None:
+        snippet = {"x": {"y": [1]}}
+        overlay = ConfigOverlay(base)
+        overlay["s"] = snippet
+
+        overlay["s"]["x"]["y"].append(2)
+        overlay["s"]["x"]["z"] = 1
+
+        assert snippet == {"x": {"y": [1]}}
+        assert overlay["s"] == {"x": {"y": [1, 2], "z": 1}}
+
+    def test_delete_and_reset(self, base: dict) -> None:
+        overlay = ConfigOverlay(base)
+        del overlay["a"]
+        assert "a" not in overlay
+        with pytest.raises(KeyError):
+            overlay["a"]
+        with pytest.raises(KeyError):
+            del overlay["a"]
+
+        overlay["a"] = 2
+        assert overlay["a"] == 2
+        assert list(overlay) == ["a", "b", "f"]
+
+    def test_to_dict_shares_no_containers(self, base: dict) -> None:
+        flat = ConfigOverlay(base).to_dict()
+        assert flat == base
+        assert flat["b"] is not base["b"]
+        assert flat["b"]["c"] is not base["b"]["c"]
+
+    def test_multi_helpers(self, base: dict) -> None:
+        expected = copy.deepcopy(base)
+        overlay = ConfigOverlay(base)
+
+        assert utils.multi_set(overlay, index=["b", "new", "path"], value=1)
+        assert utils.multi_get(overlay, index=["b", "new", "path"]) == 1
+        assert utils.multi_del(overlay, index=["b", "d", "e"]) == "foo"
+        assert utils.multi_get(overlay, index=["b", "d", "e"]) is None
+
+        assert base == expected
+
+    def test_pickle(self, base: dict) -> None:
+        overlay = ConfigOverlay(base)
+        overlay["b"]["d"]["e"] = "changed"
+        assert pickle.loads(pickle.dumps(overlay)) == overlay
+
+
+class TestMaterialize:
+    def test_materialize_overlay(self, base: dict) -> None:
+        result = materialize(ConfigOverlay(base))
+        assert type(result) is dict
+        assert result == base
+
+    @pytest.mark.parametrize("value", [({"a": 1}), ([1, 2]), ("foo"), (None)])
+    def test_materialize_plain(self, value: object) -> None:
+        assert materialize(value) is value
@@ -0,0 +1,92 @@
+"""Test gen192.paths"""
+
+import copy
+import random
+from typing import Any
+
+import pytest
+
+from gen192 import utils
+from gen192.overlay import ConfigOverlay, materialize
+from gen192.paths import ConfigPatch, ConfigPath
+
+KEYS = ["a", "b", "c"]
+
+
+def _random_config(rng: random.Random, depth: int = 3) -> Any:  # noqa: ANN401
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice([1, None, "x", [1, 2]])
+    return {key: _random_config(rng, depth - 1) for key in KEYS if rng.random() < 0.7}
+
+
+def _random_path(rng: random.Random) -> list[str]:
+    return [rng.choice(KEYS) for _ in range(rng.randint(1, 4))]
+
+
+@pytest.fixture
+def nested() -> dict:
+    return {"a": {"b": {"c": 1}, "d": [1, 2]}, "e": 2}
+
+
+class TestConfigPath:
+    @pytest.mark.parametrize("keys", [[], ["a"], ["a", "b", "c"], ["a", "d", "x"], ["x"], ["e", "x"]])
+    def test_get_matches_multi_get(self, nested: dict, keys: list[str]) -> None:
+        assert ConfigPath(keys).get(nested) == utils.multi_get(nested, index=keys)
+
+    @pytest.mark.parametrize("keys", [["a"], ["a", "b", "c"], ["a", "x", "y"], ["a", "d", "x"], ["e", "x"]])
+    def test_set_delete_match_multi_set_del(self, nested: dict, keys: list[str]) -> None:
+        expected = copy.deepcopy(nested)
+
+        assert ConfigPath(keys).set(nested, "v") == utils.multi_set(expected, index=keys, value="v")
+        assert nested == expected
+        assert ConfigPath(keys).delete(nested) == utils.multi_del(expected, index=keys)
+        assert nested == expected
+
+    def test_root(self, nested: dict) -> None:
+        with pytest.raises(ValueError, match="root"):
+            ConfigPath([]).set(nested, 1)
+
+
+class TestConfigPatch:
+    @pytest.mark.parametrize("seed", range(200))
+    def test_matches_sequential_helpers(self, seed: int) -> None:
+        rng = random.Random(seed)
+        config = {key: _random_config(rng) for key in KEYS}
+        patch = ConfigPatch()
+        for _ in range(rng.randint(1, 12)):
+            if rng.random() < 0.6:
+                patch.set(_random_path(rng), rng.choice([0, {}, {"a": 1}, [3]]))
+            else:
+                patch.delete(_random_path(rng))
+
+        expected_config = copy.deepcopy(config)
+        expected = [
+            utils.multi_set(expected_config, index=list(path.keys), value=copy.deepcopy(value))
+            if is_set
+            else utils.multi_del(expected_config, index=list(path.keys))
+            for is_set, path, value in patch.operations
+        ]
+        overlay = ConfigOverlay(copy.deepcopy(config))
+
+        assert patch.apply(config) == expected
+        assert config == expected_config
+        assert [materialize(result) for result in patch.apply(overlay)] == expected
+        assert overlay.to_dict() == expected_config
+
+    def test_values_are_not_shared(self) -> None:
+        patch = ConfigPatch().set(["a", "b"], [1])
+        first: dict = {}
+        second: dict = {}
+        patch.apply(first)
+        patch.apply(second)
+
+        first["a"]["b"].append(2)
+        assert second == {"a": {"b": [1]}}
+
+    def test_not_a_mapping(self) -> None:
+        patch = ConfigPatch().set(["a"], 1).delete(["b"])
+        assert patch.apply([]) == [False, None]  # type: ignore[arg-type]
+
+    def test_repr(self) -> None:
+        patch = ConfigPatch().set(["a"], 1).extend(ConfigPatch().delete(["b"]))
+        assert repr(patch) == "ConfigPatch([('set', ['a'], 1), ('delete', ['b'])])"
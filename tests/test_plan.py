@@ -0,0 +1,71 @@
+"""Test gen192.plan"""
+
+import pytest
+
+import gen192.cli as cli
+from gen192.plan import alias_canonicals, plan_generation, seconds_per_pipeline
+from gen192.rules import DEFAULT_RULE_TABLE
+from gen192.snippets import SnippetIndex
+
+
+@pytest.fixture
+def snippets(synthetic_configs: cli.ConfigLookupTable) -> SnippetIndex:
+    return SnippetIndex(synthetic_configs, cli.PIPELINE_STEPS)
+
+
+def test_plan_without_sources() -> None:
+    space = cli.pipeline_combination_space()
+    plan = plan_generation(space, DEFAULT_RULE_TABLE)
+
+    assert [pipeline.file_name for pipeline in plan.pipelines] == [
+        combi.filename(num) for num, combi in space.numbered()
+    ]
+    assert all(pipeline.noop is None and pipeline.alias_of is None for pipeline in plan.pipelines)
+    assert [pipeline.rules for pipeline in plan.pipelines] == [
+        [rule.name for rule in DEFAULT_RULE_TABLE.lookup(combi)] for combi in space
+    ]
+    assert len(plan.generated) == plan.validations == plan.total == len(space)
+    assert "not detected" in plan.summary()
+
+
+def test_plan_detects_noops_and_duplicates(snippets: SnippetIndex) -> None:
+    space = cli.pipeline_combination_space(connectivity=True)
+    aliases = cli.pipeline_aliases(space, snippets, DEFAULT_RULE_TABLE)
+    plan = plan_generation(space, DEFAULT_RULE_TABLE, snippets=snippets, dedupe=True)
+
+    assert {pipeline.file_name: pipeline.alias_of for pipeline in plan.pipelines if pipeline.alias_of} == aliases
+    assert [pipeline.noop for pipeline in plan.pipelines] == [snippets.is_noop(combi) for combi in space]
+    assert len(plan.generated) == plan.validations == len(space) - len(aliases)
+    assert plan.to_dict()["generated"] == len(space) - len(aliases)
+
+
+def test_alias_canonicals(snippets: SnippetIndex) -> None:
+    space = cli.pipeline_combination_space(connectivity=True)
+    canonicals = alias_canonicals(space, snippets, DEFAULT_RULE_TABLE, suffix=".json")
+
+    assert canonicals
+    assert cli.pipeline_aliases(space, snippets, DEFAULT_RULE_TABLE, suffix=".json") == {
+        space[pipeline_num].filename(pipeline_num, suffix=".json"): canonical
+        for pipeline_num, canonical in canonicals.items()
+    }
+    assert all(canonical.endswith(".json") for canonical in canonicals.values())
+
+
+def test_plan_shard(snippets: SnippetIndex) -> None:
+    space = cli.pipeline_combination_space(connectivity=True)
+    full = plan_generation(space, DEFAULT_RULE_TABLE, snippets=snippets)
+    shard = plan_generation(space.shard(1, 3), DEFAULT_RULE_TABLE, snippets=snippets, full_space=space)
+
+    assert shard.pipelines == full.pipelines[1::3]
+    assert shard.total == full.total
+
+
+def test_estimate() -> None:
+    report = {"pipelines": {"a.yml": {"generate": {"wall": 1.0}, "validate": {"wall": 2.0}}, "b.yml": {}}}
+    assert seconds_per_pipeline(report) == 1.5
+    assert seconds_per_pipeline({"pipelines": {}}) is None
+
+    space = cli.pipeline_combination_space()
+    plan = plan_generation(space, DEFAULT_RULE_TABLE, profile_report=report, jobs=2)
+    assert plan.estimated_seconds == pytest.approx(1.5 * len(space) / 2)
+    assert plan_generation(space, DEFAULT_RULE_TABLE).estimated_seconds is None
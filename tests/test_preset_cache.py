@@ -0,0 +1,37 @@
+"""Test gen192.preset_cache"""
+
+import pathlib as pl
+
+from gen192.preset_cache import PresetCache
+
+
+class TestPresetCache:
+    def test_roundtrip(self, tmp_path: pl.Path) -> None:
+        cache = PresetCache(tmp_path)
+        assert cache.get("sha", "abcd-options", "blank") is None
+
+        cache.put("sha", "abcd-options", "blank", "pipeline_setup: {}\n")
+
+        assert cache.get("sha", "abcd-options", "blank") == "pipeline_setup: {}\n"
+        assert PresetCache(tmp_path).get("sha", "abcd-options", "blank") == "pipeline_setup: {}\n"
+
+    def test_key_components(self, tmp_path: pl.Path) -> None:
+        cache = PresetCache(tmp_path)
+        cache.put("sha", "abcd-options", "blank", "content")
+
+        assert cache.get("other-sha", "abcd-options", "blank") is None
+        assert cache.get("sha", "ccs-options", "blank") is None
+        assert cache.get("sha", "abcd-options", "default") is None
+
+    def test_corrupted_entry_is_a_miss(self, tmp_path: pl.Path) -> None:
+        cache = PresetCache(tmp_path)
+        cache.put("sha", "abcd-options", "blank", "content")
+
+        (content_file,) = tmp_path.glob("*.yml")
+        content_file.write_text("tampered")
+
+        assert PresetCache(tmp_path).get("sha", "abcd-options", "blank") is None
+
+    def test_invalid_manifest_is_empty(self, tmp_path: pl.Path) -> None:
+        (tmp_path / "manifest.json").write_text("{not json")
+        assert PresetCache(tmp_path).get("sha", "abcd-options", "blank") is None
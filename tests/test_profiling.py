@@ -0,0 +1,101 @@
+"""Test gen192.profiling"""
+
+import json
+import pathlib as pl
+import pstats
+import sys
+
+import pytest
+
+from gen192.profiling import Profiler, StageStats
+
+
+def _work() -> list[int]:
+    return [number**2 for number in range(20000)]
+
+
+def test_stages() -> None:
+    profiler = Profiler()
+    for pipeline in ["p0", "p1"]:
+        with profiler.stage("generate", pipeline=pipeline):
+            _work()
+    with profiler.stage("zip"):
+        pass
+
+    assert list(profiler.stages) == ["generate", "zip"]
+    assert profiler.stages["generate"].calls == 2
+    assert profiler.stages["generate"].wall > 0
+    assert profiler.stages["generate"].peak_memory_bytes is None
+    assert profiler.stages["generate"].wall == pytest.approx(
+        sum(stages["generate"].wall for stages in profiler.pipelines.values())
+    )
+    assert set(profiler.pipelines) == {"p0", "p1"}
+
+
+def test_stage_with_error() -> None:
+    profiler = Profiler()
+    with pytest.raises(ValueError), profiler.stage("failing"):
+        raise ValueError()
+    assert profiler.stages["failing"].calls == 1
+
+
+def test_disabled() -> None:
+    profiler = Profiler(enabled=False)
+    with profiler.stage("generate", pipeline="p0"):
+        pass
+    assert profiler.stages == {}
+    assert profiler.pipelines == {}
+
+
+def test_memory_of_nested_stages() -> None:
+    profiler = Profiler(trace_memory=True)
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            data = _work()
+        del data
+        with profiler.stage("small"):
+            pass
+
+    inner = profiler.stages["inner"].peak_memory_bytes
+    outer = profiler.stages["outer"].peak_memory_bytes
+    small = profiler.stages["small"].peak_memory_bytes
+    assert inner is not None and outer is not None and small is not None
+    assert outer >= inner > small
+
+
+def test_add() -> None:
+    profiler = Profiler()
+    profiler.add("validate", StageStats(wall=1.0, cpu=0.5, calls=1), pipeline="p0")
+    profiler.add("validate", StageStats(wall=2.0, cpu=0.5, calls=1, peak_memory_bytes=10), pipeline="p1")
+    assert profiler.stages["validate"] == StageStats(wall=3.0, cpu=1.0, calls=2, peak_memory_bytes=10)
+
+
+def test_report(tmp_path: pl.Path) -> None:
+    profiler = Profiler(cprofile_stages=["generate"], cprofile_prefix=tmp_path / "profile")
+    for pipeline in ["p0", "p1"]:
+        with profiler.stage("generate", pipeline=pipeline):
+            _work()
+    profiler.save(tmp_path / "profile.json")
+
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert report["stages"]["generate"]["calls"] == 2
+    assert set(report["pipelines"]) == {"p0", "p1"}
+    assert report["max_rss_bytes"] > 0
+    stats = pstats.Stats(report["cprofile"]["generate"])
+    assert any(function[2] == "_work" for function in stats.stats)  # type: ignore[attr-defined]
+
+    summary = profiler.summary(slowest_pipelines=1).splitlines()
+    assert summary[1].startswith("generate")
+    assert summary[2] == "Slowest pipelines:"
+    assert len(summary) == 4
+
+
+def test_report_without_resource(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(sys.modules, "resource", None)  # type: ignore[arg-type]
+    profiler = Profiler()
+    with profiler.stage("generate"):
+        _work()
+
+    report = profiler.report()
+    assert "max_rss_bytes" not in report
+    assert report["stages"]["generate"]["calls"] == 1
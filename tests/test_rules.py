@@ -0,0 +1,131 @@
+"""Test gen192.rules"""
+
+import pathlib as pl
+
+import pytest
+
+import gen192.cli as cli
+from gen192.rules import (
+    DEFAULT_RULE_TABLE,
+    RuleMatcher,
+    RuleOperation,
+    RuleTable,
+    SpecialCaseRule,
+    load_rule_table,
+)
+
+
+def _combi(base: str, perturb: str, step_name: str) -> cli.PipelineCombination:
+    step = next(step for step in cli.PIPELINE_STEPS if step.name == step_name)
+    return cli.PipelineCombination(pipeline_id=base, pipeline_perturb_id=perturb, step=step)
+
+
+@pytest.fixture
+def table() -> RuleTable:
+    return RuleTable(
+        [
+            SpecialCaseRule(
+                name="first",
+                matchers=(RuleMatcher("ABCD", "RBC", "Structural Registration"),),
+                operations=(RuleOperation(op="set", path=("a", "b"), value=[1]),),
+            ),
+            SpecialCaseRule(
+                name="second",
+                matchers=(
+                    RuleMatcher("ABCD", "RBC", "Structural Registration"),
+                    RuleMatcher("CCS", "ABCD", "Functional Masking"),
+                ),
+                operations=(
+                    RuleOperation(op="set", path=("a", "b"), value=[2]),
+                    RuleOperation(op="delete", path=("c",)),
+                ),
+            ),
+            SpecialCaseRule(name="dead", matchers=(), operations=()),
+        ]
+    )
+
+
+class TestRuleTable:
+    def test_apply_in_table_order(self, table: RuleTable) -> None:
+        config = {"a": {"b": [0]}, "c": 1, "d": 2}
+
+        fired = table.apply(config, _combi("ABCD", "RBC", "Structural Registration"))
+
+        assert fired == ["first", "second"]
+        assert config == {"a": {"b": [2]}, "d": 2}
+
+    def test_no_matching_rules(self, table: RuleTable) -> None:
+        config = {"c": 1}
+        assert table.apply(config, _combi("RBC", "ABCD", "Structural Registration")) == []
+        assert config == {"c": 1}
+
+    def test_values_are_not_shared(self, table: RuleTable) -> None:
+        combi = _combi("CCS", "ABCD", "Functional Masking")
+        first: dict = {"a": {}}
+        second: dict = {"a": {}}
+        table.apply(first, combi)
+        table.apply(second, combi)
+
+        first["a"]["b"].append(3)
+        assert second["a"]["b"] == [2]
+
+    def test_dead_rules(self, table: RuleTable) -> None:
+        dead = table.dead_rules([_combi("CCS", "ABCD", "Functional Masking")])
+        assert [rule.name for rule in dead] == ["first", "dead"]
+
+    def test_hash_for_only_depends_on_matching_rules(self, table: RuleTable) -> None:
+        combi = _combi("CCS", "ABCD", "Functional Masking")
+        other = RuleTable([*table.rules[:2], SpecialCaseRule(name="dead", matchers=(), operations=(), reference="x")])
+        changed = RuleTable(
+            [table.rules[0], SpecialCaseRule(name="second", matchers=table.rules[1].matchers, operations=())]
+        )
+
+        assert other.hash_for(combi) == table.hash_for(combi)
+        assert changed.hash_for(combi) != table.hash_for(combi)
+
+    def test_duplicate_names(self, table: RuleTable) -> None:
+        with pytest.raises(ValueError, match="first"):
+            RuleTable([*table.rules, table.rules[0]])
+
+
+def test_load_rule_table(tmp_path: pl.Path) -> None:
+    file = tmp_path / "rules.yml"
+    file.write_text(
+        """
+rules:
+  - name: overwrite-transform
+    reference: overwrite transform
+    match:
+      - {base: ABCD, perturb: RBC, step: Structural Registration}
+    operations:
+      - set: [registration_workflows, overwrite_transform, run]
+        value: true
+      - delete: [registration_workflows, overwrite_transform, using]
+"""
+    )
+
+    table = load_rule_table(file)
+
+    assert table.rules == [
+        SpecialCaseRule(
+            name="overwrite-transform",
+            matchers=(RuleMatcher("ABCD", "RBC", "Structural Registration"),),
+            operations=(
+                RuleOperation(op="set", path=("registration_workflows", "overwrite_transform", "run"), value=True),
+                RuleOperation(op="delete", path=("registration_workflows", "overwrite_transform", "using")),
+            ),
+            reference="overwrite transform",
+        )
+    ]
+
+
+def test_default_rules_match_existing_combinations() -> None:
+    combis = list(cli.iter_pipeline_combis_no_duplicates())
+    dead = {rule.name for rule in DEFAULT_RULE_TABLE.dead_rules(combis)}
+
+    assert dead == {rule.name for rule in DEFAULT_RULE_TABLE.rules if not rule.matchers}
+    for rule in DEFAULT_RULE_TABLE.rules:
+        for matcher in rule.matchers:
+            assert matcher.base in cli.PIPELINE_NAMES
+            assert matcher.perturb in cli.PIPELINE_NAMES
+            assert matcher.step in [step.name for step in cli.PIPELINE_STEPS]
@@ -0,0 +1,56 @@
+"""Test gen192.serialization"""
+
+import pathlib as pl
+
+import pytest
+import yaml
+
+from gen192 import serialization
+from gen192.overlay import ConfigOverlay
+
+
+@pytest.fixture
+def config() -> dict:
+    return {
+        "pipeline_setup": {"pipeline_name": "test", "output_directory": {"path": "/outputs"}},
+        "values": [None, True, 1, 1.5, 1e-07, "", "yes", "123", "a: b", "ünï", "multi\nline", "long " * 40],
+        "nested": {"list": [{"a": 1}, [1, 2], []], "empty": {}},
+    }
+
+
+class TestYamlSerializer:
+    def test_matches_pure_python_yaml(self, config: dict) -> None:
+        assert serialization.get_serializer("yaml").dumps(config) == yaml.dump(config)
+
+    def test_roundtrip(self, config: dict) -> None:
+        serializer = serialization.get_serializer("yaml")
+        assert serializer.loads(serializer.dumps(config)) == config
+
+    def test_overlay(self, config: dict) -> None:
+        serializer = serialization.get_serializer("yaml")
+        assert serializer.dumps(ConfigOverlay(config)) == serializer.dumps(config)
+
+
+class TestJsonSerializer:
+    def test_roundtrip(self, config: dict) -> None:
+        serializer = serialization.get_serializer("json")
+        assert serializer.loads(serializer.dumps(config)) == config
+
+
+class TestSerializerLookup:
+    def test_unknown_format(self) -> None:
+        with pytest.raises(ValueError, match="Unknown config format"):
+            serialization.get_serializer("toml")
+
+    @pytest.mark.parametrize(
+        "file, expected",
+        [("a.yml", "yaml"), ("a.yaml", "yaml"), ("a.json", "json"), ("a", "yaml")],
+    )
+    def test_serializer_for_file(self, file: str, expected: str) -> None:
+        assert serialization.serializer_for_file(pl.Path(file)).name == expected
+
+    def test_register_serializer(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(serialization, "SERIALIZERS", dict(serialization.SERIALIZERS))
+        custom = serialization.Serializer(name="repr", suffix=".txt", dumps=repr, loads=eval)
+        serialization.register_serializer(custom)
+        assert serialization.get_serializer("repr") is custom
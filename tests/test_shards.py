@@ -0,0 +1,49 @@
+"""Test gen192.shards"""
+
+import pathlib as pl
+
+import pytest
+
+from gen192.shards import ShardManifest, check_shards_complete, parse_shard
+
+
+def _manifest(shard: int, count: int, pipelines: dict[str, int], total: int = 4) -> ShardManifest:
+    return ShardManifest(
+        shard=shard, count=count, total=total, cpac_sha="abc", output_format="yaml", pipelines=pipelines
+    )
+
+
+@pytest.mark.parametrize("value,expected", [("1/1", (1, 1)), ("3/4", (3, 4))])
+def test_parse_shard(value: str, expected: tuple[int, int]) -> None:
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize("value", ["0/4", "5/4", "1/0", "1", "a/b", "1/2/3"])
+def test_parse_invalid_shard(value: str) -> None:
+    with pytest.raises(ValueError, match="Invalid shard"):
+        parse_shard(value)
+
+
+def test_save_load(tmp_path: pl.Path) -> None:
+    manifest = _manifest(1, 2, {"p000.yml": 0, "p002.yml": 2})
+    manifest.folders = {"gen192_nofork": ["p000.yml", "p002.yml"]}
+    manifest.save(tmp_path)
+
+    assert ShardManifest.load(tmp_path) == manifest
+
+
+class TestCheckShardsComplete:
+    def test_complete(self) -> None:
+        check_shards_complete([_manifest(2, 2, {"b": 1, "d": 3}), _manifest(1, 2, {"a": 0, "c": 2})])
+
+    def test_duplicate_shard(self) -> None:
+        with pytest.raises(ValueError, match="once each"):
+            check_shards_complete([_manifest(1, 2, {"a": 0, "c": 2}), _manifest(1, 2, {"a": 0, "c": 2})])
+
+    def test_different_settings(self) -> None:
+        with pytest.raises(ValueError, match="different settings"):
+            check_shards_complete([_manifest(1, 2, {"a": 0}), _manifest(2, 2, {"b": 1}, total=2)])
+
+    def test_missing_pipelines(self) -> None:
+        with pytest.raises(ValueError, match="exactly once"):
+            check_shards_complete([_manifest(1, 2, {"a": 0}), _manifest(2, 2, {"b": 1, "d": 3})])
@@ -0,0 +1,93 @@
+"""Test gen192.snippets"""
+
+import pytest
+
+import gen192.cli as cli
+from gen192 import validation
+from gen192.rules import DEFAULT_RULE_TABLE
+from gen192.snippets import SnippetIndex
+from gen192.structdiff import subtree_hash
+from gen192.utils import canonical_json, multi_get
+
+
+@pytest.fixture
+def snippets(synthetic_configs: cli.ConfigLookupTable) -> SnippetIndex:
+    return SnippetIndex(synthetic_configs, cli.PIPELINE_STEPS)
+
+
+def _generated_config(combi: cli.PipelineCombination, configs: cli.ConfigLookupTable) -> str:
+    pipeline = cli.generate_pipeline_from_combi(0, combi, configs)
+    DEFAULT_RULE_TABLE.apply(pipeline.config, combi)
+    pipeline.set_name("pipeline")
+    return canonical_json(pipeline.config)
+
+
+def test_index(synthetic_configs: cli.ConfigLookupTable, snippets: SnippetIndex) -> None:
+    for name, pipeline in synthetic_configs.items():
+        for step in cli.PIPELINE_STEPS:
+            for merge_path in step.merge_paths:
+                snippet = snippets.get(name, merge_path)
+                value = multi_get(pipeline.config, index=merge_path)
+                assert snippet.value == value
+                if value is None:
+                    assert snippet.hash is None
+                else:
+                    assert snippet.hash == subtree_hash(value)
+                    assert snippet.size == len(canonical_json(value))
+
+
+def test_noop_perturbations_generate_their_base(
+    synthetic_configs: cli.ConfigLookupTable, snippets: SnippetIndex
+) -> None:
+    combis = list(cli.iter_pipeline_combis_no_duplicates())
+    noops = [combi for combi in combis if snippets.is_noop(combi)]
+    assert 0 < len(noops) < len(combis)
+
+    for combi in noops:
+        base = synthetic_configs[combi.pipeline_id].config
+        for merge_path in combi.step.merge_paths:
+            generated = cli.generate_pipeline_from_combi(0, combi, synthetic_configs).config
+            assert multi_get(generated, index=merge_path) == multi_get(base, index=merge_path)
+
+
+def test_equivalent_combinations_generate_identical_configs(
+    synthetic_configs: cli.ConfigLookupTable, snippets: SnippetIndex
+) -> None:
+    space = cli.pipeline_combination_space(connectivity=True)
+    classes = snippets.equivalence_classes(space.numbered(), DEFAULT_RULE_TABLE)
+    assert len(classes) < len(space)
+
+    for pipeline_nums in classes:
+        generated = {_generated_config(space[num], synthetic_configs) for num in pipeline_nums}
+        assert len(generated) == 1
+
+
+def test_distinct_keys_generate_distinct_configs(
+    synthetic_configs: cli.ConfigLookupTable, snippets: SnippetIndex
+) -> None:
+    space = cli.pipeline_combination_space(connectivity=True, nuisance=True)
+    classes = snippets.equivalence_classes(space.numbered(), DEFAULT_RULE_TABLE)
+
+    # Keys are per base pipeline (different bases may generate identical configs by chance)
+    for pipeline_id in cli.PIPELINE_NAMES:
+        first_nums = [
+            pipeline_nums[0] for pipeline_nums in classes if space[pipeline_nums[0]].pipeline_id == pipeline_id
+        ]
+        generated = {_generated_config(space[num], synthetic_configs) for num in first_nums}
+        assert len(generated) == len(first_nums) > 1
+
+
+def test_validator_key(
+    monkeypatch: pytest.MonkeyPatch, synthetic_configs: cli.ConfigLookupTable, snippets: SnippetIndex
+) -> None:
+    monkeypatch.setattr(validation, "check_cpac_config", lambda config: (True, None))
+    validator = validation.ConfigValidator()
+    space = cli.pipeline_combination_space()
+    classes = snippets.equivalence_classes(space.numbered(), DEFAULT_RULE_TABLE)
+
+    for combi in space:
+        pipeline = cli.generate_pipeline_from_combi(0, combi, synthetic_configs, snippets)
+        validator.validate(pipeline.config, key=snippets.equivalence_key(combi, DEFAULT_RULE_TABLE))
+
+    assert validator.stats.misses == len(classes)
+    assert validator.stats.hits == len(space) - len(classes)
@@ -0,0 +1,109 @@
+"""Test gen192.structdiff"""
+
+import copy
+import random
+from typing import Any
+
+import pytest
+
+import gen192.cli as cli
+from gen192.overlay import ConfigOverlay
+from gen192.structdiff import MISSING, Change, SubtreeHashes, diff, format_changes, subtree_hash
+from gen192.utils import canonical_json
+
+
+@pytest.fixture
+def config() -> dict:
+    return {"a": {"b": [1, 2], "c": {"d": True, "e": None}}, "f": "x"}
+
+
+class TestSubtreeHashes:
+    def test_independent_of_key_order(self, config: dict) -> None:
+        reordered = {"f": "x", "a": {"c": {"e": None, "d": True}, "b": [1, 2]}}
+        assert subtree_hash(reordered) == subtree_hash(config)
+        assert subtree_hash(ConfigOverlay(config)) == subtree_hash(config)
+
+    @pytest.mark.parametrize("other", [1.0, True, "1", [1], None])
+    def test_distinguishes_like_canonical_json(self, other: Any) -> None:  # noqa: ANN401
+        assert subtree_hash({"a": 1}) != subtree_hash({"a": other})
+
+    def test_equal_hash_iff_equal_json(self) -> None:
+        rng = random.Random(0)
+        values = [{"a": rng.choice([1, "1", None, [1], {"b": 1}]), "c": rng.choice([0, 1])} for _ in range(50)]
+        for first in values:
+            for second in values:
+                equal_json = canonical_json(first) == canonical_json(second)
+                assert (subtree_hash(first) == subtree_hash(second)) == equal_json
+
+    def test_subtrees_are_cached(self, config: dict) -> None:
+        hashes = SubtreeHashes(config)
+        root = hashes.hash()
+
+        config["a"]["c"]["d"] = False  # not seen, the hashes are cached
+        assert hashes.hash(["a", "c"]) == subtree_hash({"d": True, "e": None})
+        assert hashes.hash() == root
+
+    def test_missing_path(self, config: dict) -> None:
+        hashes = SubtreeHashes(config)
+        assert hashes.hash(["a", "x"]) is None
+        assert hashes.get(["f", "x"]) is MISSING
+
+
+class TestDiff:
+    def test_identical(self, config: dict) -> None:
+        assert diff(config, copy.deepcopy(config)) == []
+
+    def test_changes(self, config: dict) -> None:
+        new = copy.deepcopy(config)
+        new["a"]["b"].append(3)
+        del new["a"]["c"]["e"]
+        new["a"]["c"]["g"] = {"h": 1}
+        new["f"] = {"nested": True}
+
+        assert diff(config, new) == [
+            Change(("a", "b"), old=[1, 2], new=[1, 2, 3]),
+            Change(("a", "c", "e"), old=None),
+            Change(("a", "c", "g"), new={"h": 1}),
+            Change(("f",), old="x", new={"nested": True}),
+        ]
+
+    def test_below_path(self, config: dict) -> None:
+        new = copy.deepcopy(config)
+        new["a"]["c"]["d"] = False
+        new["f"] = "y"
+
+        changes = diff(SubtreeHashes(config), SubtreeHashes(new), path=["a"])
+        assert changes == [Change(("a", "c", "d"), old=True, new=False)]
+        assert diff(config, new, path=["x"]) == []
+        assert diff(config, {}, path=["a", "c"]) == [Change(("a", "c"), old={"d": True, "e": None})]
+
+    def test_format(self) -> None:
+        changes = [
+            Change(("a", "b"), old=[1], new=[2]),
+            Change(("a", "c"), new={"d": 1}),
+            Change(("e",), old="x"),
+            Change(("f",), old="long" * 50, new=1),
+        ]
+        assert format_changes(changes, limit=3).splitlines() == [
+            "~ a.b: [1] -> [2]",
+            '+ a.c: {"d":1}',
+            "- e",
+            "... and 1 more changes",
+        ]
+        assert len(changes[-1].format(max_value_length=20)) < 40
+
+
+def test_generated_notes_list_merged_changes(synthetic_configs: cli.ConfigLookupTable) -> None:
+    combi = next(
+        combi
+        for combi in cli.iter_pipeline_combis_no_duplicates()
+        if combi.step.name == "Structural Masking" and combi.pipeline_perturb_id == "CCS"
+    )
+    base = synthetic_configs[combi.pipeline_id].config["anatomical_preproc"]
+    perturb = synthetic_configs[combi.pipeline_perturb_id].config["anatomical_preproc"]
+
+    pipeline = cli.generate_pipeline_from_combi(0, combi, synthetic_configs)
+
+    assert pipeline.notes is not None
+    for change in diff(base, perturb):
+        assert Change(("anatomical_preproc",) + change.path, change.old, change.new).format() in pipeline.notes
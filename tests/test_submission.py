@@ -0,0 +1,164 @@
+"""Test gen192.submission"""
+
+import asyncio
+import pathlib as pl
+import sys
+from collections.abc import Iterator
+
+import pytest
+
+import gen192.cli as cli
+from gen192.submission import (
+    BackgroundSubmitter,
+    LocalExecutor,
+    SlurmExecutor,
+    SubmissionJournal,
+    submit_pipelines,
+)
+
+
+class FakeExecutor:
+    """Records submissions, failing the first `failures[name]` attempts of a pipeline"""
+
+    def __init__(self, failures: dict[str, int] | None = None, delay: float = 0.01) -> None:
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.submitted: list[str] = []
+        self.running = 0
+        self.peak = 0
+
+    async def submit(self, name: str, config_file: pl.Path) -> str:
+        assert config_file.exists()
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures.get(name, 0) > 0:
+                self.failures[name] -= 1
+                raise RuntimeError("queue full")
+            self.submitted.append(name)
+            return f"job-{len(self.submitted)}"
+        finally:
+            self.running -= 1
+
+
+@pytest.fixture
+def pipelines(synthetic_configs: cli.ConfigLookupTable, tmp_path: pl.Path) -> Iterator[cli.PipelineConfig]:
+    return cli.generate(synthetic_configs, space=cli.pipeline_combination_space()[:10], directory=tmp_path)
+
+
+def test_submits_all_with_bounded_concurrency(pipelines: Iterator[cli.PipelineConfig], tmp_path: pl.Path) -> None:
+    executor = FakeExecutor()
+    results = asyncio.run(submit_pipelines(pipelines, executor, concurrency=3))
+
+    assert sorted(executor.submitted) == sorted(file.stem for file in tmp_path.glob("*.yml"))
+    assert len(executor.submitted) == 10
+    assert 1 < executor.peak <= 3
+    assert {result.status for result in results} == {"submitted"}
+
+
+def test_generation_overlaps_submission(pipelines: Iterator[cli.PipelineConfig]) -> None:
+    executor = FakeExecutor(delay=0.05)
+    submitted_before: list[int] = []
+
+    def produced() -> Iterator[cli.PipelineConfig]:
+        for pipeline in pipelines:
+            submitted_before.append(len(executor.submitted))
+            yield pipeline
+
+    asyncio.run(submit_pipelines(produced(), executor, concurrency=2))
+
+    # The second pipeline is generated while the first one is being submitted
+    assert submitted_before[:2] == [0, 0]
+
+
+def test_retries_and_journal(pipelines: Iterator[cli.PipelineConfig], tmp_path: pl.Path) -> None:
+    generated = list(pipelines)
+    names = [pipeline.name for pipeline in generated]
+    executor = FakeExecutor(failures={names[0]: 1, names[1]: 5})
+    journal = SubmissionJournal(tmp_path / "journal.jsonl")
+
+    results = {
+        result.pipeline: result
+        for result in asyncio.run(submit_pipelines(generated, executor, retries=2, retry_delay=0, journal=journal))
+    }
+
+    assert (results[names[0]].status, results[names[0]].attempts) == ("submitted", 2)
+    assert (results[names[1]].status, results[names[1]].attempts) == ("failed", 3)
+    assert "queue full" in str(results[names[1]].error)
+    assert set(journal.submitted()) == set(names) - {names[1]}
+
+    # A resumed run only submits the pipeline that failed
+    executor = FakeExecutor()
+    results = {
+        result.pipeline: result
+        for result in asyncio.run(submit_pipelines(generated, executor, retry_delay=0, journal=journal))
+    }
+    assert executor.submitted == [names[1]]
+    assert {result.status for name, result in results.items() if name != names[1]} == {"skipped"}
+    assert set(journal.submitted()) == set(names)
+
+
+def test_stale_config_files_are_rewritten(pipelines: Iterator[cli.PipelineConfig], tmp_path: pl.Path) -> None:
+    generated = list(pipelines)
+    stale, current = generated[0].file, generated[1].file
+    stale.write_text("pipeline_setup: {}\n")
+    generated[1].dump()
+    mtime = current.stat().st_mtime_ns
+
+    asyncio.run(submit_pipelines(generated[:2], FakeExecutor()))
+
+    assert stale.read_text() == generated[0].render().content
+    assert current.stat().st_mtime_ns == mtime
+
+
+def test_local_executor(tmp_path: pl.Path) -> None:
+    config_file = tmp_path / "pipeline.yml"
+    config_file.write_text("pipeline_setup: {}\n")
+    executor = LocalExecutor(
+        f'{sys.executable} -c \'import sys; open(sys.argv[1] + "." + sys.argv[2], "w")\' {{config}} {{name}}'
+    )
+
+    assert asyncio.run(executor.submit("p 000", config_file)).startswith("local-")
+    assert (tmp_path / "pipeline.yml.p 000").exists()
+
+    with pytest.raises(RuntimeError, match="exited with 3"):
+        asyncio.run(LocalExecutor(f"{sys.executable} -c 'exit(3)'").submit("p000", config_file))
+
+
+def test_slurm_executor(tmp_path: pl.Path) -> None:
+    sbatch = tmp_path / "sbatch"
+    sbatch.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "print('1234;cluster')\n"
+        "open(sys.argv[-1] + '.args', 'w').write(' '.join(sys.argv[1:]))\n"
+    )
+    sbatch.chmod(0o755)
+    config_file = tmp_path / "pipeline.yml"
+    executor = SlurmExecutor(pl.Path("run_cpac.sh"), options=["--time=1:00:00"], sbatch=str(sbatch))
+
+    assert asyncio.run(executor.submit("p000", config_file)) == "1234"
+    assert (
+        pl.Path(f"{config_file}.args").read_text()
+        == f"--parsable --job-name=p000 --time=1:00:00 run_cpac.sh {config_file}"
+    )
+
+
+def test_background_submitter_with_main(offline_cpac: dict[str, dict]) -> None:
+    executor = FakeExecutor(delay=0)
+    with BackgroundSubmitter(executor, concurrency=2, journal=SubmissionJournal(pl.Path("journal.jsonl"))) as submitter:
+        cli.main(submit=submitter.put)
+
+    generated = sorted(file.stem for file in pl.Path("build/gen192_nofork").glob("*.yml"))
+    assert sorted(executor.submitted) == generated
+    assert submitter.summary() == f"{len(generated)} submitted, 0 skipped, 0 failed"
+
+
+def test_background_submitter_failure(tmp_path: pl.Path) -> None:
+    journal = SubmissionJournal(tmp_path)  # Not a file
+
+    with pytest.raises(RuntimeError, match="submission failed"):
+        with BackgroundSubmitter(FakeExecutor(), concurrency=1, journal=journal) as submitter:
+            for num in range(5):
+                submitter.put(tmp_path / f"p{num:03d}.yml")
@@ -0,0 +1,63 @@
+"""Test gen192.validation"""
+
+import copy
+
+import pytest
+
+from gen192 import validation
+from gen192.overlay import ConfigOverlay
+
+
+@pytest.fixture
+def checked(monkeypatch: pytest.MonkeyPatch) -> list[dict]:
+    """Records configs checked by a fake C-PAC validation (configs with "invalid" set are invalid)"""
+    configs: list[dict] = []
+
+    def fake_check(config: dict) -> validation.ValidationResult:
+        configs.append(config)
+        if config.get("invalid"):
+            return False, ValueError("invalid config")
+        return True, None
+
+    monkeypatch.setattr(validation, "check_cpac_config", fake_check)
+    return configs
+
+
+def _config(name: str, **kwargs: object) -> dict:
+    return {"pipeline_setup": {"pipeline_name": name, "system_config": {"max_cores": 1}}, **kwargs}
+
+
+class TestConfigValidator:
+    def test_memoizes_identical_configs(self, checked: list[dict]) -> None:
+        validator = validation.ConfigValidator()
+
+        assert validator.validate(_config("a")) == (True, None)
+        assert validator.validate(_config("b")) == (True, None)
+        assert validator.validate(ConfigOverlay(_config("c"))) == (True, None)
+
+        assert len(checked) == 1
+        assert validator.stats.hits == 2
+        assert validator.stats.misses == 1
+        assert validator.stats.hit_rate == pytest.approx(2 / 3)
+        assert "2 cache hits" in str(validator.stats)
+
+    def test_memoizes_errors(self, checked: list[dict]) -> None:
+        validator = validation.ConfigValidator()
+
+        ok, err = validator.validate(_config("a", invalid=True))
+        assert not ok
+        assert isinstance(err, ValueError)
+        assert validator.validate(_config("b", invalid=True)) == (ok, err)
+        assert len(checked) == 1
+
+    def test_different_configs_are_checked(self, checked: list[dict]) -> None:
+        validator = validation.ConfigValidator()
+        config = _config("a")
+        other = copy.deepcopy(config)
+        other["pipeline_setup"]["system_config"]["max_cores"] = 2
+
+        validator.validate(config)
+        validator.validate(other)
+
+        assert len(checked) == 2
+        assert validator.stats.hits == 0